@@ -2,12 +2,11 @@ from django.conf import settings
 from django.urls import re_path
 from rest_framework.routers import DefaultRouter, SimpleRouter
 
-from rest_framework_swagger.views import get_swagger_view
-
 from newzila.users.api.views import UserViewSet
 from newzila.newsletter.api.views import NewsletterViewSet
+from newzila.utils.schema import get_cached_swagger_view
 
-schema_view = get_swagger_view(title='Newzila API')
+schema_view = get_cached_swagger_view(title='Newzila API')
 
 if settings.DEBUG:
     router = DefaultRouter()
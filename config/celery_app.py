@@ -1,5 +1,10 @@
 import os
+import time
+
 from celery import Celery
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_process_shutdown
+
+from newzila.utils.metrics import CELERY_TASK_QUEUE_WAIT, CELERY_TASK_RUNTIME, registry
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.local")
@@ -14,3 +19,37 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
+
+
+# Metrics
+# ------------------------------------------------------------------------------
+_task_starts = {}
+
+
+@before_task_publish.connect
+def record_publish_time(headers=None, **kwargs):
+    # message headers show up on `task.request` in the worker
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+@task_prerun.connect
+def record_task_start(task_id=None, task=None, **kwargs):
+    published_at = task.request.get("published_at")
+    if published_at and not task.request.eta:  # the wait of delayed tasks is mostly the delay
+        CELERY_TASK_QUEUE_WAIT.observe(max(0, time.time() - published_at), task=task.name)
+    _task_starts[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def record_task_runtime(task_id=None, task=None, state=None, **kwargs):
+    start = _task_starts.pop(task_id, None)
+    if start is not None:
+        CELERY_TASK_RUNTIME.observe(time.perf_counter() - start, task=task.name, state=state)
+    registry.maybe_flush()
+
+
+@worker_process_shutdown.connect
+def retire_metrics(**kwargs):
+    # pool processes exit without running atexit handlers
+    registry.retire()
@@ -124,6 +124,7 @@ AUTH_PASSWORD_VALIDATORS = [
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#middleware
 MIDDLEWARE = [
+    "newzila.utils.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -135,6 +136,9 @@ MIDDLEWARE = [
     "django.middleware.common.BrokenLinkEmailsMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
+# Query count, DB time and duplicate queries of every request in Server-Timing headers and logs
+if env.bool("DJANGO_QUERY_INSTRUMENTATION", default=False):
+    MIDDLEWARE.insert(0, "newzila.utils.middleware.QueryInstrumentationMiddleware")
 
 # STATIC
 # ------------------------------------------------------------------------------
@@ -219,6 +223,13 @@ EMAIL_BACKEND = env(
 )
 # https://docs.djangoproject.com/en/2.2/ref/settings/#email-timeout
 EMAIL_TIMEOUT = 5
+# newzila.newsletter.backends.PooledSMTPEmailBackend: open SMTP connections kept per process,
+# messages sent over one connection before it's replaced, idle seconds before it's dropped,
+# and seconds to wait for a free connection when all of them are busy
+EMAIL_POOL_SIZE = env.int("EMAIL_POOL_SIZE", default=4)
+EMAIL_POOL_MAX_MESSAGES = env.int("EMAIL_POOL_MAX_MESSAGES", default=500)
+EMAIL_POOL_IDLE_TIMEOUT = env.int("EMAIL_POOL_IDLE_TIMEOUT", default=30)
+EMAIL_POOL_WAIT_TIMEOUT = env.int("EMAIL_POOL_WAIT_TIMEOUT", default=EMAIL_TIMEOUT)
 
 # ADMIN
 # ------------------------------------------------------------------------------
@@ -276,6 +287,22 @@ CELERY_TASK_TIME_LIMIT = 5 * 60
 CELERY_TASK_SOFT_TIME_LIMIT = 60
 # http://docs.celeryproject.org/en/latest/userguide/configuration.html#beat-scheduler
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+# http://docs.celeryproject.org/en/latest/userguide/configuration.html#beat-schedule
+# (installed into the database by the scheduler on start)
+CELERY_BEAT_SCHEDULE = {
+    "newsletter-drain-email-outbox": {
+        "task": "newzila.newsletter.tasks.drain_email_outbox",
+        "schedule": env.int("NEWSLETTER_OUTBOX_DRAIN_INTERVAL", default=30),
+    },
+    "newsletter-remind-pending-subscriptions": {
+        "task": "newzila.newsletter.tasks.remind_pending_subscriptions",
+        "schedule": env.int("NEWSLETTER_PENDING_REMINDER_INTERVAL", default=60 * 60),
+    },
+    "newsletter-purge-pending-subscriptions": {
+        "task": "newzila.newsletter.tasks.purge_pending_subscriptions",
+        "schedule": env.int("NEWSLETTER_PENDING_PURGE_INTERVAL", default=24 * 60 * 60),
+    },
+}
 # django-allauth
 # ------------------------------------------------------------------------------
 ACCOUNT_ALLOW_REGISTRATION = env.bool("DJANGO_ACCOUNT_ALLOW_REGISTRATION", True)
@@ -300,6 +327,69 @@ REST_FRAMEWORK = {
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
+    # token buckets per client IP and per subscriber, see newzila.newsletter.api.throttling
+    "DEFAULT_THROTTLE_RATES": {
+        "newsletter_subscribe": env("NEWSLETTER_SUBSCRIBE_THROTTLE_RATE", default="30/min"),
+        "newsletter_unsubscribe": env("NEWSLETTER_UNSUBSCRIBE_THROTTLE_RATE", default="30/min"),
+    },
 }
 # Your stuff...
 # ------------------------------------------------------------------------------
+# newsletter
+# Upper bound of subscribers accepted by a single bulk subscribe request
+NEWSLETTER_BULK_SUBSCRIBE_MAX_ITEMS = env.int("NEWSLETTER_BULK_SUBSCRIBE_MAX_ITEMS", default=10000)
+# Rows per existence query / bulk insert
+NEWSLETTER_BULK_CHUNK_SIZE = env.int("NEWSLETTER_BULK_CHUNK_SIZE", default=500)
+# Verification emails sent per task (and per SMTP connection), and emails claimed per outbox batch
+NEWSLETTER_EMAIL_BATCH_SIZE = env.int("NEWSLETTER_EMAIL_BATCH_SIZE", default=100)
+# Outbox emails are retried with a doubling delay (seconds) and marked failed after the last attempt
+NEWSLETTER_OUTBOX_RETRY_DELAY = env.int("NEWSLETTER_OUTBOX_RETRY_DELAY", default=60)
+NEWSLETTER_OUTBOX_MAX_ATTEMPTS = env.int("NEWSLETTER_OUTBOX_MAX_ATTEMPTS", default=5)
+# A drainer stops claiming batches after this many seconds, stay below CELERY_TASK_SOFT_TIME_LIMIT
+NEWSLETTER_OUTBOX_DRAIN_SECONDS = env.int("NEWSLETTER_OUTBOX_DRAIN_SECONDS", default=30)
+# Lifetime of signed verification links, counted from the subscription date
+NEWSLETTER_VERIFICATION_TOKEN_MAX_AGE = env.int(
+    "NEWSLETTER_VERIFICATION_TOKEN_MAX_AGE", default=30 * 24 * 60 * 60
+)
+# Pending subscriptions get one reminder this many seconds after subscribing, and are deleted after
+# NEWSLETTER_PENDING_PURGE_AFTER seconds, by default once their verification link has expired
+NEWSLETTER_PENDING_REMINDER_AFTER = env.int("NEWSLETTER_PENDING_REMINDER_AFTER", default=24 * 60 * 60)
+NEWSLETTER_PENDING_PURGE_AFTER = env.int(
+    "NEWSLETTER_PENDING_PURGE_AFTER", default=NEWSLETTER_VERIFICATION_TOKEN_MAX_AGE
+)
+# Pending subscriptions reminded or deleted per transaction
+NEWSLETTER_PENDING_BATCH_SIZE = env.int("NEWSLETTER_PENDING_BATCH_SIZE", default=1000)
+# Lifetime of signed unsubscribe links, counted from when the link is generated
+NEWSLETTER_UNSUBSCRIBE_TOKEN_MAX_AGE = env.int(
+    "NEWSLETTER_UNSUBSCRIBE_TOKEN_MAX_AGE", default=365 * 24 * 60 * 60
+)
+# Newsletters resolved by slug are cached for NEWSLETTER_CACHE_TIMEOUT in the default cache and
+# for NEWSLETTER_LOCAL_CACHE_TIMEOUT in a per-process LRU, which saves the cache round trip too
+NEWSLETTER_CACHE_TIMEOUT = env.int("NEWSLETTER_CACHE_TIMEOUT", default=60 * 60)
+NEWSLETTER_LOCAL_CACHE_TIMEOUT = env.int("NEWSLETTER_LOCAL_CACHE_TIMEOUT", default=60)
+NEWSLETTER_LOCAL_CACHE_SIZE = env.int("NEWSLETTER_LOCAL_CACHE_SIZE", default=256)
+# Recipients per issue sending task (and per SMTP connection)
+NEWSLETTER_ISSUE_CHUNK_SIZE = env.int("NEWSLETTER_ISSUE_CHUNK_SIZE", default=200)
+# Issue chunks claimed longer ago than this (seconds) are considered interrupted when resuming
+NEWSLETTER_ISSUE_CHUNK_STALE_AFTER = env.int("NEWSLETTER_ISSUE_CHUNK_STALE_AFTER", default=15 * 60)
+# Bloom filters of the subscribers of each newsletter skip existence queries for new emails,
+# sized per newsletter for CAPACITY subscribers at ERROR_RATE false positives; build them with
+# the rebuild_subscriber_filters command, changing the size requires a rebuild
+NEWSLETTER_SUBSCRIBER_FILTER = env.bool("NEWSLETTER_SUBSCRIBER_FILTER", default=True)
+NEWSLETTER_SUBSCRIBER_FILTER_CAPACITY = env.int("NEWSLETTER_SUBSCRIBER_FILTER_CAPACITY", default=100000)
+NEWSLETTER_SUBSCRIBER_FILTER_ERROR_RATE = env.float("NEWSLETTER_SUBSCRIBER_FILTER_ERROR_RATE", default=0.01)
+# Newsletters (most active subscribers first) whose data and templates server workers load on start
+NEWSLETTER_WARM_UP_NEWSLETTERS = env.int("NEWSLETTER_WARM_UP_NEWSLETTERS", default=20)
+# Default and maximum page size of the subscriber listing API
+NEWSLETTER_SUBSCRIPTIONS_PAGE_SIZE = env.int("NEWSLETTER_SUBSCRIPTIONS_PAGE_SIZE", default=100)
+NEWSLETTER_SUBSCRIPTIONS_MAX_PAGE_SIZE = env.int("NEWSLETTER_SUBSCRIPTIONS_MAX_PAGE_SIZE", default=1000)
+# Rows read from the database and encoded at once by the streaming subscriber export
+NEWSLETTER_EXPORT_CHUNK_SIZE = env.int("NEWSLETTER_EXPORT_CHUNK_SIZE", default=2000)
+# metrics
+# Directory shared by all processes (gunicorn and Celery workers) to report metrics of, see
+# newzila.utils.metrics; unset, /metrics only reports the process serving the request. Production sets it.
+METRICS_MULTIPROCESS_DIR = env("METRICS_MULTIPROCESS_DIR", default=None)
+# Seconds between writes of the metrics of a process to METRICS_MULTIPROCESS_DIR
+METRICS_FLUSH_INTERVAL = env.int("METRICS_FLUSH_INTERVAL", default=5)
+# Bearer token required to read /metrics, if set
+METRICS_TOKEN = env("METRICS_TOKEN", default=None)
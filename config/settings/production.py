@@ -151,3 +151,8 @@ LOGGING = {
 
 # Your stuff...
 # ------------------------------------------------------------------------------
+# /metrics reports request paths, task names and volumes: not public, see newzila.utils.metrics
+METRICS_TOKEN = env("METRICS_TOKEN")
+# gunicorn runs several workers, and Celery workers record task metrics: both write their snapshots to
+# this directory, a volume mounted into the django and celeryworker containers (see production.yml)
+METRICS_MULTIPROCESS_DIR = env("METRICS_MULTIPROCESS_DIR", default="/var/lib/newzila/metrics")
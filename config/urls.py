@@ -6,6 +6,8 @@ from django.views.generic import TemplateView
 from django.views import defaults as default_views
 from rest_framework.authtoken.views import obtain_auth_token
 
+from newzila.utils.metrics import metrics_view
+
 urlpatterns = [
     path("", TemplateView.as_view(template_name="pages/home.html"), name="home"),
     path(
@@ -25,6 +27,8 @@ urlpatterns += [
     # DRF auth token
     path("auth-token/", obtain_auth_token),
 ]
+# Prometheus metrics
+urlpatterns += [path("metrics", metrics_view, name="metrics")]
 
 if settings.DEBUG:
     # This allows the error pages to be debugged during development, just visit
@@ -0,0 +1,51 @@
+"""
+Gunicorn settings of the production server, see compose/production/django/start.
+
+The application is loaded once in the master and forked, so workers start with Django imported and
+warmed up instead of paying for it on their first requests; each worker then warms up what needs
+the database. Preloading means code changes need a restart, HUP only reloads the workers.
+"""
+import os
+
+bind = "0.0.0.0:5000"
+chdir = "/app"
+# threaded workers: a request waiting on the database or cache holds a thread, not a whole worker process
+worker_class = "gthread"
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+# recycle workers now and then, staggered so they don't all start cold at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+preload_app = True
+
+
+def _newsletter_config():
+    from django.apps import apps
+
+    return apps.get_app_config("newsletter")
+
+
+def on_starting(server):
+    """In the master, once: start the metrics of this deployment from an empty directory"""
+    from newzila.utils.metrics import registry
+
+    registry.clear_directory()
+
+
+def when_ready(server):
+    """In the master, after preloading: everything that needs no database, inherited by every fork"""
+    from django.db import connections
+
+    _newsletter_config().warm_up(database=False)
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    """
+    In every worker, before it accepts connections. Best effort: gunicorn halts the whole server when
+    a worker fails to boot, a worker with cold caches is better than none.
+    """
+    try:
+        _newsletter_config().warm_up()
+    except Exception:
+        worker.log.warning("Warm-up failed, starting cold", exc_info=True)
@@ -0,0 +1,17 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class SubscriptionCursorPagination(CursorPagination):
+    """
+    Pages through subscriptions in subscription order. The cursor keeps the position, so every page
+    costs the same single query however deep it is, unlike OFFSET pagination.
+
+    The cursor only positions on the first ordering field and falls back to an offset among rows sharing
+    its value. Imports give a whole batch the same `create_date`, so it pages on the id instead: unique,
+    and increasing in subscription order.
+    """
+    ordering = ('id',)
+    page_size = settings.NEWSLETTER_SUBSCRIPTIONS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.NEWSLETTER_SUBSCRIPTIONS_MAX_PAGE_SIZE
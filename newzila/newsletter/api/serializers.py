@@ -1,11 +1,21 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from ..models import Newsletter, Subscription
+from rest_framework.exceptions import ValidationError as APIValidationError
+
+from ..bloom import SubscriberFilter
+from ..models import EmailOutbox, Newsletter, Subscription
+from ..tasks import drain_email_outbox
+from ..utils import chunked, normalize_email
 
 
 class NewsletterSerializer(serializers.ModelSerializer):
     class Meta:
         model = Newsletter
-        fields = ["title", "slug", "email", "sender"]  # Don't try to use __all__!
+        fields = [
+            "title", "slug", "email", "sender", "active_count", "pending_count", "unsubscribed_count",
+        ]  # Don't try to use __all__!
+        read_only_fields = ["active_count", "pending_count", "unsubscribed_count"]
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -19,14 +29,148 @@ class SubscriptionSerializer(serializers.ModelSerializer):
             'email_field',
             'name_field',
         ]
+        # set by the view from the resolved newsletter and request.user, saving a lookup query for each
+        read_only_fields = ['newsletter', 'user']
+
+    def validate_email_field(self, value):
+        # the same address as bulk subscribe and import store, so the unique constraint catches repeats
+        return normalize_email(value)
 
     def create(self, validated_data):
         """Put business logic of subscription process to the serializer"""
         subscription = super().create(validated_data)
-        subscription.send_verification_email()
+        # keep SMTP off the request path: the email is queued with the subscription and sent by a worker
+        EmailOutbox.objects.create(subscription=subscription, kind=EmailOutbox.VERIFICATION)
+        transaction.on_commit(drain_email_outbox.delay)
         return subscription
 
 
+class SubscriptionListSerializer(serializers.ModelSerializer):
+    """A subscription as listed to staff; expects subscriptions loaded with `select_related('user')`"""
+    email = serializers.CharField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    state = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Subscription
+        fields = ['id', 'user', 'email', 'name', 'create_date', 'verification_date', 'is_active', 'state']
+        read_only_fields = fields
+
+
 class SubscriptionReadSerializer(SubscriptionSerializer):
     class Meta(SubscriptionSerializer.Meta):
         validators = []
+
+
+class SubscriberSerializer(serializers.Serializer):
+    """A single anonymous subscriber of a bulk subscription"""
+    email_field = serializers.EmailField()
+    name_field = serializers.CharField(max_length=30, required=False, allow_blank=True, allow_null=True)
+
+    def validate_email_field(self, value):
+        return normalize_email(value)
+
+
+class BulkSubscriptionSerializer(serializers.Serializer):
+    """
+    Subscribes a batch of anonymous subscribers to a newsletter.
+
+    Invalid and already subscribed items are reported per item instead of failing the whole batch.
+    Existing subscriptions are looked up with one `IN` query per chunk, for the emails the subscriber
+    filter doesn't rule out (see `bloom.SubscriberFilter`). New ones are inserted with `bulk_create`
+    and their verification emails are queued in the outbox with another one.
+    """
+    CREATED = 'created'
+    ALREADY_SUBSCRIBED = 'already_subscribed'
+    INVALID = 'invalid'
+
+    subscribers = serializers.ListField(
+        allow_empty=False, max_length=settings.NEWSLETTER_BULK_SUBSCRIBE_MAX_ITEMS
+    )
+
+    def validate_subscribers(self, items):
+        """Validate all items with a single child serializer, keeping (data, errors) pairs"""
+        child = SubscriberSerializer()
+        validated = []
+        for item in items:
+            try:
+                validated.append((child.run_validation(item), None))
+            except serializers.ValidationError as exc:
+                validated.append((item, exc.detail))
+        return validated
+
+    def create(self, validated_data):
+        """Returns the outcome of every item, in the order of the request"""
+        newsletter = validated_data['newsletter']
+        subscribers = validated_data['subscribers']
+        results = [None] * len(subscribers)
+
+        pending = {}  # email -> (index, data), first occurrence wins
+        for index, (data, errors) in enumerate(subscribers):
+            if errors:
+                results[index] = {'status': self.INVALID, 'errors': errors}
+            elif data['email_field'] in pending:
+                results[index] = {'email_field': data['email_field'], 'status': self.ALREADY_SUBSCRIBED}
+            else:
+                pending[data['email_field']] = (index, data)
+
+        created_ids = []
+        subscriber_filter = SubscriberFilter(newsletter.pk)
+        for chunk in chunked(pending.items(), settings.NEWSLETTER_BULK_CHUNK_SIZE):
+            existing = set()
+            maybe_existing = subscriber_filter.maybe_contains(email for email, _ in chunk)
+            if maybe_existing:
+                existing = set(Subscription.objects.filter(
+                    newsletter=newsletter, user__isnull=True, email_field__in=maybe_existing
+                ).values_list('email_field', flat=True))
+                subscriber_filter.record_false_positives(len(maybe_existing) - len(existing))
+
+            new_subscriptions = [
+                Subscription(newsletter=newsletter, email_field=email, name_field=data.get('name_field'))
+                for email, (index, data) in chunk if email not in existing
+            ]
+            created = self._insert(new_subscriptions)
+            created_ids.extend(created.values())
+            subscriber_filter.add(created)
+
+            for email, (index, data) in chunk:
+                status = self.CREATED if email in created else self.ALREADY_SUBSCRIBED
+                results[index] = {'email_field': email, 'status': status}
+
+        EmailOutbox.objects.bulk_create([
+            EmailOutbox(subscription_id=pk, kind=EmailOutbox.VERIFICATION) for pk in created_ids
+        ], batch_size=settings.NEWSLETTER_BULK_CHUNK_SIZE)
+        if created_ids:
+            transaction.on_commit(drain_email_outbox.delay)
+        return results
+
+    @staticmethod
+    def _insert(subscriptions):
+        """
+        Insert the subscriptions, returning an email -> pk mapping of the created ones.
+        Falls back to row by row inserts if a concurrent subscribe won the race for some email.
+        """
+        if not subscriptions:
+            return {}
+        try:
+            with transaction.atomic():
+                Subscription.objects.bulk_create(subscriptions)
+                Newsletter.update_subscriber_counts(subscriptions[0].newsletter_id, pending=len(subscriptions))
+        except IntegrityError:
+            created = []
+            for subscription in subscriptions:
+                subscription.pk = None
+                subscription._state.adding = True
+                try:
+                    subscription.save()
+                except APIValidationError:
+                    continue
+                created.append(subscription)
+            subscriptions = created
+
+        if subscriptions and subscriptions[0].pk is None:  # backend can't return ids from bulk inserts
+            return dict(Subscription.objects.filter(
+                newsletter=subscriptions[0].newsletter, user__isnull=True,
+                email_field__in=[subscription.email_field for subscription in subscriptions]
+            ).values_list('email_field', 'pk'))
+        return {subscription.email_field: subscription.pk for subscription in subscriptions}
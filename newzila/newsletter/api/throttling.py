@@ -0,0 +1,137 @@
+import logging
+import time
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from redis.exceptions import RedisError
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from ..utils import normalize_email
+
+logger = logging.getLogger(__name__)
+
+# KEYS: the buckets a request takes a token from, ARGV: capacity, tokens per second, current time.
+# Takes a token from every bucket, or from none when one is empty; returns the seconds to wait then.
+# The time is the caller's: scripts calling TIME can't write on Redis < 5.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local bucket = redis.call('HMGET', key, 'tokens', 'time')
+    local tokens = tonumber(bucket[1]) or capacity
+    local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+    levels[i] = math.min(capacity, tokens + elapsed * rate)
+    if levels[i] < 1 then
+        wait = math.max(wait, (1 - levels[i]) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    redis.call('HMSET', key, 'tokens', levels[i] - 1, 'time', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return '0'
+"""
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket per client IP and per subscriber of a newsletter, for the rate of the `scope` in
+    REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] (e.g. "30/min": bursts of 30, refilled at 30 a minute).
+
+    Buckets live in the default cache. On Redis they are updated atomically by a Lua script, other
+    backends (locmem in development and tests) get a plain read-modify-write. Fails open: with Redis
+    down every request is allowed, the throttle must not take the endpoints down with it.
+    """
+    scope = None
+    DURATIONS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+    _script = None
+
+    def __init__(self):
+        self.capacity, self.per_second = self.parse_rate(self.get_rate())
+        self.wait_seconds = None
+
+    def get_rate(self):
+        try:
+            return api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured("No throttle rate set for scope '%s'" % self.scope)
+
+    def parse_rate(self, rate):
+        if not rate:  # None, or empty from the environment: not throttled
+            return None, None
+        num, period = rate.split('/')
+        return int(num), int(num) / self.DURATIONS[period[0]]
+
+    def get_subscriber(self, request, view):
+        """Who the request (un)subscribes, if known"""
+        if request.user.is_authenticated:
+            return 'user:%s' % request.user.pk
+        return None
+
+    def get_bucket_keys(self, request, view):
+        prefix = 'newsletter:throttle:%s:%s:' % (self.scope, view.kwargs.get(view.lookup_field, ''))
+        keys = [prefix + 'ip:%s' % self.get_ident(request)]
+        subscriber = self.get_subscriber(request, view)
+        if subscriber:
+            keys.append(prefix + subscriber)
+        return keys
+
+    def allow_request(self, request, view):
+        if self.capacity is None:
+            return True
+        keys = self.get_bucket_keys(request, view)
+        try:
+            self.wait_seconds = self.take(keys, time.time())
+        except RedisError:
+            logger.warning("Throttling %s skipped, Redis is unavailable", self.scope, exc_info=True)
+            return True
+        return self.wait_seconds == 0
+
+    def take(self, keys, now):
+        client = getattr(cache, 'client', None)
+        if client is None:
+            return self._take_from_cache(keys, now)
+        redis = client.get_client(write=True)
+        if TokenBucketThrottle._script is None:
+            TokenBucketThrottle._script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        keys = [cache.make_key(key) for key in keys]
+        return float(self._script(keys=keys, args=[self.capacity, self.per_second, now], client=redis))
+
+    def _take_from_cache(self, keys, now):
+        """The Lua script in Python, not atomic"""
+        buckets = cache.get_many(keys)
+        levels = {}
+        for key in keys:
+            tokens, updated = buckets.get(key, (self.capacity, now))
+            levels[key] = min(self.capacity, tokens + max(0, now - updated) * self.per_second)
+        wait = max((1 - tokens) / self.per_second for tokens in levels.values())
+        if wait > 0:
+            return wait
+        timeout = int(self.capacity / self.per_second) + 1
+        cache.set_many({key: (tokens - 1, now) for key, tokens in levels.items()}, timeout)
+        return 0
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class SubscribeThrottle(TokenBucketThrottle):
+    scope = 'newsletter_subscribe'
+
+    def get_subscriber(self, request, view):
+        email = request.data.get('email_field') if hasattr(request.data, 'get') else None
+        if email and not request.user.is_authenticated:
+            return 'email:%s' % normalize_email(str(email)).lower()
+        return super().get_subscriber(request, view)
+
+
+class UnsubscribeThrottle(TokenBucketThrottle):
+    """Anonymous unsubscribes carry a signed token rather than an address, they are throttled by IP"""
+    scope = 'newsletter_unsubscribe'
@@ -1,14 +1,26 @@
+from django.core import signing
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.translation import ugettext_lazy as _
 
 from rest_framework import status
 from rest_framework.mixins import RetrieveModelMixin
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny
+from rest_framework.exceptions import ValidationError as APIValidationError
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
-from .serializers import NewsletterSerializer, SubscriptionSerializer
+from .pagination import SubscriptionCursorPagination
+from .serializers import (
+    BulkSubscriptionSerializer, NewsletterSerializer, SubscriptionListSerializer, SubscriptionSerializer,
+)
+from .throttling import SubscribeThrottle, UnsubscribeThrottle
+from ..cache import get_newsletter
+from ..export import FORMATS, subscriber_rows
+from ..metrics import SUBSCRIPTION_OUTCOMES
 from ..models import Newsletter, Subscription
+from ..utils import normalize_email, read_subscription_token
 
 
 class NewsletterViewSet(RetrieveModelMixin, GenericViewSet):
@@ -16,10 +28,39 @@ class NewsletterViewSet(RetrieveModelMixin, GenericViewSet):
     queryset = Newsletter.objects.all()
     permission_classes = (AllowAny,)
 
-    # more maintainable but enforces a second query to get instance from pk on SubscriptionSerializer
     lookup_field = 'slug'
 
-    @action(detail=True, methods=["POST"])
+    # actions counted in SUBSCRIPTION_OUTCOMES by the status of their response
+    OUTCOME_ACTIONS = {
+        'subscribe': 'subscribe',
+        'verification': 'verify',
+        'unsubscribe': 'unsubscribe',
+        'unsubscribe_token': 'unsubscribe',
+    }
+    OUTCOMES = {200: 'success', 400: 'rejected', 401: 'denied', 403: 'denied', 404: 'not_found', 429: 'throttled'}
+
+    def get_object(self):
+        """
+        Newsletters hardly ever change, resolve them through the cache instead of a query per request.
+        Except to show one: its subscriber counts change all the time and aren't cached.
+        """
+        if self.action == 'retrieve':
+            return super().get_object()
+        try:
+            newsletter = get_newsletter(self.kwargs[self.lookup_field])
+        except Newsletter.DoesNotExist:
+            raise Http404
+        self.check_object_permissions(self.request, newsletter)
+        return newsletter
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        action = self.OUTCOME_ACTIONS.get(self.action)
+        if action is not None:
+            SUBSCRIPTION_OUTCOMES.inc(action=action, outcome=self.OUTCOMES.get(response.status_code, 'error'))
+        return response
+
+    @action(detail=True, methods=["POST"], throttle_classes=(SubscribeThrottle,))
     def subscribe(self, request, *args, **kwargs):
         """
         # Subscribe to a newsletter
@@ -33,45 +74,133 @@ class NewsletterViewSet(RetrieveModelMixin, GenericViewSet):
         2. Authenticated users, require no data to subscribe.
         """
 
-        _data = {}
-        _data.update(request.data)
-        # append last to prevent user overriding
-        _data.update({
-            'newsletter': self.get_object().pk,
-            'user': request.user.pk,
-        })
-
         context = self.get_serializer_context()
-        serializer = SubscriptionSerializer(data=_data, context=context)
+        serializer = SubscriptionSerializer(data=request.data, context=context)
         if serializer.is_valid(raise_exception=True):
-            serializer.save()
+            # passed on save to prevent user overriding; duplicates are rejected by the insert itself
+            serializer.save(
+                newsletter=self.get_object(),
+                user=request.user if request.user.is_authenticated else None,
+            )
         return Response(status=status.HTTP_200_OK)
 
-    @action(detail=True, methods=["GET"], url_path='unsubscribe/(?P<email>[-_a-zA-Z0-9@.+~]+)')
-    def unsubscribe(self, request, email, *args, **kwargs):
-        query_params = {
-            'newsletter': self.get_object(),
+    @action(detail=True, methods=["POST"], url_path='subscribe/bulk', permission_classes=(IsAdminUser,))
+    def subscribe_bulk(self, request, *args, **kwargs):
+        """
+        # Subscribe a batch of anonymous subscribers to a newsletter
+        ## Example of post data:
+        ```json
+        {
+            "subscribers": [
+                {"email_field": "email@example.com", "name_field": "Name"},
+                {"email_field": "other@example.com"}
+            ]
+        }
+        ```
+        The response reports the outcome (`created`, `already_subscribed` or `invalid`) of each item
+        in the order of the request.
+        """
+        context = self.get_serializer_context()
+        serializer = BulkSubscriptionSerializer(data=request.data, context=context)
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save(newsletter=self.get_object())
+
+        counts = {
+            outcome: 0 for outcome in (
+                BulkSubscriptionSerializer.CREATED,
+                BulkSubscriptionSerializer.ALREADY_SUBSCRIBED,
+                BulkSubscriptionSerializer.INVALID,
+            )
         }
-        if request.user.is_authenticated:
-            query_params.update({
-                'user': request.user
-            })
-        else:
-            query_params.update({
-                'email_field': email,
-            })
+        for result in results:
+            counts[result['status']] += 1
+        for outcome, count in counts.items():
+            SUBSCRIPTION_OUTCOMES.inc(count, action='subscribe_bulk', outcome=outcome)
+        return Response(status=status.HTTP_200_OK, data=dict(counts, results=results))
+
+    @action(detail=True, methods=["GET"], permission_classes=(IsAdminUser,))
+    def subscriptions(self, request, *args, **kwargs):
+        """
+        # List the subscribers of a newsletter
+        Cursor paginated in subscription order, `page_size` defaults to 100.
+        ## Filters:
+        1. `is_active`: `true` or `false`
+        2. `verified`: `true` or `false`, whether the subscription has been verified (ever)
+        """
+        subscriptions = self._filter_subscriptions().select_related('user')
+        paginator = SubscriptionCursorPagination()
+        page = paginator.paginate_queryset(subscriptions, request, view=self)
+        return paginator.get_paginated_response(SubscriptionListSerializer(page, many=True).data)
+
+    @action(detail=True, methods=["GET"], permission_classes=(IsAdminUser,))
+    def export(self, request, *args, **kwargs):
+        """
+        # Export the subscribers of a newsletter
+        Streamed in id order, as CSV with a header row, or as one JSON object per line with `?output=ndjson`.
+        Takes the filters of the subscriber listing.
+        """
+        output = request.query_params.get('output', 'csv')
+        if output not in FORMATS:
+            raise APIValidationError({'output': _('Must be one of: %s.') % ', '.join(FORMATS)})
+        subscriptions = self._filter_subscriptions()
+        encode, content_type = FORMATS[output]
+        response = StreamingHttpResponse(encode(subscriber_rows(subscriptions)), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="%s-subscribers.%s"' % (
+            self.kwargs[self.lookup_field], output
+        )
+        return response
+
+    @action(detail=True, methods=["GET"], url_path='unsubscribe/(?P<email>[-_a-zA-Z0-9@.+~]+)',
+            permission_classes=(IsAuthenticated,), throttle_classes=(UnsubscribeThrottle,))
+    def unsubscribe(self, request, email, *args, **kwargs):
+        """
+        Unsubscribe the authenticated user, `email` must be their own address.
+        Anonymous subscribers unsubscribe with the signed token of their link, see `unsubscribe_token`.
+        """
+        if normalize_email(email).lower() != normalize_email(request.user.email).lower():
+            raise Http404
         subscription = get_object_or_404(
-            Subscription, **query_params
+            Subscription, newsletter=self.get_object(), user=request.user
         )
         subscription.subscribe_unsubscribe()
         return Response(status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=["GET"], url_path='unsubscribe/token/(?P<token>[^/.]+)',
+            throttle_classes=(UnsubscribeThrottle,))
+    def unsubscribe_token(self, request, token, *args, **kwargs):
+        """
+        Unsubscribe using the signed token of `Subscription.unsubscribe_url`.
+        The token is validated without a query, the subscription is updated by primary key, see
+        `Subscription.unsubscribe_by_pk`.
+        """
+        try:
+            subscription_id, newsletter_id = self._read_token(token, Subscription.UNSUBSCRIBE)
+        except signing.BadSignature:
+            raise Http404
+        subscriptions = Subscription.objects.filter(pk=subscription_id, newsletter_id=newsletter_id)
+        if not Subscription.unsubscribe_by_pk(subscription_id, newsletter_id) and not subscriptions.exists():
+            raise Http404  # nothing changed: either unsubscribed already or gone
+        return Response(status=status.HTTP_200_OK)
+
     @action(detail=True, methods=["GET"], url_path='verify/(?P<token>[^/.]+)')
     def verification(self, request, token, *args, **kwargs):
         """
         Why use slug instead of IDs? since the slugs are more reliable when migrating data
+        Signed tokens are validated without a query and verified by primary key (`Subscription.verify_by_pk`),
+        unsigned ones are legacy links looked up by `Subscription.verification_token`.
         TODO: provide meaningful 404 errors for different resources
         """
+        try:
+            subscription_id, newsletter_id = self._read_token(token, Subscription.VERIFY)
+        except signing.BadSignature:
+            return self._legacy_verification(token)
+
+        subscriptions = Subscription.objects.filter(pk=subscription_id, newsletter_id=newsletter_id)
+        if not Subscription.verify_by_pk(subscription_id, newsletter_id) and not subscriptions.exists():
+            raise Http404  # nothing changed: either verified already or gone
+        return Response(status=status.HTTP_200_OK)
+
+    def _legacy_verification(self, token):
         newsletter = self.get_object()
 
         subscription = get_object_or_404(
@@ -80,3 +209,35 @@ class NewsletterViewSet(RetrieveModelMixin, GenericViewSet):
         )
         subscription.subscribe_verify()
         return Response(status=status.HTTP_200_OK)
+
+    def _filter_subscriptions(self):
+        """Subscriptions of the newsletter, filtered by the `is_active` and `verified` query parameters"""
+        subscriptions = Subscription.objects.filter(newsletter=self.get_object())
+        is_active = self._read_bool('is_active')
+        if is_active is not None:
+            subscriptions = subscriptions.filter(is_active=is_active)
+        verified = self._read_bool('verified')
+        if verified is not None:
+            subscriptions = subscriptions.filter(verification_date__isnull=not verified)
+        return subscriptions
+
+    def _read_bool(self, param):
+        value = self.request.query_params.get(param)
+        if value is None or value == '':
+            return None
+        if value.lower() not in ('true', 'false', '1', '0'):
+            raise APIValidationError({param: _('Must be true or false.')})
+        return value.lower() in ('true', '1')
+
+    def _read_token(self, token, action):
+        """
+        Expired tokens are rejected, other bad signatures are left to the caller. Tokens of another
+        newsletter than the one in the URL are not found.
+        """
+        try:
+            subscription_id, newsletter_id = read_subscription_token(token, action)
+        except signing.SignatureExpired:
+            raise APIValidationError(_('This link has expired.'))
+        if self.get_object().pk != newsletter_id:
+            raise Http404
+        return subscription_id, newsletter_id
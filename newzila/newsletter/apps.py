@@ -1,5 +1,58 @@
+import logging
+import time
+
 from django.apps import AppConfig
 
+logger = logging.getLogger(__name__)
+
 
 class NewsletterConfig(AppConfig):
     name = "newzila.newsletter"
+
+    def ready(self):
+        import newzila.newsletter.signals  # noqa F401
+
+    def warm_up(self, database=True):
+        """
+        Pays the costs of the first requests of a process up front: URL resolver population, serializer
+        field introspection, template compilation, the Celery and email backends and, with `database`,
+        the current `Site` and the NEWSLETTER_WARM_UP_NEWSLETTERS newsletters with the most active
+        subscribers.
+
+        Not run by `ready`, which runs for every management command, `migrate` on an empty database
+        included, and before the URLconf may be imported. Servers call it once Django is set up, see
+        `gunicorn.conf.py`: without `database` before forking workers, which mustn't share connections.
+        """
+        from django.conf import settings
+        from django.contrib.sites.models import Site
+        from django.core.mail import get_connection
+        from django.template.loader import select_template
+        from django.urls import resolve, reverse
+
+        from config import celery_app
+
+        from .api import serializers
+        from .cache import get_newsletter
+        from .models import Newsletter
+
+        start = time.perf_counter()
+        resolve(reverse('api:newsletter-detail', kwargs={'slug': 'warm-up'}))
+        for serializer in (
+            serializers.NewsletterSerializer, serializers.SubscriptionSerializer,
+            serializers.SubscriptionListSerializer, serializers.BulkSubscriptionSerializer,
+        ):
+            serializer().fields
+        for name in ('subject.txt', 'text.txt', 'text.html'):  # compiled once by the cached loader
+            select_template([Newsletter.TEMPLATE_ROOT + name])
+        celery_app.amqp, celery_app.backend  # imported on the first `delay`, neither connects
+        get_connection()
+
+        newsletters = []
+        if database:
+            Site.objects.get_current()
+            newsletters = Newsletter.objects.order_by('-active_count').values_list('slug', flat=True)[
+                :settings.NEWSLETTER_WARM_UP_NEWSLETTERS
+            ]
+            for slug in newsletters:
+                get_newsletter(slug).get_templates()
+        logger.info("Warmed up in %.3fs, %d newsletters", time.perf_counter() - start, len(newsletters))
@@ -0,0 +1,211 @@
+""" Email backends """
+import atexit
+import os
+import queue
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend
+
+
+class PooledConnection:
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.created = self.last_used = time.monotonic()
+        self.sent = 0
+        self.broken = False
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+
+
+class SMTPConnectionPool:
+    """
+    A bounded pool of open (and authenticated) SMTP connections to a single server.
+
+    Idle connections are checked with NOOP before reuse, they are recycled after `max_messages`
+    messages or `idle_timeout` seconds of inactivity. The pool is thread safe; it belongs to the
+    process that created it, see `get_pool`.
+    """
+
+    def __init__(self, size, max_messages, idle_timeout, wait_timeout):
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self, connect):
+        """
+        Returns a healthy connection, opening one with `connect()` if none is idle
+        and the pool isn't full, otherwise waits for one to be released.
+        """
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                if self._slots.acquire(blocking=False):
+                    return self._connect(connect)
+                try:
+                    connection = self._idle.get(timeout=self.wait_timeout)
+                except queue.Empty:
+                    raise smtplib.SMTPException('No SMTP connection available in the pool')
+            if self._is_healthy(connection):
+                return connection
+            self._discard(connection)
+
+    def release(self, connection):
+        if connection.broken or connection.sent >= self.max_messages:
+            self._discard(connection)
+            return
+        connection.last_used = time.monotonic()
+        self._idle.put(connection)
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def _connect(self, connect):
+        try:
+            return PooledConnection(connect())
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _is_healthy(self, connection):
+        if time.monotonic() - connection.last_used > self.idle_timeout:
+            return False
+        try:
+            return connection.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _discard(self, connection):
+        connection.close()
+        self._slots.release()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = None
+
+
+def get_pool(key):
+    """
+    Returns the pool of `key` for the current process.
+    Pools inherited from a parent process (e.g. Celery prefork) are dropped, not closed:
+    their sockets still belong to the parent.
+    """
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SMTPConnectionPool(
+                size=settings.EMAIL_POOL_SIZE,
+                max_messages=settings.EMAIL_POOL_MAX_MESSAGES,
+                idle_timeout=settings.EMAIL_POOL_IDLE_TIMEOUT,
+                wait_timeout=settings.EMAIL_POOL_WAIT_TIMEOUT,
+            )
+        return pool
+
+
+@atexit.register
+def close_pools():
+    with _pools_lock:
+        if _pools_pid == os.getpid():
+            for pool in _pools.values():
+                pool.close()
+        _pools.clear()
+
+
+class PooledSMTPEmailBackend(EmailBackend):
+    """
+    SMTP backend reusing connections from a per-process pool instead of connecting
+    (and doing the TLS handshake and login) for every `send_messages` call.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pooled = None
+
+    @property
+    def pool_key(self):
+        return (self.host, self.port, self.username, self.use_tls, self.use_ssl)
+
+    def open(self):
+        if self.connection:
+            return False
+        try:
+            self._pooled = get_pool(self.pool_key).acquire(self._connect)
+        except (smtplib.SMTPException, OSError):
+            if not self.fail_silently:
+                raise
+            return None
+        self.connection = self._pooled.smtp
+        return True
+
+    def close(self):
+        """Hand the connection back to the pool instead of closing it"""
+        if self._pooled is None:
+            return
+        try:
+            get_pool(self.pool_key).release(self._pooled)
+        finally:
+            self._pooled = None
+            self.connection = None
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        with self._lock:
+            new_conn_created = self.open()
+            if not self.connection or new_conn_created is None:
+                return 0
+            try:
+                return sum(1 for message in email_messages if self._send(message))
+            finally:
+                # unlike the plain backend, release on errors too: the pool slot must not leak
+                if new_conn_created or self._pooled.broken:
+                    self.close()
+
+    def _connect(self):
+        """Open a new connection the way the plain SMTP backend does"""
+        super().open()
+        smtp, self.connection = self.connection, None
+        if smtp is None:  # failed silently
+            raise smtplib.SMTPException('Could not connect to %s:%s' % (self.host, self.port))
+        return smtp
+
+    def _send(self, email_message):
+        try:
+            sent = super()._send(email_message)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self._pooled.broken = True
+            raise
+        except smtplib.SMTPException:
+            # e.g. a rejected recipient leaves the session usable, other errors may not
+            self._pooled.broken = self._is_broken()
+            raise
+        if sent:
+            self._pooled.sent += 1
+        elif self.fail_silently and email_message.recipients():
+            self._pooled.broken = self._is_broken()
+        return sent
+
+    def _is_broken(self):
+        try:
+            return self.connection.noop()[0] != 250
+        except (smtplib.SMTPException, OSError):
+            return True
@@ -0,0 +1,152 @@
+"""
+Bloom filters of the anonymous subscribers of each newsletter, to skip existence queries for emails
+that are certainly not subscribed.
+
+A filter answers "absent" or "maybe": false positives fall back to the database, false negatives
+(e.g. of a subscription added while a filter was rebuilt elsewhere) are caught by the unique
+constraints, so a stale filter costs queries, never correctness. Deleted subscriptions stay in
+the filter until it's rebuilt with `rebuild_subscriber_filters`.
+
+Filters live in the default cache. On Redis they are bitsets read and written with GETBIT/SETBIT in
+a single pipelined round trip; other backends (locmem in development and tests) store a bytearray.
+A filter is only consulted once it has been built, any cache error makes it answer "maybe".
+"""
+import hashlib
+import logging
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import RedisError
+
+from .metrics import SUBSCRIBER_FILTER_CHECKS
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriberFilter:
+    def __init__(self, newsletter_id, capacity=None, error_rate=None):
+        capacity = capacity or settings.NEWSLETTER_SUBSCRIBER_FILTER_CAPACITY
+        error_rate = error_rate or settings.NEWSLETTER_SUBSCRIBER_FILTER_ERROR_RATE
+        self.newsletter_id = newsletter_id
+        self.bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+        # sized into the key, filters of other settings are ignored until rebuilt
+        self.name = 'newsletter:subscriber-filter:%s:%d:%d' % (newsletter_id, self.bits, self.hashes)
+        self.key = cache.make_key(self.name)
+        self.ready_key = self.key + ':ready'
+        client = getattr(cache, 'client', None)
+        self.redis = client.get_client(write=True) if client is not None else None
+
+    def positions(self, email):
+        digest = hashlib.blake2b(email.lower().encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def maybe_contains(self, emails):
+        """The emails which may be subscribed: all of them, unless the filter rules some out"""
+        emails = list(emails)
+        if not emails or not settings.NEWSLETTER_SUBSCRIBER_FILTER:
+            return emails
+        try:
+            found = self._get(emails)
+        except RedisError:
+            logger.warning("Subscriber filter of newsletter %s unavailable", self.newsletter_id, exc_info=True)
+            found = None
+        if found is None:  # not built
+            return emails
+        maybe = [email for email, present in zip(emails, found) if present]
+        SUBSCRIBER_FILTER_CHECKS.inc(len(emails) - len(maybe), result='absent')
+        SUBSCRIBER_FILTER_CHECKS.inc(len(maybe), result='maybe')
+        return maybe
+
+    def record_false_positives(self, count):
+        """Count "maybe" answers the database found absent, for the false positive rate"""
+        SUBSCRIBER_FILTER_CHECKS.inc(count, result='false_positive')
+
+    def add(self, emails):
+        if not settings.NEWSLETTER_SUBSCRIBER_FILTER:
+            return
+        try:
+            self._add(emails)
+        except RedisError:
+            logger.warning("Subscriber filter of newsletter %s unavailable", self.newsletter_id, exc_info=True)
+
+    def rebuild(self, emails):
+        """Replaces the filter with one of `emails`, returns the number of emails added"""
+        count = 0
+        if self.redis is None:
+            emails = list(emails)
+            cache.set(self.name, self._set_bits(bytearray(self.bits // 8 + 1), emails), None)
+            return len(emails)
+
+        building = self.key + ':building'
+        self.redis.delete(building)
+        chunk = []
+        for email in emails:
+            chunk.append(email)
+            if len(chunk) == 1000:
+                self._add(chunk, building)
+                count += len(chunk)
+                chunk = []
+        self._add(chunk, building)
+        count += len(chunk)
+        pipe = self.redis.pipeline()
+        pipe.setbit(building, self.bits - 1, 0)  # so an empty filter exists too
+        pipe.rename(building, self.key)
+        pipe.set(self.ready_key, 1)
+        pipe.execute()
+        return count
+
+    def fill_ratio(self):
+        """Share of bits set, None if the filter isn't built"""
+        if self.redis is None:
+            bits = cache.get(self.name)
+            if bits is None:
+                return None
+            return sum(bin(byte).count('1') for byte in bits) / self.bits
+        if not self.redis.exists(self.ready_key):
+            return None
+        return self.redis.bitcount(self.key) / self.bits
+
+    def estimated_error_rate(self):
+        """False positive rate expected from the share of bits set"""
+        fill = self.fill_ratio()
+        return None if fill is None else fill ** self.hashes
+
+    def _get(self, emails):
+        """Whether each email may be in the filter, None if the filter isn't built"""
+        positions = [self.positions(email) for email in emails]
+        if self.redis is None:
+            bits = cache.get(self.name)
+            if bits is None:
+                return None
+            return [all(bits[p // 8] & (1 << (p % 8)) for p in email_positions) for email_positions in positions]
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.exists(self.ready_key)
+        for email_positions in positions:
+            for position in email_positions:
+                pipe.getbit(self.key, position)
+        ready, *bits = pipe.execute()
+        if not ready:
+            return None
+        return [all(bits[i * self.hashes:(i + 1) * self.hashes]) for i in range(len(emails))]
+
+    def _add(self, emails, key=None):
+        if self.redis is None:
+            bits = cache.get(self.name)
+            if bits is not None:  # not built, it would miss the older subscribers
+                cache.set(self.name, self._set_bits(bits, emails), None)
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for email in emails:
+            for position in self.positions(email):
+                pipe.setbit(key or self.key, position, 1)
+        pipe.execute()
+
+    def _set_bits(self, bits, emails):
+        for email in emails:
+            for position in self.positions(email):
+                bits[position // 8] |= 1 << (position % 8)
+        return bits
@@ -0,0 +1,121 @@
+""" Caching of rarely changing newsletter data """
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Newsletter
+
+
+class LRUCache:
+    """
+    A small thread safe, per-process LRU cache with a time to live.
+
+    It can't be invalidated from other processes, keep the TTL short for data that may change.
+    """
+    LOCK_STRIPES = 64
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def key_lock(self, key):
+        """Lock serializing the loaders of `key` (striped, so the number of locks stays fixed)"""
+        return self._key_locks[hash(key) % self.LOCK_STRIPES]
+
+
+local_cache = LRUCache(settings.NEWSLETTER_LOCAL_CACHE_SIZE, settings.NEWSLETTER_LOCAL_CACHE_TIMEOUT)
+
+
+def _field_names():
+    # subscriber counts change with every (un)subscription, they're left deferred instead of going stale
+    return [field.attname for field in Newsletter._meta.concrete_fields if field.attname not in Newsletter.COUNT_FIELDS]
+
+
+# cached values are field tuples, the field list is part of the key so schema changes can't mix them up
+NEWSLETTER_KEY = 'newsletter:%x:slug:%%s' % zlib.crc32(','.join(_field_names()).encode())
+LOCK_KEY = NEWSLETTER_KEY + ':lock'
+LOCK_TIMEOUT = 10  # seconds
+LOCK_WAIT = 0.05
+LOCK_RETRIES = 20
+
+
+def get_newsletter(slug):
+    """
+    Returns the newsletter of `slug`, raising `Newsletter.DoesNotExist` like a query would.
+
+    Looked up in the per-process LRU, then in the default cache, and only then in the database;
+    a single loader per key runs at a time, both within the process and across processes.
+    Every call gets its own instance, so callers may modify it freely.
+    """
+    key = NEWSLETTER_KEY % slug
+    values = local_cache.get(key)
+    if values is None:
+        with local_cache.key_lock(key):
+            values = local_cache.get(key)
+            if values is None:
+                values = cache.get(key)
+                if values is None:
+                    values = _load_newsletter(slug)
+                local_cache.set(key, values)
+    return Newsletter.from_db('default', _field_names(), values)
+
+
+def invalidate_newsletter(slug):
+    key = NEWSLETTER_KEY % slug
+    local_cache.delete(key)
+    cache.delete(key)
+
+
+def _load_newsletter(slug):
+    key = NEWSLETTER_KEY % slug
+    lock_key = LOCK_KEY % slug
+    locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    if locked is False:
+        # another process is loading it, wait for its result before falling back to the database;
+        # with django-redis' IGNORE_EXCEPTIONS a failing cache returns None instead, nothing to wait for
+        for _ in range(LOCK_RETRIES):
+            time.sleep(LOCK_WAIT)
+            values = cache.get(key)
+            if values is not None:
+                return values
+    try:
+        values = Newsletter.objects.values_list(*_field_names()).get(slug=slug)
+        cache.set(key, values, settings.NEWSLETTER_CACHE_TIMEOUT)
+        return values
+    finally:
+        if locked:
+            cache.delete(lock_key)
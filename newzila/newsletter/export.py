@@ -0,0 +1,58 @@
+"""
+Subscriber exports, written incrementally: rows are read from a server-side cursor in chunks and
+encoded chunk by chunk, so memory stays bounded and the first bytes go out right away.
+"""
+import csv
+import json
+
+from django.conf import settings
+
+from .models import Subscription
+from .utils import chunked
+
+FIELDS = ['id', 'email', 'name', 'create_date', 'verification_date', 'is_active', 'state']
+
+
+def subscriber_rows(subscriptions):
+    """Rows of FIELDS for `subscriptions`, in id order, without loading model instances"""
+    rows = subscriptions.with_recipient().order_by('pk').values_list(
+        'pk', 'recipient_email', 'recipient_name', 'create_date', 'verification_date', 'is_active',
+    ).iterator(chunk_size=settings.NEWSLETTER_EXPORT_CHUNK_SIZE)
+    for pk, email, name, create_date, verification_date, is_active in rows:
+        if is_active:
+            state = Subscription.ACTIVE
+        else:
+            state = Subscription.PENDING if verification_date is None else Subscription.UNSUBSCRIBED
+        yield [pk, email, name, create_date, verification_date, is_active, state]
+
+
+class _Echo:
+    """File-like object returning what is written, to get lines out of `csv.writer`"""
+
+    def write(self, value):
+        return value
+
+
+def _isoformat(value):
+    """Datetimes at full precision, unlike DjangoJSONEncoder"""
+    return value.isoformat() if value is not None else ''
+
+
+def export_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    for chunk in chunked(rows, settings.NEWSLETTER_EXPORT_CHUNK_SIZE):
+        yield ''.join(writer.writerow([
+            pk, email, name or '', _isoformat(create_date), _isoformat(verification_date), is_active, state
+        ]) for pk, email, name, create_date, verification_date, is_active, state in chunk)
+
+
+def export_ndjson(rows):
+    for chunk in chunked(rows, settings.NEWSLETTER_EXPORT_CHUNK_SIZE):
+        yield ''.join(json.dumps(dict(zip(FIELDS, row)), default=_isoformat) + '\n' for row in chunk)
+
+
+FORMATS = {
+    'csv': (export_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+}
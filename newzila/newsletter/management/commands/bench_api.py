@@ -0,0 +1,216 @@
+import json
+import math
+import platform
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from http.client import HTTPConnection, HTTPSConnection
+from types import SimpleNamespace
+from urllib.parse import urlencode, urlsplit
+
+import django
+from django.conf import settings
+from django.core import mail
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+from django.utils.timezone import now
+from factory import Sequence
+
+from config import celery_app
+from newzila.newsletter.models import Subscription
+from newzila.newsletter.tests.factories import NewsletterFactory, SubscriptionAnonymousFactory
+
+ENDPOINTS = ['subscribe', 'verify', 'unsubscribe']
+NO_THROTTLING = {'newsletter_subscribe': None, 'newsletter_unsubscribe': None}
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted `values`"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+class RemoteClient:
+    """Sends the requests of a `django.test.Client` to a running server, over a kept-alive connection"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        connection_class = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+        self.connection = connection_class(parts.netloc, timeout=30)
+        self.prefix = parts.path.rstrip('/')
+
+    def request(self, method, url, data=None):
+        body, headers = None, {}
+        if data is not None:
+            body, headers = urlencode(data), {'Content-Type': 'application/x-www-form-urlencoded'}
+        self.connection.request(method, self.prefix + url, body, headers)
+        response = self.connection.getresponse()
+        response.read()  # reconnects by itself if the server closes the connection (sync workers do)
+        return SimpleNamespace(status_code=response.status)
+
+    def get(self, url, data=None):
+        return self.request('GET', url)
+
+    def post(self, url, data=None):
+        return self.request('POST', url, data)
+
+    def close(self):
+        self.connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the subscribe, verify and unsubscribe endpoints of the newsletter API in process, "
+        "with concurrent clients against the configured database. A newsletter and its subscriptions are "
+        "seeded through the test factories and deleted afterwards. Reports latency percentiles, "
+        "throughput and queries per request of each endpoint as JSON. "
+        "Celery tasks run eagerly and emails go to the locmem backend, so no broker or SMTP server is needed. "
+        "With --base-url the requests go over HTTP to a running server sharing the database instead, e.g. "
+        "to compare gunicorn worker classes under the same concurrency; queries per request aren't known "
+        "then and its throttling should be disabled (NEWSLETTER_SUBSCRIBE_THROTTLE_RATE=\"\" etc.)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint")
+        parser.add_argument('--concurrency', type=int, default=4, help="Number of concurrent clients")
+        parser.add_argument('--endpoint', choices=ENDPOINTS, action='append', dest='endpoints',
+                            help="Endpoint to load, may be repeated (default: all)")
+        parser.add_argument('--output', help="File to write the JSON results to, stdout by default")
+        parser.add_argument('--keep', action='store_true', help="Keep the seeded data")
+        parser.add_argument('--base-url', help="URL of a running server to send the requests to, e.g. "
+                                               "http://localhost:8000 (default: in process)")
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--requests and --concurrency must be positive")
+        self.requests = options['requests']
+        self.concurrency = options['concurrency']
+        self.base_url = options['base_url']
+
+        results = OrderedDict([
+            ('meta', OrderedDict([
+                ('date', now().isoformat()),
+                ('python', platform.python_version()),
+                ('django', django.get_version()),
+                ('database', connection.vendor),
+                ('requests', self.requests),
+                ('concurrency', self.concurrency),
+                ('target', self.base_url or 'in-process'),
+            ])),
+            ('results', []),
+        ])
+        newsletter = NewsletterFactory(slug='load-test-%s' % get_random_string(8).lower())
+        always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        try:
+            with override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver'],
+                REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=NO_THROTTLING),
+            ):
+                for endpoint in options['endpoints'] or ENDPOINTS:
+                    result = self.load(endpoint, getattr(self, 'seed_%s' % endpoint)(newsletter))
+                    results['results'].append(result)
+                    self.stderr.write(self.format_result(result))
+        finally:
+            celery_app.conf.task_always_eager = always_eager
+            mail.outbox = []
+            if not options['keep']:
+                newsletter.delete()
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def seed_subscribe(self, newsletter):
+        prefix = get_random_string(8).lower()
+        url = reverse('api:newsletter-subscribe', kwargs={'slug': newsletter.slug})
+        return [('post', url, {'email_field': 'new-%s-%d@example.com' % (prefix, n)})
+                for n in range(self.requests)]
+
+    def seed_verify(self, newsletter):
+        return [('get', subscription.subscribe_verification_url(), None)
+                for subscription in self.seed_subscriptions(newsletter, 'pending', is_active=False)]
+
+    def seed_unsubscribe(self, newsletter):
+        return [('get', subscription.unsubscribe_url(), None)
+                for subscription in self.seed_subscriptions(newsletter, 'active', is_active=True)]
+
+    def seed_subscriptions(self, newsletter, prefix, **fields):
+        # built rather than created: the factory's get_or_create would return one subscription per newsletter
+        subscriptions = SubscriptionAnonymousFactory.build_batch(
+            self.requests, newsletter=newsletter,
+            email=Sequence(lambda n: '%s-%d@example.com' % (prefix, n)), **fields
+        )
+        Subscription.objects.bulk_create(subscriptions)
+        return Subscription.objects.select_related('newsletter').filter(
+            newsletter=newsletter, email_field__startswith=prefix + '-'
+        ).order_by('pk')
+
+    def load(self, endpoint, requests):
+        """Send `requests` from concurrent clients, each sending its share one after the other"""
+        timings = []
+        lock = threading.Lock()
+
+        def client(share):
+            http = RemoteClient(self.base_url) if self.base_url else Client()
+            measured = []
+            try:
+                for method, url, data in share:
+                    with ExitStack() as stack:
+                        queries = None if self.base_url else stack.enter_context(
+                            CaptureQueriesContext(connections['default'])
+                        )
+                        start = time.perf_counter()
+                        try:
+                            status = getattr(http, method)(url, data).status_code
+                        except Exception as e:  # e.g. "database is locked" on SQLite
+                            status = type(e).__name__
+                        elapsed = time.perf_counter() - start
+                    measured.append((elapsed, None if queries is None else len(queries), status))
+            finally:
+                if self.base_url:
+                    http.close()
+                connections.close_all()
+            with lock:
+                timings.extend(measured)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(client, [requests[i::self.concurrency] for i in range(self.concurrency)]))
+        duration = time.perf_counter() - start
+
+        latencies = sorted(elapsed for elapsed, _, _ in timings)
+        return OrderedDict([
+            ('endpoint', endpoint),
+            ('requests', len(timings)),
+            ('seconds', round(duration, 6)),
+            ('requests_per_second', round(len(timings) / duration, 1)),
+            ('latency_ms', OrderedDict(
+                (name, round(percentile(latencies, percent) * 1000, 3))
+                for name, percent in (('p50', 50), ('p95', 95), ('p99', 99))
+            )),
+            ('queries_per_request', None if self.base_url else round(
+                sum(count for _, count, _ in timings) / len(timings), 2
+            )),
+            ('status', OrderedDict(sorted(Counter(str(status) for _, _, status in timings).items()))),
+        ])
+
+    @staticmethod
+    def format_result(result):
+        latency = result['latency_ms']
+        queries = result['queries_per_request']
+        return "%-12s %8.1f req/s  p50 %.1fms  p95 %.1fms  p99 %.1fms  %s queries/req  %s" % (
+            result['endpoint'], result['requests_per_second'], latency['p50'], latency['p95'], latency['p99'],
+            '?' if queries is None else '%.1f' % queries, dict(result['status']),
+        )
@@ -0,0 +1,162 @@
+import json
+import platform
+import time
+from collections import OrderedDict
+
+import django
+from django.contrib.sites.models import Site
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from newzila.newsletter.models import Issue, Newsletter, Subscription
+from newzila.newsletter.rendering import clear_template_cache
+
+STAGES = ['templates', 'build', 'serialize', 'send']
+
+ISSUE_SUBJECT = "{{ newsletter.title }}: issue for {{ subscription.name|default:'you' }}"
+ISSUE_TEXT = (
+    "Hello {{ subscription.name|default:'reader' }},\n\n"
+    "{% for i in items %}* Item {{ i }} of {{ newsletter.title }}\n{% endfor %}\n"
+    "Unsubscribe: {{ unsubscribe_url }}\n"
+)
+ISSUE_HTML = (
+    "<html><body><h1>{{ newsletter.title }}</h1><p>Hello {{ subscription.name }},</p>"
+    "<ul>{% for i in items %}<li>Item {{ i }}</li>{% endfor %}</ul>"
+    "<a href=\"{{ unsubscribe_url }}\">Unsubscribe</a></body></html>"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark building newsletter emails: template lookup, building the messages with the model "
+        "methods used for sending (rendering and MIME construction), serialization and sending through "
+        "the locmem backend, for synthetic (unsaved) subscriptions. "
+        "Results are written as JSON; pass --compare with an earlier result to see the change per stage."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, action='append', dest='counts',
+                            help="Number of emails to build, may be repeated (default: 1, 1000 and 100000)")
+        parser.add_argument('--kind', choices=['verification', 'issue'], action='append', dest='kinds',
+                            help="Email to benchmark, may be repeated (default: both)")
+        parser.add_argument('--output', help="File to write the JSON results to, stdout by default")
+        parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+
+    def handle(self, *args, **options):
+        counts = options['counts'] or [1, 1000, 100000]
+        if any(count < 1 for count in counts):
+            raise CommandError("--count must be positive")
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        results = OrderedDict([
+            ('meta', OrderedDict([
+                ('date', now().isoformat()),
+                ('python', platform.python_version()),
+                ('django', django.get_version()),
+                ('platform', platform.platform()),
+            ])),
+            ('results', []),
+        ])
+        for kind in options['kinds'] or ['verification', 'issue']:
+            for count in counts:
+                clear_template_cache()
+                result = self.bench(kind, count)
+                results['results'].append(result)
+                self.stderr.write(self.format_result(result, baseline))
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def bench(self, kind, count):
+        """
+        Build and send `count` emails of `kind`, timing every stage separately.
+        Messages are built by `Subscription.get_verification_email` and `Issue.get_message`, with a renderer
+        created once per run, like `EmailOutbox.send_batch` and `send_issue_chunk` do once per batch.
+        """
+        newsletter = Newsletter(pk=1, title="Benchmark", slug='benchmark', email='bench@example.com',
+                                sender="Benchmark")
+        site = Site(pk=1, domain='example.com', name='example.com')
+        issue = Issue(pk=1, newsletter=newsletter, subject=ISSUE_SUBJECT, text=ISSUE_TEXT, html=ISSUE_HTML)
+        connection = get_connection('django.core.mail.backends.locmem.EmailBackend')
+        timings = OrderedDict((stage, 0.0) for stage in STAGES)
+        clock = time.perf_counter
+        size = 0
+
+        start = clock()
+        renderer = (newsletter.get_verification_renderer(site) if kind == 'verification'
+                    else issue.get_renderer(site))
+        renderer.context['items'] = range(20)
+        timings['templates'] += clock() - start
+
+        created = now()
+        for subscription in self.subscriptions(newsletter, count, created):
+            start = clock()
+            if kind == 'verification':
+                message = subscription.get_verification_email(renderer)
+            else:
+                message = issue.get_message(subscription, renderer)
+            lap = clock()
+            timings['build'] += lap - start
+            size += len(message.message().as_bytes())
+            start, lap = lap, clock()
+            timings['serialize'] += lap - start
+            connection.send_messages([message])
+            start, lap = lap, clock()
+            timings['send'] += lap - start
+            if not subscription.pk % 1000:
+                self.clear_outbox()
+        self.clear_outbox()
+
+        total = sum(timings.values())
+        return OrderedDict([
+            ('kind', kind),
+            ('count', count),
+            ('seconds', round(total, 6)),
+            ('emails_per_second', round(count / total, 1) if total else None),
+            ('bytes_per_email', size // count),
+            ('stages', OrderedDict(
+                (stage, OrderedDict([
+                    ('seconds', round(seconds, 6)),
+                    ('us_per_email', round(seconds / count * 1e6, 2)),
+                ]))
+                for stage, seconds in timings.items()
+            )),
+        ])
+
+    @staticmethod
+    def subscriptions(newsletter, count, created):
+        """Yields unsaved subscriptions, so the benchmark doesn't measure (or need) the database"""
+        for pk in range(1, count + 1):
+            yield Subscription(
+                pk=pk, newsletter=newsletter, create_date=created,
+                email_field='reader-%d@example.com' % pk,
+                name_field=("Reader & %d" % pk) if pk % 4 else None,
+            )
+
+    @staticmethod
+    def clear_outbox():
+        if hasattr(mail, 'outbox'):
+            mail.outbox = []
+
+    @staticmethod
+    def format_result(result, baseline=None):
+        previous = {}
+        for item in (baseline or {}).get('results', []):
+            if item['kind'] == result['kind'] and item['count'] == result['count']:
+                previous = item['stages']
+        lines = ["%s x %d: %.0f emails/s" % (result['kind'], result['count'], result['emails_per_second'] or 0)]
+        for stage, timing in result['stages'].items():
+            line = "  %-10s %10.2f us/email" % (stage, timing['us_per_email'])
+            if stage in previous and previous[stage]['us_per_email']:
+                line += "  %+.1f%%" % ((timing['us_per_email'] / previous[stage]['us_per_email'] - 1) * 100)
+            lines.append(line)
+        return '\n'.join(lines)
@@ -0,0 +1,217 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from newzila.newsletter.bloom import SubscriberFilter
+from newzila.newsletter.models import Newsletter, Subscription
+from newzila.newsletter.utils import chunked, make_verification_token, normalize_email
+
+NAME_MAX_LENGTH = Subscription._meta.get_field('name_field').max_length
+
+
+class Command(BaseCommand):
+    help = (
+        "Import anonymous subscribers of a newsletter from a CSV or NDJSON file. "
+        "The file is streamed and written in batches, so memory stays flat regardless of its size. "
+        "Already subscribed emails are skipped and no verification emails are sent."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug', help="Slug of the newsletter to subscribe to")
+        parser.add_argument('file', help="Path of the file to import, '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Input format, guessed from the file extension by default")
+        parser.add_argument('--email-column', default='email', help="CSV column / JSON key of the email")
+        parser.add_argument('--name-column', default='name', help="CSV column / JSON key of the name")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows written per transaction")
+        parser.add_argument('--offset', type=int, default=0, help="Number of data rows to skip")
+        parser.add_argument('--checkpoint',
+                            help="File storing the offset of the last written batch; resumes from it if present")
+        parser.add_argument('--active', action='store_true',
+                            help="Mark imported subscriptions as verified and active")
+
+    def handle(self, *args, **options):
+        try:
+            newsletter = Newsletter.objects.get(slug=options['slug'])
+        except Newsletter.DoesNotExist:
+            raise CommandError("Newsletter '%s' does not exist" % options['slug'])
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        offset = options['offset']
+        checkpoint = options['checkpoint']
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                offset = int(f.read().strip() or 0)
+            self.stdout.write("Resuming from offset %d" % offset)
+
+        file_format = options['format'] or ('ndjson' if options['file'].endswith(('.ndjson', '.jsonl')) else 'csv')
+        reader = self.read_ndjson if file_format == 'ndjson' else self.read_csv
+        write = self.copy_batch if connection.vendor == 'postgresql' else self.bulk_create_batch
+
+        stats = {'read': 0, 'imported': 0, 'invalid': 0, 'duplicate': 0}
+        started = time.monotonic()
+        with self.open(options['file']) as stream:
+            rows = reader(stream, options['email_column'], options['name_column'])
+            rows = self.skip(rows, offset)
+            for batch in chunked(self.clean(rows, stats), options['batch_size']):
+                batch = self.dedupe(batch, stats)
+                with transaction.atomic():
+                    imported = write(newsletter, batch, options['active'])
+                    Newsletter.update_subscriber_counts(newsletter.pk, **{
+                        Subscription.ACTIVE if options['active'] else Subscription.PENDING: imported
+                    })
+                stats['imported'] += imported
+                stats['duplicate'] += len(batch) - imported
+                self.save_checkpoint(checkpoint, offset + stats['read'])
+                self.report(stats, started)
+
+        self.save_checkpoint(checkpoint, offset + stats['read'])
+        self.stdout.write(self.style.SUCCESS("Imported %(imported)d subscribers" % stats))
+
+    @staticmethod
+    def open(path):
+        if path == '-':
+            return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        try:
+            return open(path, encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError("Can't open '%s': %s" % (path, e))
+
+    @staticmethod
+    def read_csv(stream, email_column, name_column):
+        reader = csv.DictReader(stream)
+        if reader.fieldnames is None or email_column not in reader.fieldnames:
+            raise CommandError("CSV header has no '%s' column" % email_column)
+        for row in reader:
+            yield row.get(email_column), row.get(name_column)
+
+    @staticmethod
+    def read_ndjson(stream, email_column, name_column):
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                raise CommandError("Invalid JSON on line %d" % line_number)
+            yield row.get(email_column), row.get(name_column)
+
+    @staticmethod
+    def skip(rows, offset):
+        for index, row in enumerate(rows):
+            if index >= offset:
+                yield row
+
+    @staticmethod
+    def clean(rows, stats):
+        """Normalize rows to (email, name), counting and dropping invalid emails"""
+        for email, name in rows:
+            stats['read'] += 1
+            email = normalize_email(email)
+            try:
+                validate_email(email)
+            except ValidationError:
+                stats['invalid'] += 1
+                continue
+            name = (name or '').strip()[:NAME_MAX_LENGTH] or None
+            yield email, name
+
+    @staticmethod
+    def dedupe(batch, stats):
+        """Drop repeated emails inside a batch, repeats across batches are left to the unique constraint"""
+        unique = dict(batch)
+        stats['duplicate'] += len(batch) - len(unique)
+        return list(unique.items())
+
+    @staticmethod
+    def bulk_create_batch(newsletter, batch, active):
+        subscriber_filter = SubscriberFilter(newsletter.pk)
+        existing = set()
+        maybe_existing = subscriber_filter.maybe_contains(email for email, _ in batch)
+        if maybe_existing:
+            existing = set(Subscription.objects.filter(
+                newsletter=newsletter, user__isnull=True, email_field__in=maybe_existing
+            ).values_list('email_field', flat=True))
+            subscriber_filter.record_false_positives(len(maybe_existing) - len(existing))
+        verification_date = now() if active else None
+        subscriptions = [
+            Subscription(newsletter=newsletter, email_field=email, name_field=name,
+                         is_active=active, verification_date=verification_date)
+            for email, name in batch if email not in existing
+        ]
+        Subscription.objects.bulk_create(subscriptions, ignore_conflicts=True)
+        subscriber_filter.add(subscription.email_field for subscription in subscriptions)
+        # conflicts the existence query missed (filter false negatives, concurrent subscribes) are
+        # skipped silently; the random verification tokens tell the inserted rows apart among the rows of
+        # the batch's emails, which are found through the unique email index
+        return Subscription.objects.filter(
+            newsletter=newsletter, user__isnull=True,
+            email_field__in=[subscription.email_field for subscription in subscriptions],
+            verification_token__in=[subscription.verification_token for subscription in subscriptions],
+        ).count() if subscriptions else 0
+
+    @staticmethod
+    def copy_batch(newsletter, batch, active):
+        """
+        COPY the batch into a temporary table and move it over with a single INSERT ... SELECT,
+        letting the partial unique constraints drop already subscribed emails.
+
+        The table lives as long as the connection and is emptied before every batch: within an outer
+        transaction (e.g. tests) the batch's atomic block is only a savepoint, nothing is committed.
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for email, name in batch:
+            writer.writerow([email, name if name is not None else '', make_verification_token()])
+        buffer.seek(0)
+
+        opts = Subscription._meta
+        quote_name = connection.ops.quote_name
+        columns = {name: quote_name(opts.get_field(name).column) for name in (
+            'newsletter', 'email_field', 'name_field', 'create_date', 'verification_token',
+            'verification_date', 'is_active',
+        )}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE IF NOT EXISTS newsletter_subscription_import "
+                "(email varchar(254), name varchar(30), token varchar(40)) ON COMMIT DELETE ROWS"
+            )
+            cursor.execute("TRUNCATE newsletter_subscription_import")
+            cursor.copy_expert(
+                "COPY newsletter_subscription_import (email, name, token) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+            cursor.execute(
+                "INSERT INTO {table} ({newsletter}, {email_field}, {name_field}, {create_date}, "
+                "{verification_token}, {verification_date}, {is_active}) "
+                "SELECT %s, email, NULLIF(name, ''), %s, token, %s, %s FROM newsletter_subscription_import "
+                "ON CONFLICT DO NOTHING".format(table=quote_name(opts.db_table), **columns),
+                [newsletter.pk, now(), now() if active else None, active],
+            )
+            imported = cursor.rowcount
+        SubscriberFilter(newsletter.pk).add(email for email, _ in batch)
+        return imported
+
+    @staticmethod
+    def save_checkpoint(path, offset):
+        if not path:
+            return
+        with open(path, 'w') as f:
+            f.write(str(offset))
+
+    def report(self, stats, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            "%(read)d rows read, %(imported)d imported, %(duplicate)d already subscribed, "
+            "%(invalid)d invalid" % stats + " (%.0f rows/s)" % (stats['read'] / elapsed)
+        )
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from newzila.newsletter.bloom import SubscriberFilter
+from newzila.newsletter.models import Newsletter, Subscription
+from newzila.newsletter.utils import chunked
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the Bloom filters of the anonymous subscribers of newsletters, dropping deleted subscriptions, "
+        "and report the share of bits set and the estimated false positive rate of each. "
+        "Filters are only consulted once built, run it after deploying or resizing them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help="Newsletters to rebuild, all by default")
+        parser.add_argument('--stats', action='store_true', help="Only report the stats of the current filters")
+
+    def handle(self, *args, **options):
+        newsletters = Newsletter.objects.order_by('pk')
+        if options['slugs']:
+            newsletters = newsletters.filter(slug__in=options['slugs'])
+            missing = set(options['slugs']) - set(newsletters.values_list('slug', flat=True))
+            if missing:
+                raise CommandError("Newsletters not found: %s" % ', '.join(sorted(missing)))
+
+        for newsletter_id, slug in newsletters.values_list('pk', 'slug'):
+            subscriber_filter = SubscriberFilter(newsletter_id)
+            if not options['stats']:
+                subscriptions = Subscription.objects.filter(newsletter_id=newsletter_id, user__isnull=True)
+                started = now()
+                count = subscriber_filter.rebuild(
+                    subscriptions.values_list('email_field', flat=True).iterator(chunk_size=2000)
+                )
+                # subscriptions added while rebuilding went to the filter being replaced
+                recent = subscriptions.filter(create_date__gte=started).values_list('email_field', flat=True)
+                for chunk in chunked(recent.iterator(), 2000):
+                    subscriber_filter.add(chunk)
+                self.stdout.write("%s: %d subscribers" % (slug, count))
+            self.report(slug, subscriber_filter)
+
+    def report(self, slug, subscriber_filter):
+        fill = subscriber_filter.fill_ratio()
+        if fill is None:
+            self.stdout.write("%s: not built" % slug)
+            return
+        error_rate = subscriber_filter.estimated_error_rate()
+        message = "%s: %d bits, %d hashes, %.2f%% set, estimated false positive rate %.4f%%" % (
+            slug, subscriber_filter.bits, subscriber_filter.hashes, fill * 100, error_rate * 100
+        )
+        if error_rate > settings.NEWSLETTER_SUBSCRIBER_FILTER_ERROR_RATE:
+            self.stdout.write(self.style.WARNING(message + ", raise NEWSLETTER_SUBSCRIBER_FILTER_CAPACITY"))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from newzila.newsletter.models import Newsletter, Subscription
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount the active, pending and unsubscribed subscriptions of newsletters and repair "
+        "the counts stored on them where they drifted (e.g. after bulk deletes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help="Newsletters to reconcile, all by default")
+        parser.add_argument('--dry-run', action='store_true', help="Only report drifted counts")
+
+    def handle(self, *args, **options):
+        newsletters = Newsletter.objects.order_by('pk')
+        if options['slugs']:
+            newsletters = newsletters.filter(slug__in=options['slugs'])
+            missing = set(options['slugs']) - set(newsletters.values_list('slug', flat=True))
+            if missing:
+                raise CommandError("Newsletters not found: %s" % ', '.join(sorted(missing)))
+
+        repaired = 0
+        for newsletter_id in newsletters.values_list('pk', flat=True):
+            with transaction.atomic():
+                # the row lock holds back count updates of concurrent (un)subscriptions until we're done,
+                # while those that updated it before are committed, so counted, once we hold it
+                newsletter = Newsletter.objects.select_for_update().get(pk=newsletter_id)
+                counts = self.count(newsletter)
+                stored = {field: getattr(newsletter, field) for field in Newsletter.COUNT_FIELDS}
+                if counts == stored:
+                    continue
+                repaired += 1
+                self.stdout.write("%s: %s" % (newsletter.slug, ', '.join(
+                    '%s %d -> %d' % (field, stored[field], counts[field])
+                    for field in Newsletter.COUNT_FIELDS if counts[field] != stored[field]
+                )))
+                if not options['dry_run']:
+                    Newsletter.objects.filter(pk=newsletter.pk).update(**counts)
+
+        verb = "drifted" if options['dry_run'] else "repaired"
+        self.stdout.write(self.style.SUCCESS("%d newsletter(s) %s" % (repaired, verb)))
+
+    @staticmethod
+    def count(newsletter):
+        return Subscription.objects.filter(newsletter=newsletter).aggregate(**{
+            '%s_count' % state: Count('pk', filter=condition) for state, condition in Subscription.STATES.items()
+        })
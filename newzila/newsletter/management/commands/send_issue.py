@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from newzila.newsletter.models import Issue
+
+
+class Command(BaseCommand):
+    help = (
+        "Send an issue to all active subscribers of its newsletter. "
+        "Run it again with --resume for an interrupted issue, sending resumes without sending twice."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('issue_id', type=int)
+        parser.add_argument(
+            '--resume', action='store_true',
+            help="Resume an issue that is being sent, once its dispatch has been interrupted",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            issue = Issue.objects.get(pk=options['issue_id'])
+        except Issue.DoesNotExist:
+            raise CommandError("Issue %d does not exist" % options['issue_id'])
+        if issue.status == Issue.SENT:
+            raise CommandError("Issue %d has been sent already" % issue.pk)
+        if issue.status == Issue.SENDING and not options['resume']:
+            raise CommandError("Issue %d is being sent, pass --resume if its dispatch was interrupted" % issue.pk)
+        issue.send()
+        self.stdout.write(self.style.SUCCESS("Sending issue '%s'" % issue))
@@ -0,0 +1,29 @@
+""" Metrics of the newsletter app, see `newzila.utils.metrics` """
+from newzila.utils.metrics import Counter, Histogram
+
+EMAIL_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+SUBSCRIPTION_OUTCOMES = Counter(
+    'newzila_newsletter_subscription_outcomes', "Outcomes of subscribe, verify and unsubscribe requests",
+    ['action', 'outcome'],
+)
+EMAIL_RENDER_SECONDS = Histogram(
+    'newzila_email_render_seconds', "Time to render and build an email", ['kind'], buckets=EMAIL_BUCKETS,
+)
+EMAIL_SEND_SECONDS = Histogram(
+    'newzila_email_send_seconds', "Time to hand a batch of emails to the email backend", ['kind'],
+    buckets=EMAIL_BUCKETS,
+)
+SUBSCRIBER_FILTER_CHECKS = Counter(
+    'newzila_newsletter_subscriber_filter_checks', "Emails checked against the subscriber Bloom filters by answer, "
+    "false_positive counts the 'maybe' answers the database found absent", ['result'],
+)
+EMAILS_SENT = Counter('newzila_emails_sent', "Emails accepted by the email backend", ['kind'])
+
+
+def send_messages(connection, messages, kind):
+    """Send `messages` over `connection`, observing the duration and the number of emails sent"""
+    with EMAIL_SEND_SECONDS.time(kind=kind):
+        sent = connection.send_messages(messages) or 0
+    EMAILS_SENT.inc(sent, kind=kind)
+    return sent
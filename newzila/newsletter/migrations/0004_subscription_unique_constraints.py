@@ -0,0 +1,47 @@
+# Generated by Django 2.2.10 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+def remove_duplicate_subscriptions(apps, schema_editor):
+    """
+    Concurrent subscribes could slip past the old application-level check.
+    Keep the earliest subscription per subscriber, preferring an active one.
+    """
+    Subscription = apps.get_model('newsletter', 'Subscription')
+    seen = set()
+    duplicates = []
+    subscriptions = Subscription.objects.order_by('-is_active', 'id').values_list(
+        'id', 'newsletter_id', 'user_id', 'email_field'
+    )
+    for pk, newsletter_id, user_id, email in subscriptions.iterator():
+        key = (newsletter_id, user_id) if user_id is not None else (newsletter_id, None, email)
+        if key in seen:
+            duplicates.append(pk)
+        else:
+            seen.add(key)
+    for start in range(0, len(duplicates), 500):
+        Subscription.objects.filter(pk__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletter', '0003_subscription_is_active'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_subscriptions, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='subscription',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(condition=models.Q(user__isnull=False), fields=('newsletter', 'user'), name='newsletter_subscription_unique_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(condition=models.Q(user__isnull=True), fields=('newsletter', 'email_field'), name='newsletter_subscription_unique_email'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 2.2.10 on 2026-10-18 08:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletter', '0004_subscription_unique_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Issue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=200, verbose_name='subject')),
+                ('text', models.TextField(verbose_name='text')),
+                ('html', models.TextField(blank=True, verbose_name='HTML')),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('sending', 'Sending'), ('sent', 'Sent')], default='draft', max_length=10)),
+                ('create_date', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('dispatch_cursor', models.PositiveIntegerField(default=0, editable=False)),
+                ('dispatch_date', models.DateTimeField(blank=True, null=True, verbose_name='Dispatch date')),
+                ('sent_date', models.DateTimeField(blank=True, null=True, verbose_name='Sent date')),
+                ('newsletter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='newsletter.Newsletter', verbose_name='newsletter')),
+            ],
+            options={
+                'verbose_name': 'issue',
+                'verbose_name_plural': 'issues',
+            },
+        ),
+        migrations.CreateModel(
+            name='IssueChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_id', models.PositiveIntegerField()),
+                ('last_id', models.PositiveIntegerField()),
+                ('last_sent_id', models.PositiveIntegerField(default=0)),
+                ('sent_count', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent')], default='pending', max_length=10)),
+                ('claim_date', models.DateTimeField(blank=True, null=True)),
+                ('issue', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='newsletter.Issue')),
+            ],
+            options={
+                'verbose_name': 'issue chunk',
+                'verbose_name_plural': 'issue chunks',
+            },
+        ),
+    ]
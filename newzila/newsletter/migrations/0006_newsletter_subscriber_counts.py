@@ -0,0 +1,44 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:00
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_subscribers(apps, schema_editor):
+    Newsletter = apps.get_model('newsletter', 'Newsletter')
+    Subscription = apps.get_model('newsletter', 'Subscription')
+    counts = Subscription.objects.values('newsletter_id').annotate(
+        active=Count('id', filter=Q(is_active=True)),
+        pending=Count('id', filter=Q(is_active=False, verification_date__isnull=True)),
+        unsubscribed=Count('id', filter=Q(is_active=False, verification_date__isnull=False)),
+    ).order_by()
+    for row in counts:
+        Newsletter.objects.filter(pk=row['newsletter_id']).update(
+            active_count=row['active'], pending_count=row['pending'], unsubscribed_count=row['unsubscribed'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletter', '0005_issue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsletter',
+            name='active_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='active subscribers'),
+        ),
+        migrations.AddField(
+            model_name='newsletter',
+            name='pending_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='pending subscribers'),
+        ),
+        migrations.AddField(
+            model_name='newsletter',
+            name='unsubscribed_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='unsubscribed subscribers'),
+        ),
+        migrations.RunPython(count_subscribers, migrations.RunPython.noop),
+    ]
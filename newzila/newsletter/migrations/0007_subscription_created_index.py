@@ -0,0 +1,17 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletter', '0006_newsletter_subscriber_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['newsletter', 'create_date', 'id'], name='newsletter_sub_created_idx'),
+        ),
+    ]
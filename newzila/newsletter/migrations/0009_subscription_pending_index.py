@@ -0,0 +1,22 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletter', '0008_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailoutbox',
+            name='kind',
+            field=models.CharField(choices=[('verification', 'Verification'), ('reminder', 'Verification reminder')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['is_active', 'verification_date', 'create_date', 'id'], name='newsletter_sub_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsletter', '0009_subscription_pending_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='subscription',
+            name='newsletter_sub_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['newsletter', 'id'], name='newsletter_sub_id_idx'),
+        ),
+    ]
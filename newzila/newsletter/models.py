@@ -1,15 +1,24 @@
+import time
+from datetime import timedelta
+
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, CharField, F, Q, Value, When
+from django.db.models.functions import Coalesce, Concat, Trim
 from django.utils.translation import ugettext_lazy as _
 from django.utils.timezone import now
-from django.template.loader import select_template
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template import engines
 from django.urls import reverse
 from django.contrib.sites.models import Site
 
+from celery.exceptions import SoftTimeLimitExceeded
 from rest_framework.exceptions import ValidationError as APIValidationError
 
-from .utils import make_verification_token
+from .bloom import SubscriberFilter
+from .metrics import EMAIL_RENDER_SECONDS, send_messages
+from .rendering import MergeRenderer, cached_select_templates
+from .utils import make_subscription_token, make_verification_token
 
 AUTH_USER_MODEL = getattr(settings, 'AUTH_USER_MODEL', 'auth.User')
 
@@ -21,6 +30,8 @@ class Newsletter(models.Model):
     :slug: slug of Newsletter for resolving Newsletter URL
     :email: The sender email, used to create `from_email` variable
     :sender: The sender name, used to create `from_email` variable
+    :active_count:, :pending_count:, :unsubscribed_count: Number of subscriptions in each
+        `Subscription.state`, kept up to date by `Subscription`; `reconcile_subscriber_counts` repairs drift
     """
     title = models.CharField(
         max_length=200, verbose_name=_('newsletter title')
@@ -33,6 +44,12 @@ class Newsletter(models.Model):
         max_length=200, verbose_name=_('sender'), help_text=_('Sender name')
     )
 
+    active_count = models.IntegerField(default=0, editable=False, verbose_name=_('active subscribers'))
+    pending_count = models.IntegerField(default=0, editable=False, verbose_name=_('pending subscribers'))
+    unsubscribed_count = models.IntegerField(default=0, editable=False, verbose_name=_('unsubscribed subscribers'))
+
+    COUNT_FIELDS = ['active_count', 'pending_count', 'unsubscribed_count']
+
     TEMPLATE_ROOT = 'newsletter/message/'
 
     def __str__(self):
@@ -45,26 +62,87 @@ class Newsletter(models.Model):
     def get_templates(self):
         """
         Returns a subject, text, HTML templates tuple for sending subscription email
+
+        Resolved templates are cached per newsletter, see `rendering.clear_template_cache`.
         """
         tpl_subst = {
             'newsletter': self.slug
         }
 
-        subject_template = select_template([
-            self.TEMPLATE_ROOT + '%(newsletter)s/subject.txt' % tpl_subst,
-            self.TEMPLATE_ROOT + 'subject.txt',  # global template for subject message
+        return cached_select_templates(self.slug, [
+            [
+                self.TEMPLATE_ROOT + '%(newsletter)s/subject.txt' % tpl_subst,
+                self.TEMPLATE_ROOT + 'subject.txt',  # global template for subject message
+            ],
+            [
+                self.TEMPLATE_ROOT + '%(newsletter)s/text.txt' % tpl_subst,
+                self.TEMPLATE_ROOT + 'text.txt',
+            ],
+            [
+                self.TEMPLATE_ROOT + '%(newsletter)s/text.html' % tpl_subst,
+                self.TEMPLATE_ROOT + 'text.html',
+            ],
         ])
 
-        text_template = select_template([
-            self.TEMPLATE_ROOT + '%(newsletter)s/text.txt' % tpl_subst,
-            self.TEMPLATE_ROOT + 'text.txt',
-        ])
+    @classmethod
+    def update_subscriber_counts(cls, newsletter_id, **deltas):
+        """
+        Atomically add to the subscriber counts of a newsletter, e.g. `pending=-1, active=1`.
+        Keys are `Subscription` states.
+        """
+        updates = {'%s_count' % state: F('%s_count' % state) + delta for state, delta in deltas.items() if delta}
+        if updates:
+            cls.objects.filter(pk=newsletter_id).update(**updates)
+
+    # per-recipient variables of the verification email templates, see `rendering.MergeRenderer`
+    VERIFICATION_SLOTS = ['subscription.name', 'subscription.email', 'subscription.subscribe_verification_url']
+
+    def get_verification_renderer(self, site=None):
+        """Returns a renderer of the verification email templates, reusable for all subscriptions"""
+        return MergeRenderer(self.get_templates(), {
+            'newsletter': self,
+            'site': site or Site.objects.get_current(),
+            'STATIC_URL': settings.STATIC_URL,
+            'MEDIA_URL': settings.MEDIA_URL
+        }, self.VERIFICATION_SLOTS)
 
-        html_template = select_template([
-            self.TEMPLATE_ROOT + '%(newsletter)s/text.html' % tpl_subst,
-            self.TEMPLATE_ROOT + 'text.html',
-        ])
-        return subject_template, text_template, html_template
+
+class SubscriptionQuerySet(models.QuerySet):
+    def with_recipient(self):
+        """
+        Annotates `recipient_email` and `recipient_name`, the `email` and `name` of each subscription
+        computed in SQL, so they can be filtered on or read with `values_list` without loading instances.
+        """
+        return self.annotate(
+            recipient_email=Coalesce('user__email', 'email_field'),
+            recipient_name=Case(
+                When(user__isnull=True, then='name_field'),
+                # User.get_full_name()
+                default=Trim(Concat('user__first_name', Value(' '), 'user__last_name')),
+                output_field=CharField(),
+            ),
+        )
+
+    def pending_batches(self, size):
+        """
+        Ids of the pending subscriptions, oldest first, in lists of up to `size`.
+
+        Keyset pagination on (create_date, id), the order of the pending index: every batch is a short
+        range scan however many rows came before it, and rows changed between batches don't shift it.
+        """
+        pending = self.filter(self.model.STATES[self.model.PENDING]).order_by('create_date', 'pk')
+        cursor = None
+        while True:
+            batch = pending
+            if cursor is not None:
+                create_date, pk = cursor
+                batch = batch.filter(Q(create_date__gt=create_date) | Q(create_date=create_date, pk__gt=pk))
+            rows = list(batch.values_list('create_date', 'pk')[:size])
+            if rows:
+                yield [pk for create_date, pk in rows]
+            if len(rows) < size:
+                return
+            cursor = rows[-1]
 
 
 class Subscription(models.Model):
@@ -109,6 +187,31 @@ class Subscription(models.Model):
 
     is_active = models.BooleanField(default=False, blank=True)
 
+    objects = SubscriptionQuerySet.as_manager()
+
+    # states counted on the newsletter, derived from is_active and verification_date
+    ACTIVE = 'active'
+    PENDING = 'pending'
+    UNSUBSCRIBED = 'unsubscribed'
+    STATES = {
+        ACTIVE: Q(is_active=True),
+        PENDING: Q(is_active=False, verification_date__isnull=True),
+        UNSUBSCRIBED: Q(is_active=False, verification_date__isnull=False),
+    }
+
+    @property
+    def state(self):
+        if self.is_active:
+            return self.ACTIVE
+        return self.PENDING if self.verification_date is None else self.UNSUBSCRIBED
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'is_active' in field_names and 'verification_date' in field_names:
+            instance._saved_state = instance.state
+        return instance
+
     @property
     def email(self):
         if self.user:
@@ -148,14 +251,57 @@ class Subscription(models.Model):
     class Meta:
         verbose_name = _('subscription')
         verbose_name_plural = _('subscriptions')
-        unique_together = ('user', 'email_field', 'newsletter')
+        # NULL columns never collide in a plain unique index, so each subscriber kind gets its own partial one
+        constraints = [
+            models.UniqueConstraint(
+                fields=['newsletter', 'user'], condition=models.Q(user__isnull=False),
+                name='newsletter_subscription_unique_user',
+            ),
+            models.UniqueConstraint(
+                fields=['newsletter', 'email_field'], condition=models.Q(user__isnull=True),
+                name='newsletter_subscription_unique_email',
+            ),
+        ]
+        indexes = [
+            # the subscriber listing and export page through a newsletter's subscriptions in this order
+            models.Index(fields=['newsletter', 'id'], name='newsletter_sub_id_idx'),
+            # the reminder and purge tasks walk pending subscriptions in this order, see `pending_batches`
+            models.Index(fields=['is_active', 'verification_date', 'create_date', 'id'],
+                         name='newsletter_sub_pending_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         """
         Perform some validation and state maintenance of Subscription.
+
+        Duplicates are detected by the database constraints on insert rather than by a pre-read,
+        which is both cheaper and safe under concurrent subscribes.
         """
         self.pre_save_check(*args, **kwargs)
-        super(Subscription, self).save(*args, **kwargs)
+        if not self._state.adding:
+            with transaction.atomic():
+                super(Subscription, self).save(*args, **kwargs)
+                saved_state = getattr(self, '_saved_state', None)
+                if saved_state is not None and saved_state != self.state:
+                    Newsletter.update_subscriber_counts(self.newsletter_id, **{saved_state: -1, self.state: 1})
+            self._saved_state = self.state
+            return
+        try:
+            # savepoint, so a conflict doesn't break the surrounding (request) transaction
+            with transaction.atomic():
+                super(Subscription, self).save(*args, **kwargs)
+                Newsletter.update_subscriber_counts(self.newsletter_id, **{self.state: 1})
+        except IntegrityError:
+            raise APIValidationError(_('Already subscribed!'))
+        self._saved_state = self.state
+        if self.email_field:
+            SubscriberFilter(self.newsletter_id).add([self.email_field])
+
+    def delete(self, *args, **kwargs):
+        """Bulk and cascading deletes don't update the counts, see `reconcile_subscriber_counts`"""
+        with transaction.atomic():
+            Newsletter.update_subscriber_counts(self.newsletter_id, **{self.state: -1})
+            return super().delete(*args, **kwargs)
 
     def pre_save_check(self, *args, **kwargs):
         if not (self.user or self.email_field):
@@ -166,58 +312,331 @@ class Subscription(models.Model):
                 (self.email_field and not self.user)):
             raise APIValidationError(_('If user is set, email must be null and vice versa.'))
 
-        if self.already_subscribed():
-            raise APIValidationError(_('Already subscribed!'))
-
-    def already_subscribed(self):
-        if self.pk is not None:  # modifying/saving already created subscriptions
-            return False
-        q = Subscription.objects.filter(newsletter_id=self.newsletter.pk)
-        if self.user:
-            q = q.filter(user=self.user)
-        else:
-            q = q.filter(email_field__exact=self.email)
-        return q.exists()
+    def get_verification_email(self, renderer=None):
+        """
+        Returns the double opt-in message of the subscription, ready to be sent.
+        Pass the `Newsletter.get_verification_renderer` of the newsletter when building many of them.
+        """
+        if renderer is None:
+            renderer = self.newsletter.get_verification_renderer()
+        with EMAIL_RENDER_SECONDS.time(kind='verification'):
+            subject, text, html = renderer.render({
+                'subscription': self,
+                'date': self.create_date,
+            })
+
+            message = EmailMultiAlternatives(
+                subject.strip(), text,
+                from_email=self.newsletter.email,
+                to=[self.email]
+            )
+            message.attach_alternative(html, "text/html")
+        return message
 
     def send_verification_email(self):
-        email_context = {
-            'subscription': self,
-            'newsletter': self.newsletter,
-            'date': self.create_date,
-            'site': Site.objects.get_current(),
-            'STATIC_URL': settings.STATIC_URL,
-            'MEDIA_URL': settings.MEDIA_URL
-        }
+        send_messages(get_connection(), [self.get_verification_email()], 'verification')
 
-        (subject_template, text_template, html_template) = self.newsletter.get_templates()
-        subject = subject_template.render(email_context).strip()
-        text = text_template.render(email_context)
+    VERIFY = 'verify'
+    UNSUBSCRIBE = 'unsubscribe'
 
-        message = EmailMultiAlternatives(
-            subject, text,
-            from_email=self.newsletter.email,
-            to=[self.email]
-        )
-        message.attach_alternative(
-            html_template.render(email_context), "text/html"
-        )
-        message.send()
+    def get_verification_token(self):
+        """Signed verification token, expiring NEWSLETTER_VERIFICATION_TOKEN_MAX_AGE after subscribing"""
+        expires = self.create_date + timedelta(seconds=settings.NEWSLETTER_VERIFICATION_TOKEN_MAX_AGE)
+        return make_subscription_token(self, self.VERIFY, int(expires.timestamp()))
+
+    def get_unsubscribe_token(self):
+        """Signed unsubscribe token, expiring NEWSLETTER_UNSUBSCRIBE_TOKEN_MAX_AGE from now"""
+        expires = time.time() + settings.NEWSLETTER_UNSUBSCRIBE_TOKEN_MAX_AGE
+        return make_subscription_token(self, self.UNSUBSCRIBE, int(expires))
 
     def subscribe_verification_url(self):
         return reverse('api:newsletter-verification', kwargs={
             'slug': self.newsletter.slug,
-            'token': self.verification_token
+            'token': self.get_verification_token()
+        })
+
+    def unsubscribe_url(self):
+        return reverse('api:newsletter-unsubscribe-token', kwargs={
+            'slug': self.newsletter.slug,
+            'token': self.get_unsubscribe_token()
         })
 
     def subscribe_verify(self):
         if self.is_active:
             return
-        self.verification_date = now()
-        self.is_active = True
-        self.save()
+        verification_date = now()
+        if self.verify_by_pk(self.pk, self.newsletter_id, verification_date):
+            self.is_active, self.verification_date = True, verification_date
+            self._saved_state = self.state
 
     def subscribe_unsubscribe(self):
         if self.verification_date is None:
             APIValidationError(_("Your subscription is not verified"))
-        self.is_active = False
-        self.save()
+        if self.unsubscribe_by_pk(self.pk, self.newsletter_id):
+            self.is_active = False
+            self._saved_state = self.state
+
+    @classmethod
+    def verify_by_pk(cls, pk, newsletter_id, verification_date=None):
+        """
+        Activate a subscription without loading it. Returns False if it's active already or doesn't exist.
+        """
+        return cls._change_state(pk, newsletter_id, [
+            (cls.STATES[cls.PENDING], cls.PENDING, cls.ACTIVE),
+            (cls.STATES[cls.UNSUBSCRIBED], cls.UNSUBSCRIBED, cls.ACTIVE),
+        ], is_active=True, verification_date=verification_date or now())
+
+    @classmethod
+    def unsubscribe_by_pk(cls, pk, newsletter_id):
+        """
+        Deactivate a subscription without loading it. Returns False if it isn't active or doesn't exist.
+        """
+        return cls._change_state(pk, newsletter_id, [
+            (Q(is_active=True, verification_date__isnull=False), cls.ACTIVE, cls.UNSUBSCRIBED),
+            (Q(is_active=True, verification_date__isnull=True), cls.ACTIVE, cls.PENDING),  # activated unverified
+        ], is_active=False)
+
+    @classmethod
+    def _change_state(cls, pk, newsletter_id, moves, **values):
+        """
+        Try the `(condition, from state, to state)` moves in turn, each a single UPDATE matching the subscription
+        only if it meets the condition, and move it between the counts of its newsletter when one matches.
+        Being conditional, concurrent calls can't count a subscription twice.
+        """
+        subscriptions = cls.objects.filter(pk=pk, newsletter_id=newsletter_id)
+        with transaction.atomic():
+            for condition, from_state, to_state in moves:
+                if subscriptions.filter(condition).update(**values):
+                    Newsletter.update_subscriber_counts(newsletter_id, **{from_state: -1, to_state: 1})
+                    return True
+        return False
+
+
+class Issue(models.Model):
+    """
+    A newsletter issue (campaign) sent to all active subscribers of a newsletter.
+
+    :subject: Template of the email subject
+    :text: Template of the plain text body
+    :html: Template of the HTML body, optional
+    :dispatch_cursor: Highest subscription id handed over to an `IssueChunk` so far
+
+    Templates are rendered per recipient with `subscription`, `newsletter`, `issue`, `site`
+    and `unsubscribe_url` in the context.
+    """
+    DRAFT = 'draft'
+    SENDING = 'sending'
+    SENT = 'sent'
+    STATUS_CHOICES = (
+        (DRAFT, _('Draft')),
+        (SENDING, _('Sending')),
+        (SENT, _('Sent')),
+    )
+
+    newsletter = models.ForeignKey(
+        Newsletter, verbose_name=_('newsletter'), on_delete=models.CASCADE
+    )
+    subject = models.CharField(max_length=200, verbose_name=_('subject'))
+    text = models.TextField(verbose_name=_('text'))
+    html = models.TextField(verbose_name=_('HTML'), blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=DRAFT)
+    create_date = models.DateTimeField(editable=False, default=now)
+    dispatch_cursor = models.PositiveIntegerField(default=0, editable=False)
+    dispatch_date = models.DateTimeField(verbose_name=_('Dispatch date'), blank=True, null=True)
+    sent_date = models.DateTimeField(verbose_name=_('Sent date'), blank=True, null=True)
+
+    def __str__(self):
+        return self.subject
+
+    class Meta:
+        verbose_name = _('issue')
+        verbose_name_plural = _('issues')
+
+    # per-recipient variables of the issue templates, see `rendering.MergeRenderer`
+    SLOTS = ['subscription.name', 'subscription.email', 'unsubscribe_url']
+
+    def get_templates(self):
+        """Returns the compiled subject, text and (if any) HTML templates of the issue"""
+        engine = engines['django']
+        return (
+            engine.from_string(self.subject),
+            engine.from_string(self.text),
+            engine.from_string(self.html) if self.html else None,
+        )
+
+    def get_renderer(self, site):
+        """Returns a renderer of the issue templates, create it once and use it for all recipients"""
+        return MergeRenderer(self.get_templates(), {
+            'newsletter': self.newsletter,
+            'issue': self,
+            'site': site,
+            'STATIC_URL': settings.STATIC_URL,
+            'MEDIA_URL': settings.MEDIA_URL
+        }, self.SLOTS)
+
+    def get_message(self, subscription, renderer):
+        """Returns the message of the issue for one recipient"""
+        with EMAIL_RENDER_SECONDS.time(kind='issue'):
+            unsubscribe_url = 'http://%s%s' % (renderer.context['site'].domain, subscription.unsubscribe_url())
+            subject, text, html = renderer.render({
+                'subscription': subscription,
+                'unsubscribe_url': unsubscribe_url,
+            })
+            message = EmailMultiAlternatives(
+                subject.strip(), text,
+                from_email=self.newsletter.email,
+                to=[subscription.email],
+                headers={'List-Unsubscribe': '<%s>' % unsubscribe_url},
+            )
+            if html is not None:
+                message.attach_alternative(html, "text/html")
+        return message
+
+    def send(self):
+        """Start (or resume) sending the issue in the background"""
+        from .tasks import dispatch_issue
+        transaction.on_commit(lambda: dispatch_issue.delay(self.pk))
+
+
+class IssueChunk(models.Model):
+    """
+    A slice of the recipients of an issue, sent by a single task over one connection.
+
+    :first_id:, :last_id: Subscription id range of the chunk, both inclusive
+    :last_sent_id: Subscription id of the last recipient sent to, so an interrupted chunk resumes after it
+    :claim_date: When a worker started sending the chunk
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (SENDING, _('Sending')),
+        (SENT, _('Sent')),
+    )
+
+    issue = models.ForeignKey(Issue, related_name='chunks', on_delete=models.CASCADE)
+    first_id = models.PositiveIntegerField()
+    last_id = models.PositiveIntegerField()
+    last_sent_id = models.PositiveIntegerField(default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    claim_date = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = _('issue chunk')
+        verbose_name_plural = _('issue chunks')
+
+    def __str__(self):
+        return '%s [%d-%d]' % (self.issue, self.first_id, self.last_id)
+
+    def get_recipients(self):
+        """Active subscriptions of the chunk not sent to yet, in id order"""
+        return Subscription.objects.filter(
+            newsletter_id=self.issue.newsletter_id, is_active=True,
+            pk__gt=max(self.last_sent_id, self.first_id - 1), pk__lte=self.last_id,
+        ).select_related('user').order_by('pk')
+
+
+class EmailOutbox(models.Model):
+    """
+    An email to send, written in the transaction of the workflow that sends it, so it is sent
+    if and only if that transaction commits. Drained by `tasks.drain_email_outbox`, see `send_batch`.
+
+    :kind: What to send to the subscription, rendered when sent; a reminder is the verification email again
+    :attempts: Number of send attempts so far
+    :next_attempt_date: Not sent before this date, pushed back after every failed attempt
+    """
+    VERIFICATION = 'verification'
+    REMINDER = 'reminder'
+    KIND_CHOICES = (
+        (VERIFICATION, _('Verification')),
+        (REMINDER, _('Verification reminder')),
+    )
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (SENT, _('Sent')),
+        (FAILED, _('Failed')),
+    )
+
+    subscription = models.ForeignKey(Subscription, related_name='outbox', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    create_date = models.DateTimeField(editable=False, default=now)
+    next_attempt_date = models.DateTimeField(default=now)
+    sent_date = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = _('outgoing email')
+        verbose_name_plural = _('outgoing emails')
+        indexes = [
+            # the drainer's claim query
+            models.Index(fields=['status', 'next_attempt_date'], name='newsletter_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return '%s to %s' % (self.kind, self.subscription)
+
+    def get_message(self, renderers):
+        """Renders the email, `renderers` caches a renderer per newsletter for the whole batch"""
+        renderer = renderers.get(self.subscription.newsletter_id)
+        if renderer is None:
+            renderer = renderers[self.subscription.newsletter_id] = \
+                self.subscription.newsletter.get_verification_renderer()
+        return self.subscription.get_verification_email(renderer)
+
+    @classmethod
+    def send_batch(cls, connection, limit, deadline=None):
+        """
+        Claims up to `limit` due emails, sends them over `connection` and marks each sent or failed.
+        Returns the number of claimed emails. The connection is opened once there is something to send.
+
+        Claimed rows stay locked until all are marked; concurrent drainers skip them instead of waiting
+        (SKIP LOCKED, where the database supports it). If the drainer dies half way its transaction rolls
+        back and the whole batch is sent again: delivery is at least once, duplicates stay rare.
+        Past the `deadline` (a `time.monotonic()` value) or on a soft time limit nothing more is sent,
+        the emails sent so far are marked and the rest stays pending.
+        """
+        interrupted = None
+        with transaction.atomic():
+            emails = list(cls.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+                status=cls.PENDING, next_attempt_date__lte=now(),
+            ).select_related('subscription__newsletter', 'subscription__user').order_by('pk')[:limit])
+            if emails:
+                connection.open()
+            renderers = {}
+            sent = []
+            for email in emails:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                try:
+                    if not send_messages(connection, [email.get_message(renderers)], email.kind):
+                        raise ValueError("Not accepted by the email backend")
+                except SoftTimeLimitExceeded as e:
+                    interrupted = e
+                    break
+                except Exception as e:
+                    email.fail(e)
+                else:
+                    sent.append(email.pk)
+            cls.objects.filter(pk__in=sent).update(status=cls.SENT, sent_date=now(), attempts=F('attempts') + 1)
+        if interrupted is not None:
+            raise interrupted
+        return len(emails)
+
+    def fail(self, error):
+        """Retries later, with a doubling delay, until NEWSLETTER_OUTBOX_MAX_ATTEMPTS are made"""
+        self.attempts += 1
+        self.last_error = repr(error)
+        if self.attempts >= settings.NEWSLETTER_OUTBOX_MAX_ATTEMPTS:
+            self.status = self.FAILED
+        else:
+            delay = settings.NEWSLETTER_OUTBOX_RETRY_DELAY * 2 ** (self.attempts - 1)
+            self.next_attempt_date = now() + timedelta(seconds=delay)
+        self.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_date'])
@@ -0,0 +1,198 @@
+""" Resolution and rendering of newsletter email templates """
+import os
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.template import engines
+from django.template.loader import select_template
+from django.utils.crypto import get_random_string
+from django.utils.html import conditional_escape
+
+TemplateSet = namedtuple('TemplateSet', ['templates', 'mtimes'])
+
+_template_sets = {}
+
+
+def cached_select_templates(key, candidates):
+    """
+    Returns a tuple with the `select_template` result of each list of template names in `candidates`.
+
+    Resolved and compiled templates are cached under `key`, so template discovery happens once per key.
+    With DEBUG on, the cache entry is dropped as soon as one of its template files changes.
+    """
+    template_set = _template_sets.get(key)
+    if template_set is not None and not (settings.DEBUG and _mtimes(template_set.templates) != template_set.mtimes):
+        return template_set.templates
+    if template_set is not None:
+        _reset_loaders()  # a cached loader would hand out the outdated template again
+
+    templates = tuple(select_template(names) for names in candidates)
+    _template_sets[key] = TemplateSet(templates, _mtimes(templates) if settings.DEBUG else None)
+    return templates
+
+
+def clear_template_cache(key=None):
+    """
+    Forget the cached templates of `key`, or all of them.
+    Needed after adding template overrides, which mtime checks can't notice.
+    """
+    if key is None:
+        _template_sets.clear()
+    else:
+        _template_sets.pop(key, None)
+    _reset_loaders()
+
+
+def _mtimes(templates):
+    mtimes = []
+    for template in templates:
+        origin = getattr(template, 'origin', None)
+        try:
+            mtimes.append(os.path.getmtime(origin.name))
+        except (AttributeError, TypeError, OSError):
+            mtimes.append(None)
+    return mtimes
+
+
+def _reset_loaders():
+    for engine in engines.all():
+        for loader in getattr(getattr(engine, 'engine', None), 'template_loaders', []):
+            if hasattr(loader, 'reset'):
+                loader.reset()
+
+
+class SlotProxy:
+    """Stands in for a per-recipient object while rendering a skeleton, exposing only its slot attributes"""
+
+    def __init__(self, attributes):
+        self._attributes = attributes
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_attributes'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class MergeRenderer:
+    """
+    Renders the same templates for many recipients.
+
+    The per-recipient `slots` (variable paths like 'subscription.name') are replaced by placeholders and
+    each template is rendered once into a skeleton; recipients are then filled in by string substitution.
+    The output is identical to a full render: skeletons are built per "shape" (which slots are empty),
+    are checked against a second placeholder render and against the full render of a real recipient.
+    Templates that use the slots in any other way (filters, comparisons, other per-recipient variables)
+    fail those checks and are always rendered in full.
+    """
+    ESCAPED = '&amp;'
+
+    def __init__(self, templates, context, slots):
+        """
+        :templates: compiled templates, None entries render None
+        :context: context shared by all recipients
+        :slots: variable paths whose values differ per recipient, resolved from the recipient context
+        """
+        self.templates = templates
+        self.context = context
+        self.slots = [slot.split('.') for slot in slots]
+        self._samples = {}  # shape -> (values, full render) of the first recipient of that shape
+        self._skeletons = {}  # shape -> skeleton (None for templates that can't be merged) of each template
+
+    def render(self, recipient_context):
+        """
+        Returns the rendered output of every template for a recipient.
+        :recipient_context: the per-recipient part of the context, as a full render would need it
+        """
+        values = [self._resolve(recipient_context, path) for path in self.slots]
+        if any(value is not None and not isinstance(value, str) for value in values):
+            return self.render_full(recipient_context)
+
+        shape = tuple(bool(value) or value for value in values)
+        skeletons = self._skeletons.get(shape)
+        if skeletons is None:
+            if shape not in self._samples:
+                output = self.render_full(recipient_context)
+                self._samples[shape] = (values, output)
+                return output
+            skeletons = self._skeletons[shape] = self._build_skeletons(shape)
+
+        output = []
+        for template, skeleton in zip(self.templates, skeletons):
+            if template is None:
+                output.append(None)
+            elif skeleton is None:
+                output.append(template.render(dict(self.context, **recipient_context)))
+            else:
+                output.append(self._fill(skeleton, values))
+        return output
+
+    def render_full(self, recipient_context):
+        context = dict(self.context, **recipient_context)
+        return [template.render(context) if template is not None else None for template in self.templates]
+
+    def _build_skeletons(self, shape):
+        sample_values, sample_output = self._samples.pop(shape)
+        nonce = get_random_string(8)
+        check_nonce = get_random_string(16)  # a different length too, to catch filters like |length
+        skeletons = []
+        for template, sample in zip(self.templates, sample_output):
+            if template is None:
+                skeletons.append(None)
+                continue
+            skeleton = self._parse(template.render(self._placeholder_context(shape, nonce)), nonce)
+            check = template.render(self._placeholder_context(shape, check_nonce))
+            if (check != self._fill(skeleton, self._placeholders(shape, check_nonce))
+                    or sample != self._fill(skeleton, sample_values)):
+                skeleton = None
+            skeletons.append(skeleton)
+        return skeletons
+
+    def _placeholders(self, shape, nonce):
+        # '&' shows whether the template engine escaped the slot
+        return [
+            '{{%s:%d&}}' % (nonce, index) if truthy is True else truthy
+            for index, truthy in enumerate(shape)
+        ]
+
+    def _placeholder_context(self, shape, nonce):
+        context = dict(self.context)
+        objects = {}
+        for path, value in zip(self.slots, self._placeholders(shape, nonce)):
+            if len(path) == 1:
+                context[path[0]] = value
+            else:
+                objects.setdefault(path[0], {})[path[1]] = value
+        for name, attributes in objects.items():
+            context[name] = SlotProxy(attributes)
+        return context
+
+    def _parse(self, output, nonce):
+        """Split a placeholder render into literal strings and (slot index, escaped) pairs"""
+        skeleton = []
+        position = 0
+        for match in re.finditer(r'\{\{%s:(\d+)(&amp;|&)\}\}' % nonce, output):
+            skeleton.append(output[position:match.start()])
+            skeleton.append((int(match.group(1)), match.group(2) == self.ESCAPED))
+            position = match.end()
+        skeleton.append(output[position:])
+        return skeleton
+
+    @staticmethod
+    def _fill(skeleton, values):
+        parts = []
+        for part in skeleton:
+            if isinstance(part, str):
+                parts.append(part)
+            else:
+                index, escaped = part
+                parts.append(conditional_escape(values[index]) if escaped else values[index])
+        return ''.join(parts)
+
+    @staticmethod
+    def _resolve(context, path):
+        value = context.get(path[0])
+        for attribute in path[1:]:
+            value = getattr(value, attribute, None)
+        return value() if callable(value) else value
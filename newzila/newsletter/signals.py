@@ -0,0 +1,26 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import invalidate_newsletter
+from .models import Newsletter
+from .rendering import clear_template_cache
+
+
+@receiver(pre_save, sender=Newsletter)
+def invalidate_renamed_newsletter_cache(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    old_slug = Newsletter.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+    if old_slug and old_slug != instance.slug:
+        invalidate_newsletter(old_slug)
+        transaction.on_commit(lambda: invalidate_newsletter(old_slug))
+
+
+@receiver(post_save, sender=Newsletter)
+@receiver(post_delete, sender=Newsletter)
+def invalidate_newsletter_cache(sender, instance, **kwargs):
+    invalidate_newsletter(instance.slug)
+    clear_template_cache(instance.slug)
+    # once more after commit, in case a concurrent request cached the old row in between
+    transaction.on_commit(lambda: invalidate_newsletter(instance.slug))
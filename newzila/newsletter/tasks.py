@@ -0,0 +1,183 @@
+import time
+from collections import Counter
+from datetime import timedelta
+
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils.timezone import now
+
+from config import celery_app
+
+from .metrics import send_messages
+from .models import EmailOutbox, Issue, IssueChunk, Newsletter, Subscription
+
+
+@celery_app.task()
+def drain_email_outbox():
+    """
+    Send the due emails of the outbox, a batch of NEWSLETTER_EMAIL_BATCH_SIZE at a time over one connection,
+    until none are left or NEWSLETTER_OUTBOX_DRAIN_SECONDS have passed.
+    Scheduled by Celery beat and enqueued whenever emails are added; concurrent runs claim different emails.
+    """
+    deadline = time.monotonic() + settings.NEWSLETTER_OUTBOX_DRAIN_SECONDS
+    claimed = 0
+    connection = get_connection()  # opened by the first batch with emails, most runs find none
+    try:
+        while time.monotonic() < deadline:
+            batch = EmailOutbox.send_batch(connection, settings.NEWSLETTER_EMAIL_BATCH_SIZE, deadline)
+            claimed += batch
+            if batch < settings.NEWSLETTER_EMAIL_BATCH_SIZE:
+                break
+    finally:
+        connection.close()
+    return claimed
+
+
+@celery_app.task()
+def remind_pending_subscriptions():
+    """
+    Queue a single reminder, the verification email again, for the subscriptions still pending
+    NEWSLETTER_PENDING_REMINDER_AFTER seconds after subscribing. Those due for purging are left alone.
+    Scheduled by Celery beat; works in keyset batches of NEWSLETTER_PENDING_BATCH_SIZE, a transaction each.
+    """
+    started = now()
+    due = Subscription.objects.filter(
+        create_date__lte=started - timedelta(seconds=settings.NEWSLETTER_PENDING_REMINDER_AFTER),
+        create_date__gt=started - timedelta(seconds=settings.NEWSLETTER_PENDING_PURGE_AFTER),
+    ).exclude(pk__in=EmailOutbox.objects.filter(kind=EmailOutbox.REMINDER).values('subscription_id'))
+    reminded = 0
+    for ids in due.pending_batches(settings.NEWSLETTER_PENDING_BATCH_SIZE):
+        with transaction.atomic():
+            EmailOutbox.objects.bulk_create(EmailOutbox(subscription_id=pk, kind=EmailOutbox.REMINDER) for pk in ids)
+        reminded += len(ids)
+    if reminded:
+        drain_email_outbox.delay()
+    return reminded
+
+
+@celery_app.task()
+def purge_pending_subscriptions():
+    """
+    Delete the subscriptions still pending NEWSLETTER_PENDING_PURGE_AFTER seconds after subscribing, by default
+    once their verification link has expired, and update the subscriber counts.
+    Scheduled by Celery beat; works in keyset batches of NEWSLETTER_PENDING_BATCH_SIZE, a transaction each.
+    Deleted emails stay in the subscriber filters until they're rebuilt.
+    """
+    stale = Subscription.objects.filter(
+        create_date__lte=now() - timedelta(seconds=settings.NEWSLETTER_PENDING_PURGE_AFTER)
+    )
+    deleted = 0
+    for ids in stale.pending_batches(settings.NEWSLETTER_PENDING_BATCH_SIZE):
+        with transaction.atomic():
+            # locked and checked again, a subscription verified since the batch was read is kept
+            rows = list(stale.filter(Subscription.STATES[Subscription.PENDING], pk__in=ids).select_for_update(
+            ).values_list('pk', 'newsletter_id'))
+            Subscription.objects.filter(pk__in=[pk for pk, newsletter_id in rows]).delete()
+            for newsletter_id, count in Counter(newsletter_id for pk, newsletter_id in rows).items():
+                Newsletter.update_subscriber_counts(newsletter_id, **{Subscription.PENDING: -count})
+        deleted += len(rows)
+    return deleted
+
+
+@celery_app.task()
+def dispatch_issue(issue_id):
+    """
+    Split the active subscribers of an issue into chunks and enqueue a sending task for each.
+
+    Subscriptions are walked with keyset pagination on id and the cursor is persisted with every chunk,
+    so running the task again resumes an interrupted dispatch: unfinished chunks are enqueued again
+    and new chunks start after the cursor. Finished chunks are never sent twice.
+
+    The cursor only moves forward from the value this run last saw, so of overlapping runs (a retry
+    next to a live one) the first one to move it carries on and the others stop. A run reaching the
+    soft time limit hands over to a fresh one, which carries on from the saved cursor.
+    """
+    issue = Issue.objects.get(pk=issue_id)
+    if issue.status == Issue.SENT:
+        return
+    Issue.objects.filter(pk=issue.pk).update(status=Issue.SENDING)
+
+    try:
+        # chunks claimed by a worker that died (or was never run) are handed out again
+        stale = now() - timedelta(seconds=settings.NEWSLETTER_ISSUE_CHUNK_STALE_AFTER)
+        IssueChunk.objects.filter(issue=issue, status=IssueChunk.SENDING, claim_date__lt=stale).update(
+            status=IssueChunk.PENDING
+        )
+        for chunk_id in issue.chunks.filter(status=IssueChunk.PENDING).values_list('pk', flat=True):
+            send_issue_chunk.delay(chunk_id)
+
+        cursor = issue.dispatch_cursor
+        while True:
+            ids = list(Subscription.objects.filter(
+                newsletter_id=issue.newsletter_id, is_active=True, pk__gt=cursor
+            ).order_by('pk').values_list('pk', flat=True)[:settings.NEWSLETTER_ISSUE_CHUNK_SIZE])
+            if not ids:
+                break
+            with transaction.atomic():
+                if not Issue.objects.filter(pk=issue.pk, dispatch_cursor=cursor).update(dispatch_cursor=ids[-1]):
+                    return  # another run moved the cursor, it dispatches the rest
+                cursor = ids[-1]
+                chunk = IssueChunk.objects.create(issue=issue, first_id=ids[0], last_id=cursor)
+                transaction.on_commit(lambda chunk_id=chunk.pk: send_issue_chunk.delay(chunk_id))
+    except SoftTimeLimitExceeded:
+        # carry on from the saved cursor in a fresh task
+        dispatch_issue.delay(issue.pk)
+        return
+
+    Issue.objects.filter(pk=issue.pk, dispatch_date__isnull=True).update(dispatch_date=now())
+    _finish_issue(issue.pk)
+
+
+@celery_app.task()
+def send_issue_chunk(chunk_id):
+    """
+    Send an issue to the recipients of a chunk over a single connection.
+    Progress is persisted after every message, an interrupted chunk resumes after the last sent recipient.
+    """
+    claimed = IssueChunk.objects.filter(pk=chunk_id, status=IssueChunk.PENDING).update(
+        status=IssueChunk.SENDING, claim_date=now()
+    )
+    if not claimed:  # sent already or being sent by another worker
+        return
+    chunk = IssueChunk.objects.select_related('issue__newsletter').get(pk=chunk_id)
+    issue = chunk.issue
+    renderer = issue.get_renderer(Site.objects.get_current())
+
+    recipients = list(chunk.get_recipients())
+    connection = get_connection()
+    if recipients:  # none left when resuming a chunk interrupted after its last email
+        connection.open()
+    try:
+        for subscription in recipients:
+            subscription.newsletter = issue.newsletter
+            send_messages(connection, [issue.get_message(subscription, renderer)], 'issue')
+            chunk.last_sent_id = subscription.pk
+            chunk.sent_count += 1
+            IssueChunk.objects.filter(pk=chunk.pk).update(
+                last_sent_id=chunk.last_sent_id, sent_count=chunk.sent_count
+            )
+    except SoftTimeLimitExceeded:
+        # hand the rest of the chunk to a fresh task
+        IssueChunk.objects.filter(pk=chunk.pk).update(status=IssueChunk.PENDING)
+        send_issue_chunk.delay(chunk.pk)
+        return
+    except Exception:
+        # released for the next dispatch_issue run, which resumes after the last sent recipient
+        IssueChunk.objects.filter(pk=chunk.pk).update(status=IssueChunk.PENDING)
+        raise
+    finally:
+        connection.close()
+
+    IssueChunk.objects.filter(pk=chunk.pk).update(status=IssueChunk.SENT)
+    _finish_issue(issue.pk)
+
+
+def _finish_issue(issue_id):
+    """Mark the issue sent once it's fully dispatched and all its chunks are sent"""
+    unsent_chunks = IssueChunk.objects.filter(issue_id=issue_id).exclude(status=IssueChunk.SENT)
+    Issue.objects.filter(pk=issue_id, dispatch_date__isnull=False).exclude(
+        pk__in=unsent_chunks.values('issue_id')
+    ).update(status=Issue.SENT, sent_date=now())
@@ -0,0 +1,14 @@
+import pytest
+from django.core.cache import cache
+
+from newzila.newsletter.cache import local_cache
+from newzila.newsletter.rendering import clear_template_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Database changes are rolled back between tests, cached copies of them must go too"""
+    yield
+    cache.clear()
+    local_cache.clear()
+    clear_template_cache()
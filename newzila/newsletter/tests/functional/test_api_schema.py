@@ -0,0 +1,50 @@
+from unittest import mock
+
+from rest_framework.schemas import SchemaGenerator
+
+from config.api_router import schema_view
+from newzila.testcases import WebTestCase
+
+
+class SchemaViewTest(WebTestCase):
+    is_anonymous = True
+    url = '/api/docs/?format=openapi'
+
+    def setUp(self):
+        super().setUp()
+        schema_view.view_class.schemas.clear()
+        self.addCleanup(schema_view.view_class.schemas.clear)
+
+    def test_generates_schema_once(self):
+        with mock.patch.object(SchemaGenerator, 'get_schema', autospec=True,
+                               side_effect=SchemaGenerator.get_schema) as get_schema:
+            first = self.app.get(self.url)
+            second = self.app.get(self.url)
+
+        self.assertEqual(1, get_schema.call_count)
+        self.assertEqual(first.body, second.body)
+        self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+        self.assertIn('/api/newsletter/{slug}/subscribe/', first.json['paths'])
+
+    def test_not_modified(self):
+        etag = self.app.get(self.url).headers['ETag']
+
+        response = self.app.get(self.url, headers={'If-None-Match': etag}, status=304)
+        self.assertEqual(etag, response.headers['ETag'])
+        self.assertEqual(b'', response.body)
+
+    def test_schema_per_audience(self):
+        anonymous = self.app.get(self.url)
+        self.user_1.is_staff = True
+        self.user_1.save()
+        staff = self.app.get(self.url, user=self.user_1)
+
+        self.assertNotIn('/api/newsletter/{slug}/subscriptions/', anonymous.json['paths'])
+        self.assertIn('/api/newsletter/{slug}/subscriptions/', staff.json['paths'])
+        self.assertNotEqual(anonymous.headers['ETag'], staff.headers['ETag'])
+
+    def test_swagger_ui(self):
+        response = self.app.get('/api/docs/', headers={'Accept': 'text/html'})
+
+        self.assertIn('text/html', response.headers['Content-Type'])
+        self.assertNotIn('ETag', response.headers)
@@ -0,0 +1,59 @@
+from django.urls import reverse
+from django.core import mail
+
+from newzila.testcases import WebTestCase, OnCommitMixin
+from newzila.newsletter.tests.factories import NewsletterFactory
+from newzila.newsletter.models import Subscription
+
+
+class TestBulkSubscription(OnCommitMixin, WebTestCase):
+    is_staff = True
+    csrf_checks = False
+
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+        self.url = reverse('api:newsletter-subscribe-bulk', kwargs={'slug': self.newsletter.slug})
+
+    def test_reports_outcome_per_item(self):
+        Subscription.objects.create(newsletter=self.newsletter, email_field='old@example.com')
+        post_params = {'subscribers': [
+            {'email_field': 'new@example.com', 'name_field': 'New'},
+            {'email_field': 'old@example.com'},
+            {'email_field': 'not-an-email'},
+            {'email_field': 'new@EXAMPLE.com'},  # same as the first one once normalized
+        ]}
+        response = self.app.post_json(self.url, params=post_params, user=self.user)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, response.json['created'])
+        self.assertEqual(2, response.json['already_subscribed'])
+        self.assertEqual(1, response.json['invalid'])
+        statuses = [result['status'] for result in response.json['results']]
+        self.assertEqual(['created', 'already_subscribed', 'invalid', 'already_subscribed'], statuses)
+        self.assertIn('email_field', response.json['results'][2]['errors'])
+
+        subscription = Subscription.objects.get(newsletter=self.newsletter, email_field='new@example.com')
+        self.assertEqual('New', subscription.name_field)
+        self.assertFalse(subscription.is_active)
+        self.newsletter.refresh_from_db()
+        self.assertEqual(2, self.newsletter.pending_count)
+
+    def test_verification_emails_sent_in_batches(self):
+        emails = ['subscriber-%d@example.com' % i for i in range(5)]
+        with self.settings(NEWSLETTER_BULK_CHUNK_SIZE=2, NEWSLETTER_EMAIL_BATCH_SIZE=2):
+            self.app.post_json(self.url, params={'subscribers': [{'email_field': e} for e in emails]},
+                               user=self.user)
+
+        self.assertEqual(5, Subscription.objects.filter(newsletter=self.newsletter).count())
+        self.assertEqual(sorted(emails), sorted(message.to[0] for message in mail.outbox))
+
+    def test_requires_staff(self):
+        response = self.app.post_json(self.url, params={'subscribers': [{'email_field': 'a@example.com'}]},
+                                      user=self.user_1, expect_errors=True)
+        self.assertEqual(403, response.status_code)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_rejects_empty_batch(self):
+        response = self.app.post_json(self.url, params={'subscribers': []}, user=self.user, expect_errors=True)
+        self.assertEqual(400, response.status_code)
@@ -0,0 +1,146 @@
+import logging
+from io import StringIO
+
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+
+from newzila.newsletter.cache import get_newsletter
+from newzila.newsletter.models import Subscription
+from newzila.newsletter.tests.factories import NewsletterFactory
+from newzila.testcases import QueryBudgetMixin, WebTestCase
+from newzila.users.tests.factories import UserFactory
+from newzila.utils.middleware import QueryInstrumentationMiddleware
+
+
+class NewsletterViewSetQueryBudgetTest(QueryBudgetMixin, WebTestCase):
+    """
+    Upper bounds of the queries run by each `NewsletterViewSet` action, with the newsletter cached.
+    Raise a budget only for a query that's really needed. Every (un)subscription updates the subscriber
+    counts of its newsletter too, and every subscription queues its verification email in the outbox.
+    """
+    is_anonymous = True
+    csrf_checks = False
+
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+        get_newsletter(self.newsletter.slug)  # steady state: resolved from the cache
+        self.kwargs = {'slug': self.newsletter.slug}
+
+    def subscription(self, **kwargs):
+        return Subscription.objects.create(newsletter=self.newsletter, email_field='reader@example.com', **kwargs)
+
+    def test_retrieve(self):
+        with self.assertQueryBudget(1):  # not cached, for current subscriber counts
+            self.app.get(reverse('api:newsletter-detail', kwargs=self.kwargs))
+
+    def test_subscribe_anonymous(self):
+        with self.assertQueryBudget(3):
+            self.app.post_json(reverse('api:newsletter-subscribe', kwargs=self.kwargs),
+                               params={'email_field': 'reader@example.com'})
+
+    def test_subscribe_user(self):
+        self.client.force_login(self.user_1)
+        with self.assertQueryBudget(5):  # session, user, the insert, the counts and the outbox
+            self.client.post(reverse('api:newsletter-subscribe', kwargs=self.kwargs))
+
+    def test_subscribe_bulk(self):
+        self.user_1.is_staff = True
+        self.user_1.save()
+        self.client.force_login(self.user_1)
+        subscribers = [{'email_field': 'reader-%d@example.com' % i} for i in range(50)]
+        # session, user, existing subscriptions, insert, counts, (without RETURNING support) the new ids and outbox
+        with self.assertQueryBudget(7):
+            self.client.post(reverse('api:newsletter-subscribe-bulk', kwargs=self.kwargs),
+                             {'subscribers': subscribers}, content_type='application/json')
+
+    def test_subscribe_bulk_with_subscriber_filter(self):
+        call_command('rebuild_subscriber_filters', self.newsletter.slug, stdout=StringIO())
+        self.user_1.is_staff = True
+        self.user_1.save()
+        self.client.force_login(self.user_1)
+        subscribers = [{'email_field': 'reader-%d@example.com' % i} for i in range(50)]
+        with self.assertQueryBudget(6):  # all new, the filter saves looking up existing subscriptions
+            self.client.post(reverse('api:newsletter-subscribe-bulk', kwargs=self.kwargs),
+                             {'subscribers': subscribers}, content_type='application/json')
+
+    def test_subscriptions_per_page(self):
+        self.user_1.is_staff = True
+        self.user_1.save()
+        self.client.force_login(self.user_1)
+        for i in range(10):
+            user = UserFactory()
+            Subscription.objects.create(newsletter=self.newsletter, user=user)
+            Subscription.objects.create(newsletter=self.newsletter, email_field='reader-%d@example.com' % i)
+        url = reverse('api:newsletter-subscriptions', kwargs=self.kwargs)
+        for page_size in (2, 20):
+            with self.assertQueryBudget(3):  # session, user and the page, with the users of its subscriptions
+                self.client.get(url, {'page_size': page_size})
+
+    def test_verification(self):
+        subscription = self.subscription()
+        with self.assertQueryBudget(2):
+            self.app.get(subscription.subscribe_verification_url())
+
+    def test_legacy_verification(self):
+        subscription = self.subscription()
+        with self.assertQueryBudget(3):
+            self.app.get(reverse('api:newsletter-verification', kwargs=dict(
+                self.kwargs, token=subscription.verification_token
+            )))
+
+    def test_unsubscribe_user(self):
+        Subscription.objects.create(newsletter=self.newsletter, user=self.user_1, is_active=True,
+                                    verification_date=now())
+        self.client.force_login(self.user_1)
+        with self.assertQueryBudget(5):  # session, user, the subscription, its update and the counts
+            self.client.get(reverse('api:newsletter-unsubscribe', kwargs=dict(self.kwargs, email=self.user_1.email)))
+
+    def test_unsubscribe_token(self):
+        subscription = self.subscription(is_active=True, verification_date=now())
+        with self.assertQueryBudget(2):
+            self.app.get(subscription.unsubscribe_url())
+
+
+@override_settings(MIDDLEWARE=[
+    'newzila.utils.middleware.QueryInstrumentationMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+])
+class QueryInstrumentationMiddlewareTest(WebTestCase):
+    is_anonymous = True
+
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+
+    def test_reports_queries(self):
+        url = reverse('api:newsletter-detail', kwargs={'slug': self.newsletter.slug})
+        with self.assertLogs('newzila.utils.middleware', logging.INFO) as logs:
+            response = self.app.get(url)
+
+        self.assertRegex(response.headers['Server-Timing'], r'^db;dur=[0-9.]+;desc="1 queries, 0 duplicated"$')
+        record = logs.records[0]
+        self.assertEqual(logging.INFO, record.levelno)
+        self.assertEqual((url, 200, 1), (record.path, record.status, record.query_count))
+
+    def test_warns_about_duplicated_queries(self):
+        def view(request):
+            for pk in (1, 2):
+                Subscription.objects.filter(pk=pk).exists()
+            response = HttpResponse()
+            response['Server-Timing'] = 'app;dur=1'
+            return response
+
+        middleware = QueryInstrumentationMiddleware(view)
+        with self.assertLogs('newzila.utils.middleware', logging.INFO) as logs:
+            response = middleware(RequestFactory().get('/'))
+
+        self.assertRegex(response['Server-Timing'], r'^app;dur=1, db;dur=[0-9.]+;desc="2 queries, 1 duplicated"$')
+        record = logs.records[0]
+        self.assertEqual(logging.WARNING, record.levelno)
+        self.assertEqual(1, len(record.duplicate_queries))
+        self.assertEqual(2, record.duplicate_queries[0]['count'])
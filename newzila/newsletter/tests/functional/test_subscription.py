@@ -1,12 +1,15 @@
+from datetime import timedelta
+
 from django.urls import reverse
 from django.core import mail
+from django.utils.timezone import now
 
-from newzila.testcases import WebTestCase, EmailsMixin
+from newzila.testcases import WebTestCase, EmailsMixin, OnCommitMixin
 from newzila.newsletter.tests.factories import NewsletterFactory
 from newzila.newsletter.models import Subscription
 
 
-class TestNewsletterViewSet(EmailsMixin, WebTestCase):
+class TestNewsletterViewSet(OnCommitMixin, EmailsMixin, WebTestCase):
     is_anonymous = True
     csrf_checks = False
 
@@ -33,6 +36,20 @@ class TestNewsletterViewSet(EmailsMixin, WebTestCase):
         self.assertEqual(200, response.status_code)
         assert Subscription.objects.get(user=user)  # TODO check for output
 
+    def test_duplicate_subscribe_returns_bad_request(self):
+        post_params = {'email_field': 'dummy@example.com'}
+        self.app.post_json(self.newsletter_subscribe_url, params=post_params)
+        response = self.app.post_json(self.newsletter_subscribe_url, params=post_params, expect_errors=True)
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(1, Subscription.objects.filter(newsletter=self.newsletter).count())
+
+    def test_subscribe_normalizes_email(self):
+        self.app.post_json(self.newsletter_subscribe_url, params={'email_field': 'Bob@EXAMPLE.com'})
+        response = self.app.post_json(self.newsletter_subscribe_url, params={'email_field': 'Bob@example.com'},
+                                      expect_errors=True)
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(['Bob@example.com'], list(Subscription.objects.values_list('email_field', flat=True)))
+
     def test_user_cant_subscribe_adding_custom_email(self):
         # subscribe first
         # todo move to unit tests
@@ -89,16 +106,112 @@ class TestNewsletterViewSet(EmailsMixin, WebTestCase):
         self.assertEqual(200, response.status_code)
         self.assertFalse(subscription.is_active)
 
+    def test_user_cant_unsubscribe_another_address(self):
+        user = self.user_1
+        self.app.post_json(self.newsletter_subscribe_url, user=user)
+        subscription = Subscription.objects.get(newsletter=self.newsletter, user=user)
+        self.app.get(subscription.subscribe_verification_url())
+        response = self.app.get(self.get_newsletter_unsubscribe_url(email='other@example.com'), user=user,
+                                expect_errors=True)
+
+        subscription.refresh_from_db()
+        self.assertEqual(404, response.status_code)
+        self.assertTrue(subscription.is_active)
+
     def test_anonym_can_unsubscribe(self):
+        """Anonymous subscribers unsubscribe through the signed link sent to them, not by address"""
         post_params = {'email_field': 'dummy@example.com'}
         self.app.post_json(self.newsletter_subscribe_url, params=post_params)
         subscription = Subscription.objects.get(newsletter=self.newsletter, **post_params)
         self.app.get(subscription.subscribe_verification_url())  # verify
-        response = self.app.get(self.get_newsletter_unsubscribe_url(email=post_params['email_field']))
+        response = self.app.get(self.get_newsletter_unsubscribe_url(email=post_params['email_field']),
+                                expect_errors=True)
+
+        subscription.refresh_from_db()
+        self.assertEqual(403, response.status_code)
+        self.assertTrue(subscription.is_active)
+
+        response = self.app.get(subscription.unsubscribe_url())
+
+        subscription.refresh_from_db()
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(subscription.is_active)
+
+    def test_legacy_verification_token(self):
+        subscription = Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
+        url = reverse('api:newsletter-verification', kwargs={
+            'slug': self.newsletter.slug, 'token': subscription.verification_token
+        })
+        response = self.app.get(url)
+
+        subscription.refresh_from_db()
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(subscription.is_active)
+
+    def test_expired_verification_token(self):
+        subscription = Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com',
+                                                   create_date=now() - timedelta(days=365))
+        response = self.app.get(subscription.subscribe_verification_url(), expect_errors=True)
+
+        subscription.refresh_from_db()
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(subscription.is_active)
+
+    def test_tampered_verification_token(self):
+        subscription = Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
+        other = Subscription.objects.create(newsletter=self.newsletter, email_field='other@example.com')
+        token = subscription.get_verification_token().replace('%d:' % subscription.pk, '%d:' % other.pk, 1)
+        url = reverse('api:newsletter-verification', kwargs={'slug': self.newsletter.slug, 'token': token})
+        response = self.app.get(url, expect_errors=True)
+
+        other.refresh_from_db()
+        self.assertEqual(404, response.status_code)
+        self.assertFalse(other.is_active)
+
+    def test_token_of_another_newsletter(self):
+        subscription = Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
+        other = NewsletterFactory()
+        for name, token in (('verification', subscription.get_verification_token()),
+                            ('unsubscribe-token', subscription.get_unsubscribe_token())):
+            for slug in (other.slug, 'does-not-exist'):
+                url = reverse('api:newsletter-%s' % name, kwargs={'slug': slug, 'token': token})
+                self.assertEqual(404, self.app.get(url, expect_errors=True).status_code)
+
+        subscription.refresh_from_db()
+        self.assertFalse(subscription.is_active)
+
+    def test_unsubscribe_with_token(self):
+        subscription = Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
+        self.app.get(subscription.subscribe_verification_url())  # verify
+        response = self.app.get(subscription.unsubscribe_url())
 
         subscription.refresh_from_db()
         self.assertEqual(200, response.status_code)
         self.assertFalse(subscription.is_active)
+        self.assertIsNotNone(subscription.verification_date)
+        self.newsletter.refresh_from_db()
+        self.assertEqual((0, 0, 1), (
+            self.newsletter.active_count, self.newsletter.pending_count, self.newsletter.unsubscribed_count
+        ))
+        self.assertEqual(200, self.app.get(subscription.unsubscribe_url()).status_code)  # unsubscribed already
+
+    def test_newsletter_shows_subscriber_counts(self):
+        Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
+        self.app.get(reverse('api:newsletter-detail', kwargs={'slug': self.newsletter.slug}))  # cached now
+        Subscription.objects.create(newsletter=self.newsletter, email_field='other@example.com')
+
+        response = self.app.get(reverse('api:newsletter-detail', kwargs={'slug': self.newsletter.slug}))
+        self.assertEqual((0, 2, 0), (
+            response.json['active_count'], response.json['pending_count'], response.json['unsubscribed_count']
+        ))
+
+    def test_unsubscribe_rejects_verification_token(self):
+        """Tokens are bound to their action"""
+        subscription = Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
+        url = reverse('api:newsletter-unsubscribe-token', kwargs={
+            'slug': self.newsletter.slug, 'token': subscription.get_verification_token()
+        })
+        self.assertEqual(404, self.app.get(url, expect_errors=True).status_code)
 
     def test_user_cant_unsubscribe_unverified_subscription(self):
         """
@@ -0,0 +1,136 @@
+import csv
+import io
+import json
+
+from django.test import override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+
+from newzila.newsletter.models import Subscription
+from newzila.newsletter.tests.factories import NewsletterFactory
+from newzila.testcases import WebTestCase
+from newzila.users.tests.factories import UserFactory
+
+
+class TestSubscriptionListing(WebTestCase):
+    is_staff = True
+
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+        self.url = reverse('api:newsletter-subscriptions', kwargs={'slug': self.newsletter.slug})
+        for i in range(5):
+            Subscription.objects.create(newsletter=self.newsletter, email_field='reader-%d@example.com' % i)
+        Subscription.objects.create(newsletter=self.newsletter, user=UserFactory(name='Subscribed User'))
+        Subscription.objects.create(newsletter=NewsletterFactory(), email_field='other@example.com')
+        Subscription.objects.filter(email_field='reader-1@example.com').update(is_active=True, verification_date=now())
+        Subscription.objects.filter(email_field='reader-2@example.com').update(verification_date=now())
+
+    def emails(self, **params):
+        emails, url = [], self.url
+        while url:
+            response = self.get(url, params=params)
+            params = {}  # part of the next link
+            emails.extend(result['email'] for result in response.json['results'])
+            url = response.json['next']
+        return emails
+
+    def test_pages_through_subscriptions_in_order(self):
+        subscriptions = Subscription.objects.filter(newsletter=self.newsletter).order_by('id')
+        self.assertEqual([s.email for s in subscriptions], self.emails(page_size=2))
+
+    def test_pages_through_subscriptions_created_at_once(self):
+        # an import batch shares one create_date, more rows than the cursor's offset cap of 1000
+        Subscription.objects.bulk_create(
+            Subscription(newsletter=self.newsletter, email_field='imported-%d@example.com' % i) for i in range(1500)
+        )
+        subscriptions = Subscription.objects.filter(newsletter=self.newsletter)
+        subscriptions.update(create_date=now())
+        expected = list(subscriptions.order_by('id').values_list('pk', flat=True))
+
+        ids, url, params = [], self.url, {'page_size': 500}
+        for _ in range(len(expected) // 500 + 1):
+            response = self.get(url, params=params)
+            params = {}
+            ids.extend(result['id'] for result in response.json['results'])
+            url = response.json['next']
+            if url is None:
+                break
+        self.assertIsNone(url)
+        self.assertEqual(expected, ids)
+
+    def test_lists_user_subscriptions(self):
+        response = self.get(self.url)
+        result = response.json['results'][-1]
+        subscription = Subscription.objects.get(newsletter=self.newsletter, user__isnull=False)
+        self.assertEqual(subscription.user.email, result['email'])
+        self.assertEqual(subscription.user.pk, result['user'])
+        self.assertEqual('pending', result['state'])
+
+    def test_filters(self):
+        self.assertEqual(['reader-1@example.com'], self.emails(is_active='true'))
+        self.assertEqual(['reader-1@example.com', 'reader-2@example.com'], self.emails(verified='true'))
+        self.assertEqual(['reader-2@example.com'], self.emails(is_active='false', verified='1'))
+        self.assertEqual(4, len(self.emails(verified='false')))
+        self.get(self.url, params={'verified': 'maybe'}, status=400)
+
+    def test_requires_staff(self):
+        self.get(self.url, user=self.user_1, status=403)
+        self.app.get(self.url, status=403)
+
+
+class TestSubscriberExport(WebTestCase):
+    is_staff = True
+
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+        self.url = reverse('api:newsletter-export', kwargs={'slug': self.newsletter.slug})
+        self.anonymous = Subscription.objects.create(
+            newsletter=self.newsletter, email_field='reader@example.com', name_field='Reader'
+        )
+        self.user_subscription = Subscription.objects.create(
+            newsletter=self.newsletter, user=UserFactory(email='user@example.com', first_name='Ada', last_name='')
+        )
+        Subscription.objects.filter(pk=self.user_subscription.pk).update(is_active=True, verification_date=now())
+        Subscription.objects.create(newsletter=NewsletterFactory(), email_field='other@example.com')
+
+    def test_csv(self):
+        response = self.get(self.url)
+        self.assertEqual('text/csv; charset=utf-8', response.headers['Content-Type'])
+        self.assertEqual('attachment; filename="%s-subscribers.csv"' % self.newsletter.slug,
+                         response.headers['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        self.assertEqual(
+            [(str(self.anonymous.pk), 'reader@example.com', 'Reader', 'False', 'pending', ''),
+             (str(self.user_subscription.pk), 'user@example.com', 'Ada', 'True', 'active', 'verified')],
+            [(row['id'], row['email'], row['name'], row['is_active'], row['state'],
+              'verified' if row['verification_date'] else '') for row in rows]
+        )
+        self.assertEqual(self.anonymous.create_date.isoformat(), rows[0]['create_date'])
+
+    def test_ndjson_with_filters(self):
+        response = self.get(self.url, params={'output': 'ndjson', 'is_active': 'false'})
+        self.assertEqual('application/x-ndjson', response.headers['Content-Type'])
+        lines = response.text.splitlines()
+        self.assertEqual(1, len(lines))
+        self.assertEqual({
+            'id': self.anonymous.pk, 'email': 'reader@example.com', 'name': 'Reader', 'is_active': False,
+            'state': 'pending', 'verification_date': None,
+            'create_date': self.anonymous.create_date.isoformat(),
+        }, json.loads(lines[0]))
+
+    @override_settings(NEWSLETTER_EXPORT_CHUNK_SIZE=1)
+    def test_streams_in_chunks(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(3, len(list(response.streaming_content)))  # header, then a chunk per row
+
+    def test_validation(self):
+        self.get(self.url, params={'output': 'xml'}, status=400)
+        self.get(self.url, params={'verified': 'maybe'}, status=400)
+
+    def test_requires_staff(self):
+        self.get(self.url, user=self.user_1, status=403)
+        self.app.get(self.url, status=403)
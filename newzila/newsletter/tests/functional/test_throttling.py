@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from newzila.newsletter.api.throttling import SubscribeThrottle
+from newzila.newsletter.tests.factories import NewsletterFactory
+from newzila.testcases import WebTestCase
+
+RATES = {'newsletter_subscribe': '2/min', 'newsletter_unsubscribe': '2/min'}
+
+
+@override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': RATES})
+class ThrottlingTest(WebTestCase):
+    is_anonymous = True
+    csrf_checks = False
+
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+        self.url = reverse('api:newsletter-subscribe', kwargs={'slug': self.newsletter.slug})
+
+    def subscribe(self, email, ip='10.0.0.1', status=200):
+        return self.app.post_json(self.url, params={'email_field': email},
+                                  extra_environ={'REMOTE_ADDR': ip}, status=status)
+
+    def test_throttles_ip(self):
+        self.subscribe('reader-1@example.com')
+        self.subscribe('reader-2@example.com')
+        response = self.subscribe('reader-3@example.com', status=429)
+        self.assertEqual('30', response.headers['Retry-After'])  # a token every 30 seconds
+        self.subscribe('reader-3@example.com', ip='10.0.0.2')
+
+    def test_throttles_email(self):
+        self.subscribe('reader@example.com')
+        self.subscribe('reader@example.com', ip='10.0.0.2', status=400)  # already subscribed
+        self.subscribe('Reader@EXAMPLE.com', ip='10.0.0.3', status=429)
+
+    def test_newsletters_have_own_buckets(self):
+        self.subscribe('reader-1@example.com')
+        self.subscribe('reader-2@example.com')
+        self.url = reverse('api:newsletter-subscribe', kwargs={'slug': NewsletterFactory().slug})
+        self.subscribe('reader-3@example.com')
+
+    def test_throttles_unsubscribe(self):
+        url = reverse('api:newsletter-unsubscribe-token', kwargs={'slug': self.newsletter.slug, 'token': 'forged'})
+        self.app.get(url, status=404)
+        self.app.get(url, status=404)
+        self.app.get(url, status=429)
+        self.app.get(url, extra_environ={'REMOTE_ADDR': '10.0.0.2'}, status=404)
+
+    def test_throttles_user_unsubscribe(self):
+        url = reverse('api:newsletter-unsubscribe', kwargs={'slug': self.newsletter.slug, 'email': self.user_1.email})
+        self.app.get(url, user=self.user_1, status=404)
+        self.app.get(url, user=self.user_1, extra_environ={'REMOTE_ADDR': '10.0.0.2'}, status=404)
+        self.app.get(url, user=self.user_1, extra_environ={'REMOTE_ADDR': '10.0.0.3'}, status=429)
+
+    def test_refills(self):
+        throttle = SubscribeThrottle()
+        keys = ['bucket']
+        self.assertEqual(0, throttle.take(keys, 1000))
+        self.assertEqual(0, throttle.take(keys, 1000))
+        self.assertEqual(30, throttle.take(keys, 1000))
+        self.assertEqual(15, throttle.take(keys, 1015))
+        self.assertEqual(0, throttle.take(keys, 1030))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:1/0',
+        'OPTIONS': {'CLIENT_CLASS': 'django_redis.client.DefaultClient', 'IGNORE_EXCEPTIONS': True},
+    }})
+    def test_fails_open(self):
+        request = Request(APIRequestFactory().post('/', {'email_field': 'reader@example.com'}, format='json'),
+                          parsers=[JSONParser()])
+        view = SimpleNamespace(kwargs={'slug': self.newsletter.slug}, lookup_field='slug')
+        with self.assertLogs('newzila.newsletter.api.throttling', 'WARNING'):
+            for _ in range(3):
+                self.assertTrue(SubscribeThrottle().allow_request(request, view))
@@ -0,0 +1,46 @@
+import runpy
+from unittest import mock
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError
+from django.contrib.sites.models import Site
+from django.test import TestCase, override_settings
+
+from newzila.newsletter import rendering
+from newzila.newsletter.cache import get_newsletter
+from newzila.newsletter.models import Newsletter
+from newzila.newsletter.tests.factories import NewsletterFactory
+
+
+@override_settings(NEWSLETTER_WARM_UP_NEWSLETTERS=1)
+class WarmUpTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.quiet = NewsletterFactory()
+        self.hot = NewsletterFactory()
+        Newsletter.update_subscriber_counts(self.hot.pk, active=10)
+        rendering.clear_template_cache()
+        Site.objects.clear_cache()
+
+    def test_warm_up(self):
+        with self.assertLogs('newzila.newsletter.apps', 'INFO'):
+            apps.get_app_config('newsletter').warm_up()
+
+        self.assertIn(self.hot.slug, rendering._template_sets)
+        self.assertNotIn(self.quiet.slug, rendering._template_sets)
+        with self.assertNumQueries(0):
+            Site.objects.get_current()
+            get_newsletter(self.hot.slug)
+
+    def test_warm_up_without_database(self):
+        with self.assertNumQueries(0):
+            apps.get_app_config('newsletter').warm_up(database=False)
+
+    def test_worker_starts_if_warm_up_fails(self):
+        config = runpy.run_path(str(settings.ROOT_DIR.path('gunicorn.conf.py')))
+        worker = mock.Mock()
+        with mock.patch.object(apps.get_app_config('newsletter'), 'warm_up', side_effect=DatabaseError):
+            config['post_worker_init'](worker)
+
+        worker.log.warning.assert_called_once()
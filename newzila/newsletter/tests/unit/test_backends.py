@@ -0,0 +1,103 @@
+import socketserver
+import threading
+from unittest import mock
+
+from django.core.mail import EmailMessage
+from django.test import SimpleTestCase, override_settings
+
+from newzila.newsletter import backends
+from newzila.newsletter.backends import PooledSMTPEmailBackend
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages; every session and command is recorded on the server"""
+
+    def handle(self):
+        self.server.sessions.append([])
+        self.reply('220 sink ready')
+        in_data = False
+        for line in self.rfile:
+            line = line.decode().rstrip('\r\n')
+            if in_data:
+                if line == '.':
+                    in_data = False
+                    self.server.messages += 1
+                    self.reply('250 OK')
+                continue
+            command = line.split(' ', 1)[0].upper()
+            self.server.sessions[-1].append(command)
+            if command == 'EHLO':
+                self.reply('250 sink')
+            elif command == 'DATA':
+                in_data = True
+                self.reply('354 go ahead')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 OK')
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.sessions = []
+        self.messages = 0
+
+
+@override_settings(EMAIL_POOL_SIZE=2, EMAIL_POOL_MAX_MESSAGES=3, EMAIL_POOL_IDLE_TIMEOUT=30)
+class PooledSMTPEmailBackendTest(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sink = SMTPSink()
+        threading.Thread(target=self.sink.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        self.addCleanup(self.sink.server_close)
+        self.addCleanup(self.sink.shutdown)
+        self.addCleanup(backends.close_pools)
+
+    def send(self, count=1):
+        backend = PooledSMTPEmailBackend(host='127.0.0.1', port=self.sink.server_address[1])
+        messages = [EmailMessage('subject', 'body', 'from@example.com', ['to@example.com']) for _ in range(count)]
+        return backend.send_messages(messages)
+
+    def test_reuses_connection(self):
+        self.assertEqual(1, self.send())
+        self.assertEqual(1, self.send())
+        self.assertEqual(2, self.sink.messages)
+        self.assertEqual(1, len(self.sink.sessions))
+        self.assertIn('NOOP', self.sink.sessions[0])  # health check before reuse
+
+    def test_recycles_after_max_messages(self):
+        self.send(3)
+        self.send()
+        self.assertEqual(4, self.sink.messages)
+        self.assertEqual(2, len(self.sink.sessions))
+        self.assertEqual('QUIT', self.sink.sessions[0][-1])
+
+    def test_recycles_idle_connection(self):
+        self.send()
+        with mock.patch.object(backends.time, 'monotonic', return_value=backends.time.monotonic() + 60):
+            self.send()
+        self.assertEqual(2, len(self.sink.sessions))
+
+    def test_reconnects_after_server_disconnect(self):
+        self.send()
+        pool = backends.get_pool(('127.0.0.1', self.sink.server_address[1], '', False, False))
+        idle = pool._idle.get_nowait()
+        idle.smtp.sock.close()  # connection lost while idle
+        pool._idle.put(idle)
+
+        self.assertEqual(1, self.send())
+        self.assertEqual(2, self.sink.messages)
+
+    def test_pools_are_not_shared_with_forked_processes(self):
+        self.send()
+        with mock.patch.object(backends.os, 'getpid', return_value=-1):
+            self.send()
+        self.assertEqual(2, len(self.sink.sessions))
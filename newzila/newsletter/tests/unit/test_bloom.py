@@ -0,0 +1,44 @@
+from django.test import TestCase, override_settings
+
+from newzila.newsletter.bloom import SubscriberFilter
+from newzila.newsletter.models import Subscription
+from newzila.newsletter.tests.factories import NewsletterFactory
+
+
+class SubscriberFilterTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+        Subscription.objects.create(newsletter=self.newsletter, email_field='old@example.com')
+        self.filter = SubscriberFilter(self.newsletter.pk)
+
+    def rebuild(self):
+        self.filter.rebuild(Subscription.objects.filter(
+            newsletter=self.newsletter, user__isnull=True
+        ).values_list('email_field', flat=True))
+
+    def test_not_built_rules_nothing_out(self):
+        self.assertEqual(['new@example.com'], self.filter.maybe_contains(['new@example.com']))
+        self.assertIsNone(self.filter.fill_ratio())
+
+    def test_rules_out_new_emails(self):
+        self.rebuild()
+        new = ['new-%d@example.com' % i for i in range(100)]
+        self.assertEqual(['old@example.com'], self.filter.maybe_contains(['old@example.com'] + new))
+        self.assertEqual(7, self.filter.hashes)
+        self.assertAlmostEqual(7 / self.filter.bits, self.filter.fill_ratio())
+
+    def test_subscriptions_are_added(self):
+        self.rebuild()
+        Subscription.objects.create(newsletter=self.newsletter, email_field='new@example.com')
+        self.assertEqual(['new@example.com'], self.filter.maybe_contains(['new@example.com']))
+        self.assertEqual([], SubscriberFilter(self.newsletter.pk).maybe_contains(['other@example.com']))
+        # other newsletters have their own filters
+        self.assertEqual(['new@example.com'], SubscriberFilter(NewsletterFactory().pk).maybe_contains(
+            ['new@example.com']
+        ))
+
+    @override_settings(NEWSLETTER_SUBSCRIBER_FILTER=False)
+    def test_disabled(self):
+        self.rebuild()
+        self.assertEqual(['new@example.com'], self.filter.maybe_contains(['new@example.com']))
@@ -0,0 +1,80 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from newzila.newsletter.cache import LRUCache, get_newsletter, local_cache
+from newzila.newsletter.models import Newsletter
+from newzila.newsletter.tests.factories import NewsletterFactory
+
+
+class NewsletterCacheTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+
+    def test_cached_after_first_lookup(self):
+        with self.assertNumQueries(1):
+            get_newsletter(self.newsletter.slug)
+        with self.assertNumQueries(0):
+            newsletter = get_newsletter(self.newsletter.slug)
+        self.assertEqual(self.newsletter.pk, newsletter.pk)
+        self.assertEqual(self.newsletter.title, newsletter.title)
+
+    def test_shared_cache_used_after_local_miss(self):
+        get_newsletter(self.newsletter.slug)
+        local_cache.clear()
+        with self.assertNumQueries(0):
+            get_newsletter(self.newsletter.slug)
+
+    def test_unavailable_cache_goes_to_the_database(self):
+        # django-redis with IGNORE_EXCEPTIONS: failing commands return None
+        with mock.patch('newzila.newsletter.cache.cache') as cache, \
+                mock.patch('newzila.newsletter.cache.time.sleep') as sleep:
+            cache.get.return_value = cache.add.return_value = None
+            newsletter = get_newsletter(self.newsletter.slug)
+
+        self.assertEqual(self.newsletter.pk, newsletter.pk)
+        sleep.assert_not_called()
+
+    def test_returns_independent_instances(self):
+        get_newsletter(self.newsletter.slug).title = 'changed'
+        self.assertEqual(self.newsletter.title, get_newsletter(self.newsletter.slug).title)
+
+    def test_invalidated_on_save(self):
+        get_newsletter(self.newsletter.slug)
+        self.newsletter.title = 'New title'
+        self.newsletter.save()
+        self.assertEqual('New title', get_newsletter(self.newsletter.slug).title)
+
+    def test_invalidated_on_rename(self):
+        old_slug = self.newsletter.slug
+        get_newsletter(old_slug)
+        self.newsletter.slug = 'renamed'
+        self.newsletter.save()
+        with self.assertRaises(Newsletter.DoesNotExist):
+            get_newsletter(old_slug)
+
+    def test_invalidated_on_delete(self):
+        get_newsletter(self.newsletter.slug)
+        self.newsletter.delete()
+        with self.assertRaises(Newsletter.DoesNotExist):
+            get_newsletter(self.newsletter.slug)
+
+
+class LRUCacheTest(TestCase):
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(maxsize=2, timeout=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(1, lru.get('a'))
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(3, lru.get('c'))
+
+    def test_expires(self):
+        lru = LRUCache(maxsize=2, timeout=60)
+        with mock.patch('newzila.newsletter.cache.time.monotonic', return_value=0):
+            lru.set('a', 1)
+        with mock.patch('newzila.newsletter.cache.time.monotonic', return_value=61):
+            self.assertIsNone(lru.get('a'))
@@ -0,0 +1,175 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from newzila.newsletter.models import Newsletter, Subscription
+from newzila.newsletter.tests.factories import NewsletterFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def import_subscribers(*args, **options):
+    out = StringIO()
+    call_command('import_subscribers', *args, stdout=out, **options)
+    return out.getvalue()
+
+
+def test_import_csv(tmpdir):
+    newsletter = NewsletterFactory()
+    Subscription.objects.create(newsletter=newsletter, email_field='old@example.com')
+    path = tmpdir.join('subscribers.csv')
+    path.write(
+        "email,name\n"
+        "new@example.com,New\n"
+        "old@example.com,Old\n"
+        "not-an-email,Invalid\n"
+        " new@EXAMPLE.com ,Repeated\n"
+        "other@example.com,\n"
+    )
+    output = import_subscribers(newsletter.slug, str(path), batch_size=2)
+
+    assert "Imported 2 subscribers" in output
+    assert "5 rows read, 2 imported, 2 already subscribed, 1 invalid" in output
+    assert set(Subscription.objects.filter(newsletter=newsletter).values_list('email_field', 'name_field')) == {
+        ('old@example.com', None), ('new@example.com', 'New'), ('other@example.com', None),
+    }
+
+
+def test_import_counts_conflicts_missed_by_the_filter(tmpdir):
+    newsletter = NewsletterFactory()
+    call_command('rebuild_subscriber_filters', newsletter.slug, stdout=StringIO())
+    # bypasses Subscription.save, so the filter doesn't know about it
+    Subscription.objects.bulk_create([Subscription(newsletter=newsletter, email_field='old@example.com')])
+    path = tmpdir.join('subscribers.csv')
+    path.write("email\nold@example.com\nnew@example.com\n")
+
+    output = import_subscribers(newsletter.slug, str(path))
+
+    assert "2 rows read, 1 imported, 1 already subscribed, 0 invalid" in output
+    newsletter.refresh_from_db()
+    assert newsletter.pending_count == 1
+
+
+def test_import_ndjson_active(tmpdir):
+    newsletter = NewsletterFactory()
+    path = tmpdir.join('subscribers.ndjson')
+    path.write("\n".join(json.dumps({'mail': 'user-%d@example.com' % i}) for i in range(3)))
+    import_subscribers(newsletter.slug, str(path), email_column='mail', active=True)
+
+    subscriptions = Subscription.objects.filter(newsletter=newsletter)
+    assert subscriptions.count() == 3
+    assert all(s.is_active and s.verification_date for s in subscriptions)
+    newsletter.refresh_from_db()
+    assert (newsletter.active_count, newsletter.pending_count) == (3, 0)
+
+
+def test_import_resumes_from_checkpoint(tmpdir):
+    newsletter = NewsletterFactory()
+    path = tmpdir.join('subscribers.csv')
+    path.write("email\n" + "".join("user-%d@example.com\n" % i for i in range(5)))
+    checkpoint = tmpdir.join('checkpoint')
+    checkpoint.write('3')
+
+    output = import_subscribers(newsletter.slug, str(path), checkpoint=str(checkpoint))
+
+    assert "Resuming from offset 3" in output
+    assert set(Subscription.objects.values_list('email_field', flat=True)) == {
+        'user-3@example.com', 'user-4@example.com',
+    }
+    assert checkpoint.read() == '5'
+
+
+def test_import_unknown_newsletter(tmpdir):
+    with pytest.raises(CommandError):
+        import_subscribers('missing', str(tmpdir.join('subscribers.csv')))
+
+
+def test_bench_email(tmpdir):
+    path = tmpdir.join('bench.json')
+    call_command('bench_email', count=[1, 5], output=str(path), stdout=StringIO(), stderr=StringIO())
+    results = json.loads(path.read())
+
+    assert [(result['kind'], result['count']) for result in results['results']] == [
+        ('verification', 1), ('verification', 5), ('issue', 1), ('issue', 5),
+    ]
+    for result in results['results']:
+        assert set(result['stages']) == {'templates', 'build', 'serialize', 'send'}
+        assert result['bytes_per_email'] > 0
+
+    err = StringIO()
+    call_command('bench_email', count=[5], kinds=['issue'], compare=str(path), stdout=StringIO(), stderr=err)
+    assert 'issue x 5' in err.getvalue()
+    assert '%' in err.getvalue()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bench_api(tmpdir):
+    path = tmpdir.join('bench.json')
+    # a single client: the in-memory SQLite test database locks whole tables
+    call_command('bench_api', requests=6, concurrency=1, output=str(path), stdout=StringIO(), stderr=StringIO())
+    results = json.loads(path.read())
+
+    assert [result['endpoint'] for result in results['results']] == ['subscribe', 'verify', 'unsubscribe']
+    for result in results['results']:
+        assert result['requests'] == 6
+        assert result['status'] == {'200': 6}
+        assert result['queries_per_request'] > 0
+        assert result['latency_ms']['p50'] <= result['latency_ms']['p99']
+    assert not Newsletter.objects.exists()  # seeded data is removed
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bench_api_over_http(live_server, tmpdir):
+    path = tmpdir.join('results.json')
+    call_command('bench_api', requests=4, concurrency=1, base_url=live_server.url, output=str(path),
+                 stdout=StringIO(), stderr=StringIO())
+
+    results = json.loads(path.read())
+    assert results['meta']['target'] == live_server.url
+    for result in results['results']:
+        assert result['status'] == {'200': 4}
+        assert result['queries_per_request'] is None
+
+
+def test_reconcile_subscriber_counts():
+    newsletter, other = NewsletterFactory(), NewsletterFactory()
+    for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+        Subscription.objects.create(newsletter=newsletter, email_field=email)
+    Subscription.objects.filter(email_field='a@example.com').update(is_active=True)  # bypasses the counts
+    Subscription.objects.filter(email_field='b@example.com').delete()
+
+    out = StringIO()
+    call_command('reconcile_subscriber_counts', dry_run=True, stdout=out)
+    assert "%s: active_count 0 -> 1, pending_count 3 -> 1" % newsletter.slug in out.getvalue()
+    assert "1 newsletter(s) drifted" in out.getvalue()
+    newsletter.refresh_from_db()
+    assert newsletter.pending_count == 3
+
+    out = StringIO()
+    call_command('reconcile_subscriber_counts', stdout=out)
+    assert "1 newsletter(s) repaired" in out.getvalue()
+    newsletter.refresh_from_db()
+    assert (newsletter.active_count, newsletter.pending_count, newsletter.unsubscribed_count) == (1, 1, 0)
+
+    with pytest.raises(CommandError):
+        call_command('reconcile_subscriber_counts', 'missing', other.slug)
+
+
+def test_rebuild_subscriber_filters():
+    newsletter = NewsletterFactory()
+    Subscription.objects.create(newsletter=newsletter, email_field='a@example.com')
+
+    out = StringIO()
+    call_command('rebuild_subscriber_filters', newsletter.slug, stats=True, stdout=out)
+    assert "%s: not built" % newsletter.slug in out.getvalue()
+
+    out = StringIO()
+    call_command('rebuild_subscriber_filters', newsletter.slug, stdout=out)
+    assert "%s: 1 subscribers" % newsletter.slug in out.getvalue()
+    assert "estimated false positive rate 0.0000%" in out.getvalue()
+
+    with pytest.raises(CommandError):
+        call_command('rebuild_subscriber_filters', 'missing')
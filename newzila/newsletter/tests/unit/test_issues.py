@@ -0,0 +1,125 @@
+from collections import Counter
+from io import StringIO
+from unittest import mock
+
+from celery.exceptions import SoftTimeLimitExceeded
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from newzila.newsletter.models import Issue, IssueChunk, Subscription
+from newzila.newsletter.tasks import dispatch_issue, send_issue_chunk
+from newzila.newsletter.tests.factories import NewsletterFactory
+from newzila.testcases import OnCommitMixin
+
+
+@override_settings(NEWSLETTER_ISSUE_CHUNK_SIZE=2)
+class IssueDispatchTest(OnCommitMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+        self.active = [
+            Subscription.objects.create(newsletter=self.newsletter, email_field='active-%d@example.com' % i,
+                                        name_field='Reader %d' % i, is_active=True)
+            for i in range(5)
+        ]
+        Subscription.objects.create(newsletter=self.newsletter, email_field='pending@example.com')
+        Subscription.objects.create(newsletter=NewsletterFactory(), email_field='other@example.com',
+                                    is_active=True)
+        self.issue = Issue.objects.create(
+            newsletter=self.newsletter, subject='{{ issue.newsletter.title }} #1',
+            text='Hello {{ subscription.name }}, unsubscribe: {{ unsubscribe_url }}', html='<p>Hello</p>',
+        )
+
+    def test_sends_to_active_subscribers_in_chunks(self):
+        dispatch_issue.delay(self.issue.pk)
+
+        self.assertEqual(
+            sorted(s.email for s in self.active), sorted(message.to[0] for message in mail.outbox)
+        )
+        self.assertEqual(3, self.issue.chunks.count())
+        self.assertFalse(self.issue.chunks.exclude(status=IssueChunk.SENT).exists())
+        self.issue.refresh_from_db()
+        self.assertEqual(Issue.SENT, self.issue.status)
+        self.assertIsNotNone(self.issue.sent_date)
+
+        message = mail.outbox[0]
+        self.assertEqual('%s #1' % self.newsletter.title, message.subject)
+        self.assertIn('Hello Reader', message.body)
+        self.assertIn('/unsubscribe/token/', message.extra_headers['List-Unsubscribe'])
+        self.assertEqual(('<p>Hello</p>', 'text/html'), message.alternatives[0])
+
+    def test_sent_issue_is_not_sent_again(self):
+        dispatch_issue.delay(self.issue.pk)
+        mail.outbox = []
+        dispatch_issue.delay(self.issue.pk)
+        self.assertEqual([], mail.outbox)
+
+    def test_resumes_interrupted_issue(self):
+        """A chunk interrupted after its first recipient only sends to the rest"""
+        first, second = self.active[:2]
+        chunk = IssueChunk.objects.create(
+            issue=self.issue, first_id=first.pk, last_id=second.pk, last_sent_id=first.pk, sent_count=1
+        )
+        Issue.objects.filter(pk=self.issue.pk).update(status=Issue.SENDING, dispatch_cursor=second.pk)
+
+        dispatch_issue.delay(self.issue.pk)
+
+        self.assertEqual(
+            sorted(s.email for s in self.active[1:]), sorted(message.to[0] for message in mail.outbox)
+        )
+        chunk.refresh_from_db()
+        self.assertEqual((IssueChunk.SENT, 2), (chunk.status, chunk.sent_count))
+
+    def test_claimed_chunk_is_not_sent_twice(self):
+        chunk = IssueChunk.objects.create(issue=self.issue, first_id=self.active[0].pk,
+                                          last_id=self.active[-1].pk, status=IssueChunk.SENT)
+        send_issue_chunk.delay(chunk.pk)
+        self.assertEqual([], mail.outbox)
+
+    def assertSentOnce(self):
+        self.assertEqual(Counter(s.email for s in self.active), Counter(message.to[0] for message in mail.outbox))
+        self.issue.refresh_from_db()
+        self.assertEqual(Issue.SENT, self.issue.status)
+
+    def test_overlapping_dispatches_send_once(self):
+        """A second run starting while the first is dispatching: whichever moves the cursor first goes on"""
+        enqueued = []
+
+        def delay(chunk_id):
+            enqueued.append(chunk_id)
+            if len(enqueued) == 1:  # right after the first run's first chunk
+                dispatch_issue(self.issue.pk)
+
+        with mock.patch.object(send_issue_chunk, 'delay', side_effect=delay):
+            dispatch_issue(self.issue.pk)
+        for chunk_id in enqueued:
+            send_issue_chunk(chunk_id)
+
+        self.assertEqual(3, self.issue.chunks.count())
+        self.assertSentOnce()
+
+    def test_soft_time_limit_hands_over(self):
+        enqueued = []
+
+        def delay(chunk_id):
+            enqueued.append(chunk_id)
+            if len(enqueued) == 2:
+                raise SoftTimeLimitExceeded()
+            send_issue_chunk(chunk_id)
+
+        with mock.patch.object(send_issue_chunk, 'delay', side_effect=delay):
+            dispatch_issue.delay(self.issue.pk)
+
+        self.assertEqual(3, self.issue.chunks.count())
+        self.assertSentOnce()
+
+    def test_send_issue_command_refuses_an_issue_being_sent(self):
+        Issue.objects.filter(pk=self.issue.pk).update(status=Issue.SENDING)
+        with self.assertRaises(CommandError):
+            call_command('send_issue', self.issue.pk, stdout=StringIO())
+        self.assertEqual([], mail.outbox)
+
+        call_command('send_issue', self.issue.pk, '--resume', stdout=StringIO())
+        self.assertSentOnce()
@@ -0,0 +1,185 @@
+import os
+import runpy
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from config.celery_app import record_task_runtime, record_task_start
+from newzila.newsletter.models import Subscription
+from newzila.newsletter.tests.factories import NewsletterFactory
+from newzila.testcases import WebTestCase
+from newzila.utils.metrics import Counter, Histogram, Registry, registry
+
+
+def sample(name, field='', **labels):
+    return registry.collect().get((name, registry.metrics[name].label_values(labels), field), 0)
+
+
+def observations(name, **labels):
+    histogram = registry.metrics[name]
+    return sum(sample(name, field, **labels) for field in histogram.bucket_fields)
+
+
+class RegistryTest(TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.counter = Counter('test_events', "Events", ['kind'], registry=self.registry)
+        self.histogram = Histogram('test_seconds', "Durations", ['kind'], buckets=(.1, 1), registry=self.registry)
+
+    def test_expose(self):
+        self.counter.inc(kind='a "quoted"\nvalue')
+        self.counter.inc(2, kind='b')
+        for value in (.05, .5, .5, 5):
+            self.histogram.observe(value, kind='x')
+
+        self.assertEqual(
+            '# HELP test_events Events\n'
+            '# TYPE test_events counter\n'
+            'test_events_total{kind="a \\"quoted\\"\\nvalue"} 1.0\n'
+            'test_events_total{kind="b"} 2.0\n'
+            '# HELP test_seconds Durations\n'
+            '# TYPE test_seconds histogram\n'
+            'test_seconds_bucket{kind="x",le="0.1"} 1.0\n'
+            'test_seconds_bucket{kind="x",le="1.0"} 3.0\n'
+            'test_seconds_bucket{kind="x",le="+Inf"} 4.0\n'
+            'test_seconds_sum{kind="x"} 6.05\n'
+            'test_seconds_count{kind="x"} 4.0\n',
+            self.registry.expose()
+        )
+
+    def test_threads_are_summed(self):
+        def work():
+            for _ in range(1000):
+                self.counter.inc(kind='a')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(4000, self.registry.collect()[('test_events', ('a',), '')])
+        self.assertEqual([], self.registry._shards)  # folded when their threads ended
+
+    def test_processes_are_summed(self):
+        with self.settings(METRICS_MULTIPROCESS_DIR=self.tmpdir()):
+            other = Registry()
+            Counter('test_events', "Events", ['kind'], registry=other).inc(3, kind='a')
+            other.flush()
+            self.counter.inc(kind='a')
+
+            self.assertIn('test_events_total{kind="a"} 4.0', self.registry.expose())
+            self.counter.inc(kind='a')  # a process' snapshot is replaced, not added to
+            self.assertIn('test_events_total{kind="a"} 5.0', self.registry.expose())
+
+    def test_stopped_processes_are_aggregated(self):
+        directory = self.tmpdir()
+        with self.settings(METRICS_MULTIPROCESS_DIR=directory):
+            for amount in (2, 3):
+                stopped = Registry()
+                Counter('test_events', "Events", ['kind'], registry=stopped).inc(amount, kind='a')
+                stopped.flush()
+                stopped.retire()
+            self.counter.inc(kind='a')
+
+            self.assertIn('test_events_total{kind="a"} 6.0', self.registry.expose())
+            snapshots = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+            self.assertEqual(sorted(['aggregate.json', '%s.json' % self.registry._id]), snapshots)
+
+    def test_flushes_after_interval(self):
+        with self.settings(METRICS_MULTIPROCESS_DIR=self.tmpdir(), METRICS_FLUSH_INTERVAL=60):
+            self.counter.inc(kind='a')
+            self.registry.maybe_flush()
+            self.assertEqual({}, Registry().collect_all())
+            self.registry._last_flush = time.monotonic() - 60
+            self.registry.maybe_flush()
+            self.assertEqual(1, Registry().collect_all()[('test_events', ('a',), '')])
+
+    def test_clear_directory(self):
+        directory = os.path.join(self.tmpdir(), 'metrics')
+        with self.settings(METRICS_MULTIPROCESS_DIR=directory):
+            self.registry.clear_directory()  # created
+            self.counter.inc(kind='a')
+            self.registry.retire()
+            self.assertEqual(1, Registry().collect_all()[('test_events', ('a',), '')])
+
+            gunicorn_config = runpy.run_path(str(settings.ROOT_DIR.path('gunicorn.conf.py')))
+            gunicorn_config['on_starting'](mock.Mock())  # a new deployment
+            self.assertEqual({}, Registry().collect_all())
+
+    def test_labels_are_required(self):
+        with self.assertRaises(ValueError):
+            self.counter.inc()
+
+    def tmpdir(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return directory.name
+
+
+class MetricsTest(WebTestCase):
+    is_anonymous = True
+    csrf_checks = False
+
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+
+    def test_endpoint(self):
+        self.app.get(reverse('api:newsletter-detail', kwargs={'slug': self.newsletter.slug}))
+        response = self.app.get('/metrics')
+
+        self.assertEqual('text/plain; version=0.0.4; charset=utf-8', response.headers['Content-Type'])
+        self.assertIn(
+            'newzila_http_request_duration_seconds_count{view="api:newsletter-detail",method="GET",status="200"}',
+            response.text
+        )
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_endpoint_token(self):
+        self.app.get('/metrics', status=401)
+        self.app.get('/metrics', headers={'Authorization': 'Bearer secret'}, status=200)
+
+    def test_subscription_outcomes(self):
+        url = reverse('api:newsletter-subscribe', kwargs={'slug': self.newsletter.slug})
+        success = sample('newzila_newsletter_subscription_outcomes', action='subscribe', outcome='success')
+        rejected = sample('newzila_newsletter_subscription_outcomes', action='subscribe', outcome='rejected')
+
+        self.app.post_json(url, params={'email_field': 'reader@example.com'})
+        self.app.post_json(url, params={'email_field': 'reader@example.com'}, status=400)
+
+        self.assertEqual(success + 1, sample(
+            'newzila_newsletter_subscription_outcomes', action='subscribe', outcome='success'
+        ))
+        self.assertEqual(rejected + 1, sample(
+            'newzila_newsletter_subscription_outcomes', action='subscribe', outcome='rejected'
+        ))
+
+    def test_email_metrics(self):
+        sent = sample('newzila_emails_sent', kind='verification')
+        rendered = sample('newzila_email_render_seconds', 'sum', kind='verification')
+
+        subscription = Subscription.objects.create(newsletter=self.newsletter, email_field='reader@example.com')
+        subscription.send_verification_email()
+
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual(sent + 1, sample('newzila_emails_sent', kind='verification'))
+        self.assertGreater(sample('newzila_email_render_seconds', 'sum', kind='verification'), rendered)
+
+    def test_celery_task_metrics(self):
+        task = SimpleNamespace(name='test.task', request=SimpleNamespace(
+            get={'published_at': time.time() - 2}.get, eta=None,
+        ))
+        waited = sample('newzila_celery_task_queue_wait_seconds', 'sum', task='test.task')
+
+        record_task_start(task_id='1', task=task)
+        record_task_runtime(task_id='1', task=task, state='SUCCESS')
+
+        self.assertGreaterEqual(sample('newzila_celery_task_queue_wait_seconds', 'sum', task='test.task'), waited + 2)
+        self.assertEqual(1, observations('newzila_celery_task_runtime_seconds', task='test.task', state='SUCCESS'))
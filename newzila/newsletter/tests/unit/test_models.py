@@ -33,6 +33,24 @@ class SubscriptionModelTest(TestCase):
         with self.assertRaises(Exception):
             Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
 
+    def test_duplicate_subscription_raises_validation_error(self):
+        """The unique constraints reject duplicates of both anonymous and user subscriptions"""
+        Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
+        Subscription.objects.create(newsletter=self.newsletter, user=self.subscriber_1)
+        with self.assertRaisesRegex(APIValidationError, 'Already subscribed!'):
+            Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
+        with self.assertRaisesRegex(APIValidationError, 'Already subscribed!'):
+            Subscription.objects.create(newsletter=self.newsletter, user=self.subscriber_1)
+
+    def test_same_email_can_subscribe_to_other_newsletters(self):
+        Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
+        Subscription.objects.create(newsletter=NewsletterFactory(), email_field='dummy@example.com')
+
+    def test_subscribe_does_not_pre_read(self):
+        """Creating a subscription costs the insert and the count update only (plus their savepoint)"""
+        with self.assertNumQueries(4):  # SAVEPOINT, INSERT, UPDATE newsletter count, RELEASE SAVEPOINT
+            Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
+
     def test_user_cant_subscribe_adding_custom_email(self):
         """We can't add multiple subscription for the same newsletter for the same user/email_field"""
         # subscribe first with user data
@@ -41,3 +59,77 @@ class SubscriptionModelTest(TestCase):
             # subscribe afterwards using custom email
             Subscription.objects.create(newsletter=self.newsletter,
                                         email_field='dummy@example.com', user=self.subscriber_1)
+
+
+class SubscriberCountsTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+
+    def assertCounts(self, active, pending, unsubscribed):
+        self.newsletter.refresh_from_db()
+        self.assertEqual(
+            (active, pending, unsubscribed),
+            (self.newsletter.active_count, self.newsletter.pending_count, self.newsletter.unsubscribed_count)
+        )
+
+    def test_lifecycle(self):
+        subscription = Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
+        Subscription.objects.create(newsletter=self.newsletter, email_field='other@example.com')
+        self.assertCounts(0, 2, 0)
+
+        subscription.subscribe_verify()
+        subscription.subscribe_verify()  # counted once
+        self.assertCounts(1, 1, 0)
+
+        subscription.subscribe_unsubscribe()
+        Subscription.objects.get(pk=subscription.pk).subscribe_unsubscribe()
+        self.assertCounts(0, 1, 1)
+
+        Subscription.verify_by_pk(subscription.pk, self.newsletter.pk)  # an old verification link
+        self.assertCounts(1, 1, 0)
+
+        subscription.refresh_from_db()
+        subscription.delete()
+        self.assertCounts(0, 1, 0)
+
+    def test_state_changes_by_save(self):
+        subscription = Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
+        subscription = Subscription.objects.get(pk=subscription.pk)
+        subscription.is_active = True
+        subscription.save()
+        subscription.name_field = 'Renamed'
+        subscription.save()
+        self.assertCounts(1, 0, 0)
+
+    def test_by_pk_of_other_newsletter(self):
+        subscription = Subscription.objects.create(newsletter=self.newsletter, email_field='dummy@example.com')
+        self.assertFalse(Subscription.verify_by_pk(subscription.pk, NewsletterFactory().pk))
+        self.assertCounts(0, 1, 0)
+
+
+class SubscriptionRecipientTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+        user = UserFactory(email='user@example.com', first_name='Ada', last_name='Lovelace')
+        nameless = UserFactory(email='nameless@example.com', first_name='', last_name='')
+        self.subscriptions = [
+            Subscription.objects.create(newsletter=self.newsletter, user=user),
+            Subscription.objects.create(newsletter=self.newsletter, user=nameless),
+            Subscription.objects.create(newsletter=self.newsletter, email_field='anon@example.com',
+                                        name_field='Anon'),
+            Subscription.objects.create(newsletter=self.newsletter, email_field='nameless-anon@example.com'),
+        ]
+
+    def test_matches_properties(self):
+        with self.assertNumQueries(1):
+            recipients = list(Subscription.objects.with_recipient().order_by('pk').values_list(
+                'recipient_email', 'recipient_name'
+            ))
+        self.assertEqual([(s.email, s.name) for s in self.subscriptions], recipients)
+        self.assertEqual(('user@example.com', 'Ada Lovelace'), recipients[0])
+
+    def test_filter(self):
+        subscription = Subscription.objects.with_recipient().get(recipient_email='user@example.com')
+        self.assertEqual(self.subscriptions[0], subscription)
@@ -0,0 +1,129 @@
+import time
+from datetime import timedelta
+from smtplib import SMTPRecipientsRefused
+
+from celery.exceptions import SoftTimeLimitExceeded
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils.timezone import now
+
+from newzila.newsletter.api.serializers import SubscriptionSerializer
+from newzila.newsletter.models import EmailOutbox, Subscription
+from newzila.newsletter.tasks import drain_email_outbox
+from newzila.newsletter.tests.factories import NewsletterFactory
+
+
+class RefusingBackend(EmailBackend):
+    """Refuses recipients at refused.example.com, hits the soft time limit at slow.example.com"""
+    opened = 0
+
+    def open(self):
+        RefusingBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        for message in messages:
+            if message.to[0].endswith('@refused.example.com'):
+                raise SMTPRecipientsRefused({message.to[0]: (550, b'No such user')})
+            if message.to[0].endswith('@slow.example.com'):
+                raise SoftTimeLimitExceeded()
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='newzila.newsletter.tests.unit.test_outbox.RefusingBackend',
+                   NEWSLETTER_EMAIL_BATCH_SIZE=2, NEWSLETTER_OUTBOX_MAX_ATTEMPTS=2)
+class EmailOutboxTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+        RefusingBackend.opened = 0
+
+    def queue(self, email):
+        subscription = Subscription.objects.create(newsletter=self.newsletter, email_field=email)
+        return EmailOutbox.objects.create(subscription=subscription, kind=EmailOutbox.VERIFICATION)
+
+    def test_drains_in_batches(self):
+        emails = [self.queue('reader-%d@example.com' % i) for i in range(5)]
+
+        self.assertEqual(5, drain_email_outbox())
+
+        self.assertEqual(['reader-%d@example.com' % i for i in range(5)], [m.to[0] for m in mail.outbox])
+        self.assertIn(emails[0].subscription.subscribe_verification_url(), mail.outbox[0].body)
+        self.assertEqual({(EmailOutbox.SENT, 1)}, set(EmailOutbox.objects.values_list('status', 'attempts')))
+        self.assertEqual(0, drain_email_outbox())  # sent once only
+        self.assertEqual(5, len(mail.outbox))
+
+    def test_retries_failures(self):
+        refused = self.queue('reader@refused.example.com')
+        self.queue('reader@example.com')
+
+        drain_email_outbox()
+
+        self.assertEqual(['reader@example.com'], [m.to[0] for m in mail.outbox])
+        refused.refresh_from_db()
+        self.assertEqual((EmailOutbox.PENDING, 1), (refused.status, refused.attempts))
+        self.assertIn('SMTPRecipientsRefused', refused.last_error)
+        self.assertGreater(refused.next_attempt_date, now())
+
+        self.assertEqual(0, drain_email_outbox())  # not due yet
+        EmailOutbox.objects.filter(pk=refused.pk).update(next_attempt_date=now() - timedelta(seconds=1))
+        self.assertEqual(1, drain_email_outbox())
+        refused.refresh_from_db()
+        self.assertEqual((EmailOutbox.FAILED, 2), (refused.status, refused.attempts))
+
+    def test_connects_only_to_send(self):
+        self.assertEqual(0, drain_email_outbox())
+        self.assertEqual(0, RefusingBackend.opened)
+
+        self.queue('reader@example.com')
+        drain_email_outbox()
+        self.assertEqual(1, RefusingBackend.opened)
+
+    def test_soft_time_limit_keeps_what_was_sent(self):
+        sent = self.queue('reader@example.com')
+        slow = self.queue('reader@slow.example.com')
+
+        with self.assertRaises(SoftTimeLimitExceeded):
+            drain_email_outbox()
+
+        self.assertEqual(['reader@example.com'], [m.to[0] for m in mail.outbox])
+        self.assertEqual(EmailOutbox.SENT, EmailOutbox.objects.get(pk=sent.pk).status)
+        self.assertEqual((EmailOutbox.PENDING, 0), EmailOutbox.objects.values_list('status', 'attempts').get(
+            pk=slow.pk
+        ))
+
+    def test_stops_at_deadline(self):
+        self.queue('reader@example.com')
+
+        EmailOutbox.send_batch(get_connection(), 10, deadline=time.monotonic())
+
+        self.assertEqual([], mail.outbox)
+        self.assertEqual((EmailOutbox.PENDING, 0), EmailOutbox.objects.values_list('status', 'attempts').get())
+
+
+class EmailOutboxTransactionTest(TransactionTestCase):
+    def test_rolled_back_subscriptions_send_nothing(self):
+        newsletter = NewsletterFactory()
+        serializer = SubscriptionSerializer(data={'email_field': 'reader@example.com'})
+        serializer.is_valid(raise_exception=True)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                serializer.save(newsletter=newsletter)
+                raise RuntimeError
+
+        self.assertFalse(EmailOutbox.objects.exists())
+        self.assertEqual([], mail.outbox)
+
+    def test_committed_subscriptions_are_sent(self):
+        newsletter = NewsletterFactory()
+        serializer = SubscriptionSerializer(data={'email_field': 'reader@example.com'})
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save(newsletter=newsletter)
+            self.assertEqual([], mail.outbox)
+
+        self.assertEqual(['reader@example.com'], [m.to[0] for m in mail.outbox])
+        self.assertEqual(EmailOutbox.SENT, EmailOutbox.objects.get().status)
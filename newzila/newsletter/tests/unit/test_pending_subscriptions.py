@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
+
+from newzila.newsletter.models import EmailOutbox, Newsletter, Subscription
+from newzila.newsletter.tasks import purge_pending_subscriptions, remind_pending_subscriptions
+from newzila.newsletter.tests.factories import NewsletterFactory
+
+DAY = 24 * 60 * 60
+
+
+@override_settings(NEWSLETTER_PENDING_REMINDER_AFTER=DAY, NEWSLETTER_PENDING_PURGE_AFTER=30 * DAY,
+                   NEWSLETTER_PENDING_BATCH_SIZE=2)
+class PendingSubscriptionTest(TestCase):
+    def setUp(self):
+        self.newsletter = NewsletterFactory()
+
+    def subscribe(self, email, age, **kwargs):
+        return Subscription.objects.create(newsletter=self.newsletter, email_field=email,
+                                           create_date=now() - timedelta(seconds=age), **kwargs)
+
+    def test_pending_batches(self):
+        same_time = now() - timedelta(days=2)
+        subscriptions = [self.subscribe('reader-%d@example.com' % i, 0) for i in range(5)]
+        Subscription.objects.update(create_date=same_time)  # ties are broken by id
+        self.subscribe('active@example.com', 0, is_active=True)
+
+        batches = list(Subscription.objects.pending_batches(2))
+        self.assertEqual([[s.pk for s in subscriptions[i:i + 2]] for i in (0, 2, 4)], batches)
+
+    def test_reminds_once(self):
+        due = [self.subscribe('reader-%d@example.com' % i, 2 * DAY) for i in range(3)]
+        self.subscribe('recent@example.com', DAY // 2)
+        self.subscribe('active@example.com', 2 * DAY, is_active=True, verification_date=now())
+        self.subscribe('expired@example.com', 31 * DAY)
+
+        self.assertEqual(3, remind_pending_subscriptions())
+        self.assertEqual(0, remind_pending_subscriptions())
+
+        reminders = EmailOutbox.objects.filter(kind=EmailOutbox.REMINDER)
+        self.assertEqual({s.pk for s in due}, set(reminders.values_list('subscription_id', flat=True)))
+        self.assertEqual(sorted(s.email_field for s in due), sorted(message.to[0] for message in mail.outbox))
+        self.assertIn(due[0].subscribe_verification_url(), mail.outbox[0].body)
+
+    def test_purges_stale_pending(self):
+        stale = [self.subscribe('reader-%d@example.com' % i, 31 * DAY) for i in range(3)]
+        kept = [
+            self.subscribe('recent@example.com', 2 * DAY),
+            self.subscribe('active@example.com', 31 * DAY, is_active=True, verification_date=now()),
+            self.subscribe('unsubscribed@example.com', 31 * DAY, verification_date=now()),
+        ]
+        EmailOutbox.objects.create(subscription=stale[0], kind=EmailOutbox.REMINDER)
+
+        self.assertEqual(3, purge_pending_subscriptions())
+
+        self.assertEqual({s.pk for s in kept}, set(Subscription.objects.values_list('pk', flat=True)))
+        self.assertFalse(EmailOutbox.objects.exists())
+        newsletter = Newsletter.objects.get(pk=self.newsletter.pk)
+        self.assertEqual((1, 1, 1), (newsletter.pending_count, newsletter.active_count, newsletter.unsubscribed_count))
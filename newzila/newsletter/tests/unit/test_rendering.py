@@ -0,0 +1,133 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.template import engines
+from django.test import TestCase, override_settings
+
+from newzila.newsletter import rendering
+from newzila.newsletter.models import Subscription
+from newzila.newsletter.rendering import MergeRenderer, clear_template_cache
+from newzila.newsletter.tests.factories import NewsletterFactory
+
+
+class TemplateCacheTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+
+    def test_templates_resolved_once_per_newsletter(self):
+        with mock.patch.object(rendering, 'select_template', wraps=rendering.select_template) as select:
+            templates = self.newsletter.get_templates()
+            self.assertEqual(templates, self.newsletter.get_templates())
+        self.assertEqual(3, select.call_count)
+
+    def test_clear_template_cache(self):
+        with mock.patch.object(rendering, 'select_template', wraps=rendering.select_template) as select:
+            self.newsletter.get_templates()
+            clear_template_cache(self.newsletter.slug)
+            self.newsletter.get_templates()
+        self.assertEqual(6, select.call_count)
+
+
+class TemplateCacheReloadTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.newsletter = NewsletterFactory()
+
+    def test_reloads_changed_template_in_debug(self):
+        with tempfile.TemporaryDirectory() as template_dir:
+            path = os.path.join(template_dir, 'newsletter', 'message', self.newsletter.slug)
+            os.makedirs(path)
+            subject_path = os.path.join(path, 'subject.txt')
+            with open(subject_path, 'w') as f:
+                f.write('Old subject')
+
+            templates_setting = [{
+                'BACKEND': 'django.template.backends.django.DjangoTemplates',
+                'DIRS': [template_dir],
+                'APP_DIRS': True,
+            }]
+            with override_settings(DEBUG=True, TEMPLATES=templates_setting):
+                self.assertEqual('Old subject', self.newsletter.get_templates()[0].render({}))
+
+                with open(subject_path, 'w') as f:
+                    f.write('New subject')
+                mtime = os.path.getmtime(subject_path) + 10
+                os.utime(subject_path, (mtime, mtime))
+
+                self.assertEqual('New subject', self.newsletter.get_templates()[0].render({}))
+
+
+class Recipient:
+    def __init__(self, name, email):
+        self.name = name
+        self.email = email
+
+    def url(self):
+        return '/verify/%s/' % self.email
+
+
+class MergeRendererTest(TestCase):
+    recipients = [
+        Recipient('Reader', 'reader@example.com'),
+        Recipient("O'Brien & <Co>", 'obrien@example.com'),
+        Recipient(None, 'none@example.com'),
+        Recipient('', 'empty@example.com'),
+        Recipient('Second Reader', 'second@example.com'),
+        Recipient(None, 'none-2@example.com'),
+        Recipient('', 'empty-2@example.com'),
+        Recipient('Third & Last', 'last@example.com'),
+    ]
+    slots = ['recipient.name', 'recipient.email', 'recipient.url']
+
+    def assert_renders_like_full_render(self, *sources):
+        engine = engines['django']
+        templates = [engine.from_string(source) for source in sources]
+        renderer = MergeRenderer(templates, {'title': 'News & Views'}, self.slots)
+        for recipient in self.recipients:
+            expected = [template.render({'title': 'News & Views', 'recipient': recipient}) for template in templates]
+            self.assertEqual(expected, renderer.render({'recipient': recipient}))
+        return renderer
+
+    def test_plain_slots(self):
+        renderer = self.assert_renders_like_full_render(
+            '{{ title }}: Dear {{ recipient.name }} <{{ recipient.email }}> {{ recipient.url }}',
+            '{% autoescape off %}{{ recipient.name }} / {{ title }}{% endautoescape %}',
+            '{{ recipient.name|safe }}',
+        )
+        self.assertTrue(all(skeletons[0] is not None for skeletons in renderer._skeletons.values()))
+
+    def test_default_filter_and_blocktrans(self):
+        self.assert_renders_like_full_render(
+            '{% load i18n %}{% blocktrans with name=recipient.name|default:"Sir/Madam" %}Dear {{ name }}'
+            '{% endblocktrans %}',
+            '{% if recipient.name %}Hi {{ recipient.name }}{% else %}Hello{% endif %}',
+        )
+
+    def test_transforming_filters_fall_back_to_full_render(self):
+        renderer = self.assert_renders_like_full_render(
+            '{{ recipient.name|upper }}',
+            '{{ recipient.email|length }}',
+            '{{ recipient.name|truncatechars:5 }}',
+            '{{ recipient.missing }}{{ recipient.name }}',
+        )
+        for shape, skeletons in renderer._skeletons.items():
+            self.assertIsNone(skeletons[1])
+            if shape[0] is True:  # the filters only see placeholders for non-empty names
+                self.assertEqual([None, None], [skeletons[0], skeletons[2]])
+
+    def test_newsletter_verification_templates(self):
+        newsletter = NewsletterFactory()
+        renderer = newsletter.get_verification_renderer()
+        for index in range(4):
+            subscription = Subscription.objects.create(
+                newsletter=newsletter, email_field='reader-%d@example.com' % index,
+                name_field=("Reader & %d" % index) if index % 2 else None,
+            )
+            expected = subscription.get_verification_email(newsletter.get_verification_renderer())
+            message = subscription.get_verification_email(renderer)
+            self.assertEqual(expected.subject, message.subject)
+            self.assertEqual(expected.body, message.body)
+            self.assertEqual(expected.alternatives, message.alternatives)
+        self.assertTrue(renderer._skeletons)
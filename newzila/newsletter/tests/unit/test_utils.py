@@ -0,0 +1,39 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from django.core import signing
+
+from newzila.newsletter.utils import (
+    make_subscription_token, normalize_email, read_subscription_token
+)
+
+subscription = SimpleNamespace(pk=12, newsletter_id=3)
+
+
+def test_subscription_token_round_trip():
+    token = make_subscription_token(subscription, 'verify', int(time.time()) + 60)
+    assert read_subscription_token(token, 'verify') == (12, 3)
+
+
+def test_subscription_token_bound_to_action():
+    token = make_subscription_token(subscription, 'verify', int(time.time()) + 60)
+    with pytest.raises(signing.BadSignature):
+        read_subscription_token(token, 'unsubscribe')
+
+
+def test_subscription_token_expires():
+    token = make_subscription_token(subscription, 'verify', int(time.time()) - 1)
+    with pytest.raises(signing.SignatureExpired):
+        read_subscription_token(token, 'verify')
+
+
+def test_legacy_token_is_not_signed():
+    with pytest.raises(signing.BadSignature):
+        read_subscription_token('a' * 40, 'verify')
+
+
+def test_normalize_email():
+    assert normalize_email(' John.Doe@EXAMPLE.Com ') == 'John.Doe@example.com'
+    assert normalize_email('invalid') == 'invalid'
+    assert normalize_email(None) == ''
@@ -1,8 +1,57 @@
 """ Generic helper functions """
+import time
 
+from django.core import signing
 from django.utils.crypto import get_random_string
 
+TOKEN_SALT = 'newzila.newsletter.%s'
+
 
 def make_verification_token():
     """ Generate a unique verification token. """
     return get_random_string(length=40)
+
+
+def normalize_email(email):
+    """ Strip surrounding whitespace and lowercase the domain part of an email address. """
+    email = (email or '').strip()
+    local_part, sep, domain = email.rpartition('@')
+    if not sep:
+        return email
+    return local_part + '@' + domain.lower()
+
+
+def chunked(iterable, size):
+    """ Yield lists of at most `size` items from `iterable`. """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def make_subscription_token(subscription, action, expires):
+    """
+    Sign the subscription (and its newsletter) id for `action`, valid until the `expires` unix timestamp.
+    The token carries everything needed to act on the subscription, no database lookup is required.
+    """
+    value = '%d:%d:%d' % (subscription.pk, subscription.newsletter_id, expires)
+    return signing.Signer(salt=TOKEN_SALT % action).sign(value)
+
+
+def read_subscription_token(token, action):
+    """
+    Returns the (subscription id, newsletter id) pair of a token made by `make_subscription_token`.
+    Raises `signing.BadSignature` for foreign or tampered tokens and `signing.SignatureExpired` once expired.
+    """
+    value = signing.Signer(salt=TOKEN_SALT % action).unsign(token)
+    try:
+        subscription_id, newsletter_id, expires = (int(part) for part in value.split(':'))
+    except ValueError:
+        raise signing.BadSignature('Malformed subscription token')
+    if expires < time.time():
+        raise signing.SignatureExpired('Subscription token expired')
+    return subscription_id, newsletter_id
@@ -1,7 +1,12 @@
+from contextlib import contextmanager
+from unittest import mock
+
 from django.core import mail
 from django.contrib.auth import get_user_model
 from django_webtest import WebTest
 
+from newzila.utils.middleware import QueryRecorder
+
 User = get_user_model()
 
 
@@ -72,3 +77,41 @@ class EmailsMixin:
         assert len(mail.outbox) == 1
         assert mail.outbox[0].to == [email]
         self._test_send_plain_text_and_html(mail.outbox[0])
+
+
+class OnCommitMixin:
+    """
+    Run `transaction.on_commit` callbacks right away.
+
+    TestCase wraps every test in a transaction that is never committed, so callbacks
+    (e.g. enqueued Celery tasks) would otherwise never fire.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('django.db.transaction.on_commit', side_effect=lambda func, using=None: func())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class QueryBudgetMixin:
+    """
+    Assert the number of queries a block of code runs, counting only what runs inside the block.
+    Unlike `assertNumQueries` the budget is an upper bound and duplicated queries fail it as well,
+    so an N+1 regression fails even while the total stays within budget.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, max_duplicates=0):
+        with QueryRecorder() as recorder:
+            yield recorder
+        duplicates = recorder.duplicates
+        queries = '\n'.join('%d. %s' % (i, query.sql) for i, query in enumerate(recorder.queries, 1))
+        self.assertLessEqual(
+            recorder.count, max_queries,
+            '%d queries run, the budget is %d:\n%s' % (recorder.count, max_queries, queries)
+        )
+        self.assertLessEqual(
+            len(duplicates), max_duplicates,
+            'Duplicated queries:\n%s' % '\n'.join('%dx %s' % (count, sql) for sql, count in duplicates)
+        )
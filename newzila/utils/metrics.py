@@ -0,0 +1,315 @@
+"""
+Minimal metrics in the Prometheus text exposition format.
+
+Observations are recorded without locks: every thread writes to its own dict of samples, which are
+only summed when collected. The samples of a thread are folded into the process' when it ends.
+For multi-process servers (gunicorn, Celery prefork) each process writes snapshots of its samples to
+METRICS_MULTIPROCESS_DIR every METRICS_FLUSH_INTERVAL seconds and the `/metrics` view sums the
+snapshots of all processes. An exiting process merges its samples into a single aggregate snapshot,
+so counters don't go back when a worker is recycled and the directory doesn't grow with every worker
+(only killed processes leave their snapshot behind). The server empties it when it starts, see
+`Registry.clear_directory`.
+"""
+import atexit
+import fcntl
+import glob
+import json
+import math
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+AGGREGATE = 'aggregate'  # snapshot of the stopped processes
+
+
+class _ThreadOwner:
+    """Only referenced by the thread local storage, freed when its thread ends"""
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = OrderedDict()
+        # taken when a thread starts or ends and on collection, not to record; reentrant, as a thread
+        # may end in a garbage collection run by a thread holding it
+        self._lock = threading.RLock()
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            # a forked worker starts from zero, its parent reports what happened before the fork
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._local = threading.local()
+        self._shards = []
+        self._ended = defaultdict(float)  # samples of the ended threads
+        self._id = '%d-%s' % (os.getpid(), uuid.uuid4().hex[:8])
+        self._last_flush = time.monotonic()
+        self._retired = False
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError("Metric %s is registered already" % metric.name)
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add(self, key, amount):
+        """Add `amount` to the sample `key`, in the calling thread's samples"""
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._local.shard = defaultdict(float)
+            self._local.owner = _ThreadOwner()
+            weakref.finalize(self._local.owner, self._end_thread, self._id, shard)
+            with self._lock:
+                self._shards.append(shard)
+        shard[key] += amount
+
+    def _end_thread(self, registry_id, shard):
+        """Fold the samples of an ended thread into `_ended`, so threads come and go without a trace"""
+        with self._lock:
+            if registry_id != self._id:  # a thread of the parent process, which reports it
+                return
+            for key, value in shard.items():
+                self._ended[key] += value
+            self._shards.remove(shard)
+
+    def collect(self):
+        """Samples of this process, as {(metric name, label values, field): value}"""
+        with self._lock:  # a thread ending meanwhile would be counted twice or not at all
+            samples = self._ended.copy()
+            for shard in list(self._shards):
+                for key, value in shard.copy().items():  # a single call, safe while the owner writes
+                    samples[key] += value
+        return samples
+
+    def collect_all(self):
+        """Samples of all processes sharing METRICS_MULTIPROCESS_DIR, or of this one without it"""
+        directory = settings.METRICS_MULTIPROCESS_DIR
+        if not directory:
+            return self.collect()
+        self.flush()
+        samples = defaultdict(float)
+        with self._directory_lock(directory, fcntl.LOCK_SH):  # not while a stopped process is merged
+            for path in glob.glob(os.path.join(directory, '*.json')):
+                for key, value in self._read_snapshot(path).items():
+                    samples[key] += value
+        return samples
+
+    def flush(self):
+        """Write the snapshot of this process, atomically replacing the previous one"""
+        directory = settings.METRICS_MULTIPROCESS_DIR
+        self._last_flush = time.monotonic()
+        if not directory or self._retired:
+            return
+        self._write_snapshot(os.path.join(directory, '%s.json' % self._id), self.collect())
+
+    def retire(self):
+        """
+        Merge the samples of this process into the aggregate snapshot and remove its own, when it exits.
+        Samples recorded afterwards are not reported.
+        """
+        directory = settings.METRICS_MULTIPROCESS_DIR
+        if not directory or self._retired:
+            return
+        self._retired = True
+        path = os.path.join(directory, '%s.json' % AGGREGATE)
+        with self._directory_lock(directory, fcntl.LOCK_EX):
+            samples = self._read_snapshot(path)
+            for key, value in self.collect().items():
+                samples[key] += value
+            self._write_snapshot(path, samples)
+            try:
+                os.remove(os.path.join(directory, '%s.json' % self._id))
+            except FileNotFoundError:  # never flushed
+                pass
+
+    def clear_directory(self):
+        """
+        Create METRICS_MULTIPROCESS_DIR, or remove the snapshots left in it by a previous deployment.
+        Run by the gunicorn master when it starts; processes still running write theirs again on their next flush.
+        """
+        directory = settings.METRICS_MULTIPROCESS_DIR
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        with self._directory_lock(directory, fcntl.LOCK_EX):
+            for path in glob.glob(os.path.join(directory, '*.json*')):  # with the temporary files of writes
+                try:
+                    os.remove(path)
+                except FileNotFoundError:  # replaced in the meantime
+                    pass
+
+    @staticmethod
+    @contextmanager
+    def _directory_lock(directory, operation):
+        with open(os.path.join(directory, '.lock'), 'a') as f:
+            fcntl.flock(f, operation)
+            yield
+
+    @staticmethod
+    def _read_snapshot(path):
+        samples = defaultdict(float)
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):  # removed, or replaced in the meantime
+            return samples
+        for name, labels, field, value in snapshot:
+            samples[(name, tuple(labels), field)] += value
+        return samples
+
+    @staticmethod
+    def _write_snapshot(path, samples):
+        snapshot = [[name, labels, field, value] for (name, labels, field), value in samples.items()]
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(path + '.tmp', path)
+
+    def maybe_flush(self):
+        """Flush if the last flush is older than METRICS_FLUSH_INTERVAL; cheap enough to call per request"""
+        if time.monotonic() - self._last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def expose(self):
+        """All metrics in the text exposition format"""
+        samples = defaultdict(dict)
+        for (name, labels, field), value in self.collect_all().items():
+            samples[name][(labels, field)] = value
+        return ''.join(metric.expose(samples[name]) for name, metric in self.metrics.items())
+
+
+registry = Registry()
+
+
+@atexit.register
+def _retire_at_exit():
+    if settings.configured and getattr(settings, 'METRICS_MULTIPROCESS_DIR', None):
+        registry.retire()
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=registry):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        registry.register(self)
+
+    def label_values(self, labels):
+        try:
+            return tuple(str(labels[name]) for name in self.labelnames)
+        except KeyError as e:
+            raise ValueError("Missing label %s of %s" % (e, self.name))
+
+    def expose(self, samples):
+        lines = ['# HELP %s %s\n' % (self.name, self.documentation), '# TYPE %s %s\n' % (self.name, self.type)]
+        lines.extend(self.sample_lines(samples))
+        return ''.join(lines)
+
+    def format_labels(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.add((self.name, self.label_values(labels), ''), amount)
+
+    def sample_lines(self, samples):
+        for (values, field), value in sorted(samples.items()):
+            yield '%s_total%s %s\n' % (self.name, self.format_labels(values), _number(value))
+
+
+class Histogram(Metric):
+    """
+    Observations only increment the bucket they fall in, buckets are made cumulative on exposition
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(name, documentation, labelnames, **kwargs)
+        self.buckets = tuple(float(bucket) for bucket in buckets) + (math.inf,)
+        self.bucket_fields = tuple(_number(bucket) for bucket in self.buckets)
+
+    def observe(self, value, **labels):
+        values = self.label_values(labels)
+        for bucket, field in zip(self.buckets, self.bucket_fields):
+            if value <= bucket:
+                self.registry.add((self.name, values, field), 1)
+                break
+        self.registry.add((self.name, values, 'sum'), value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def sample_lines(self, samples):
+        series = defaultdict(dict)
+        for (values, field), value in samples.items():
+            series[values][field] = value
+        for values, fields in sorted(series.items()):
+            cumulative = 0
+            for field in self.bucket_fields:
+                cumulative += fields.get(field, 0)
+                yield '%s_bucket%s %s\n' % (
+                    self.name, self.format_labels(values, [('le', field)]), _number(cumulative)
+                )
+            yield '%s_sum%s %s\n' % (self.name, self.format_labels(values), _number(fields.get('sum', 0)))
+            yield '%s_count%s %s\n' % (self.name, self.format_labels(values), _number(cumulative))
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+REQUEST_LATENCY = Histogram(
+    'newzila_http_request_duration_seconds', "Duration of HTTP requests by URL name",
+    ['view', 'method', 'status'],
+)
+CELERY_TASK_RUNTIME = Histogram(
+    'newzila_celery_task_runtime_seconds', "Runtime of Celery tasks", ['task', 'state'],
+    buckets=(.01, .05, .1, .5, 1, 5, 10, 30, 60, 120, 300),
+)
+CELERY_TASK_QUEUE_WAIT = Histogram(
+    'newzila_celery_task_queue_wait_seconds', "Time Celery tasks waited in the queue", ['task'],
+    buckets=(.01, .05, .1, .5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+
+
+def metrics_view(request):
+    """
+    Metrics of all processes in the text exposition format.
+    With METRICS_TOKEN set, requests need an `Authorization: Bearer <METRICS_TOKEN>` header; it is
+    required in production.
+    """
+    if settings.METRICS_TOKEN and not constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer %s' % settings.METRICS_TOKEN
+    ):
+        return HttpResponse(status=401)
+    return HttpResponse(registry.expose(), content_type=CONTENT_TYPE)
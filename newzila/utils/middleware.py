@@ -0,0 +1,124 @@
+import logging
+import time
+from collections import Counter, namedtuple
+from contextlib import ExitStack
+
+from django.db import connections
+
+from .metrics import REQUEST_LATENCY, registry
+
+logger = logging.getLogger(__name__)
+
+RecordedQuery = namedtuple('RecordedQuery', ['alias', 'sql', 'duration'])
+
+
+class QueryRecorder:
+    """
+    Records the queries run in the current thread on every database connection, DEBUG or not.
+
+    Queries are compared by their SQL with placeholders, so `duplicates` shows the same query
+    run repeatedly with different parameters too, the usual sign of an N+1 problem.
+    Savepoint statements are left out: how many run depends on the transactions around the code
+    (e.g. ATOMIC_REQUESTS, or a test case), not on the code itself.
+    """
+    IGNORED = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith(self.IGNORED):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(RecordedQuery(context['connection'].alias, sql, time.perf_counter() - start))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        """Total database time in seconds"""
+        return sum(query.duration for query in self.queries)
+
+    @property
+    def duplicates(self):
+        """SQL run more than once, with the number of times it ran"""
+        counts = Counter((query.alias, query.sql) for query in self.queries)
+        return [(sql, count) for (alias, sql), count in counts.items() if count > 1]
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Reports the query count, database time and duplicate queries of every request in a `Server-Timing`
+    header and a log record. Opt-in, see the DJANGO_QUERY_INSTRUMENTATION setting.
+
+    Put it first, so queries of other middleware are counted too. Queries run while a streaming
+    response is consumed happen after it returned and are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        duplicates = recorder.duplicates
+        timing = 'db;dur=%.3f;desc="%d queries, %d duplicated"' % (
+            recorder.duration * 1000, recorder.count, len(duplicates)
+        )
+        response['Server-Timing'] = ', '.join(filter(None, [response.get('Server-Timing'), timing]))
+
+        logger.log(
+            logging.WARNING if duplicates else logging.INFO,
+            "%s %s %s queries=%d db_ms=%.3f duplicated=%d",
+            request.method, request.path, response.status_code,
+            recorder.count, recorder.duration * 1000, len(duplicates),
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'query_count': recorder.count,
+                'db_time_ms': round(recorder.duration * 1000, 3),
+                'duplicate_queries': [{'sql': sql, 'count': count} for sql, count in duplicates],
+            },
+        )
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Observes the duration of every request by URL name, see `metrics.REQUEST_LATENCY`.
+    Put it first, so the other middleware is timed too.
+    """
+    METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - start,
+            view=match.view_name if match else '<unresolved>',
+            method=request.method if request.method in self.METHODS else 'other',  # bounded label values
+            status=response.status_code,
+        )
+        registry.maybe_flush()
+        return response
@@ -0,0 +1,40 @@
+"""
+The Swagger/OpenAPI schema view, generating the schema once per process instead of on every request.
+
+Generating it introspects every viewset and serializer. Which endpoints it lists depends on the
+permissions of the user, so a schema is kept per audience: anonymous, authenticated and staff users.
+Schemas live in memory, a deploy starts new processes which generate them again. The machine readable
+formats get an ETag, a hash of the schema, so clients revalidate them with a 304 until it changes.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers, quote_etag
+from rest_framework.response import Response
+from rest_framework_swagger.renderers import OpenAPICodec
+from rest_framework_swagger.views import get_swagger_view
+
+
+def get_cached_swagger_view(title=None):
+    class CachedSwaggerSchemaView(get_swagger_view(title=title).view_class):
+        schemas = {}  # audience: (schema, ETag)
+
+        def get_audience(self, request):
+            user = request.user
+            return 'staff' if user.is_staff else 'user' if user.is_authenticated else 'anonymous'
+
+        def get(self, request):
+            audience = self.get_audience(request)
+            if audience not in self.schemas:
+                schema = super().get(request).data
+                etag = quote_etag(hashlib.sha1(OpenAPICodec().encode(schema)).hexdigest())
+                self.schemas[audience] = schema, etag
+            schema, etag = self.schemas[audience]
+
+            if request.accepted_renderer.format == 'swagger':  # the HTML UI, with the user and a CSRF token
+                return Response(schema)
+            response = get_conditional_response(request, etag=etag) or Response(schema)
+            response['ETag'] = etag
+            patch_vary_headers(response, ['Authorization'])
+            return response
+
+    return CachedSwaggerSchemaView.as_view()